@@ -0,0 +1,71 @@
+"""Benchmark the loading of the configurations at the startup of the CLIs.
+
+Every configuration is loaded in a fresh interpreter, once composed by Hydra with the
+config cache disabled and once from the snapshot of the cache, and the time of the
+import and the loading is reported.
+
+    python -m benchmarks.config_startup --repeat 3
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import click
+
+LOADERS = {
+    "training": "from training.config import get_training_config as load",
+    "pipeline": "from pipeline.config import get_config as load",
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{loader}
+load()
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "hydra_loaded": "hydra" in sys.modules}}))
+"""
+
+
+def measure_load(config: str, cache_dir: str, repeat: int = 1) -> dict:
+    """Load a configuration in fresh interpreters, the fastest of the repetitions"""
+    env = {**os.environ, "CONFIG_CACHE_DIR": cache_dir}
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(loader=LOADERS[config])],
+            check=True,
+            capture_output=True,
+            text=True,
+            env=env,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result["seconds"])
+
+
+@click.command()
+@click.option("--repeat", type=int, default=3, help="Loads per configuration")
+def cli(repeat: int):
+    """Compare loading the configurations with and without the config cache"""
+    results = []
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for config in LOADERS:
+            uncached = measure_load(config, cache_dir="", repeat=repeat)
+            # The first load creates the snapshot, the measured ones load it
+            measure_load(config, cache_dir=cache_dir)
+            cached = measure_load(config, cache_dir=cache_dir, repeat=repeat)
+            results.append(
+                {
+                    "config": config,
+                    "uncached_seconds": uncached["seconds"],
+                    "cached_seconds": cached["seconds"],
+                    "cached_hydra_loaded": cached["hydra_loaded"],
+                }
+            )
+    click.echo(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
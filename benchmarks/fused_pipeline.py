@@ -0,0 +1,87 @@
+"""Benchmark the fused data+train step against the separate pipeline steps.
+
+Runs the training pipeline with the local runner on synthetic FMNIST-shaped data,
+once with separate preprocessing and training steps and once with the fused step, see
+`training.fused`. Each step runs in its own interpreter like a pipeline component, so
+the times include the startup of the steps and the staging of the processed data
+between them. The seconds of the data and training steps, of the whole run and the
+speedup of the fused mode are printed as JSON:
+
+    python -m benchmarks.fused_pipeline --scale 0.1
+"""
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+import click
+
+from benchmarks.pipeline_stages import write_synthetic_idx
+from pipeline.local_runner import LocalRunner, make_training_steps
+
+DATA_TRAIN_STEPS = ("pull-data", "preprocess-data", "training")
+
+
+def run_mode(work_dir: Path, input_data: Path, fuse_data_train: bool) -> dict:
+    """Run the pipeline without registration, returns the seconds of its steps"""
+    steps = make_training_steps(
+        experiment="benchmark",
+        mlflow_tracking_uri=f"file:{work_dir / 'mlruns'}",
+        mlflow_s3_endpoint_url="",
+        model_registry_name="benchmark",
+        register_model=False,
+        input_data=str(input_data),
+        fuse_data_train=fuse_data_train,
+    )
+    start = time.perf_counter()
+    results = LocalRunner(work_dir / "run").run(steps)
+    total = time.perf_counter() - start
+    failed = [r.name for r in results if r.status not in ("succeeded", "skipped")]
+    if failed:
+        raise click.ClickException(f"Steps {failed} failed, see {work_dir / 'run'}")
+    return {
+        "steps": {r.name: r.seconds for r in results if r.status == "succeeded"},
+        "data_train_seconds": sum(
+            r.seconds for r in results if r.name in DATA_TRAIN_STEPS
+        ),
+        "total_seconds": total,
+    }
+
+
+@click.command()
+@click.option(
+    "--scale",
+    type=click.FloatRange(min=0, min_open=True),
+    default=0.1,
+    help="Size of the synthetic data as a multiple of Fashion-MNIST",
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Folder for the data and the runs, a temporary folder if unset",
+)
+def cli(scale: float, work_dir: Optional[str]):
+    """Compare the separate and the fused data and training steps"""
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        root = Path(tmp_dir)
+        samples = write_synthetic_idx(root / "raw", scale=scale)
+        modes = {
+            name: run_mode(root / name, root / "raw", fuse_data_train=fused)
+            for name, fused in (("separate", False), ("fused", True))
+        }
+    separate, fused = modes["separate"], modes["fused"]
+    results = {
+        "scale": scale,
+        "samples": samples,
+        "modes": modes,
+        "data_train_speedup": separate["data_train_seconds"]
+        / fused["data_train_seconds"],
+        "total_speedup": separate["total_seconds"] / fused["total_seconds"],
+    }
+    click.echo(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,65 @@
+"""Benchmark the import time of the CLI entry points.
+
+Every entry point is imported in a fresh interpreter, which reports the import time and
+which of the heavy dependencies were loaded by the import.
+
+    python -m benchmarks.import_time
+"""
+import json
+import subprocess
+import sys
+from typing import List
+
+import click
+
+ENTRY_POINTS = (
+    "training.pull_data",
+    "training.preprocess_data",
+    "training.train",
+    "training.evaluate",
+    "training.register",
+    "pipeline.compile",
+    "pipeline.submit",
+)
+
+HEAVY_MODULES = ("tensorflow", "keras", "mlflow", "kfp")
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "module": "{module}",
+    "seconds": seconds,
+    "max_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    "heavy_modules": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure_import(module: str, repeat: int = 1) -> dict:
+    """Import a module in fresh interpreters, the fastest of the repetitions"""
+    results = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result["seconds"])
+
+
+@click.command()
+@click.option("--repeat", type=int, default=3, help="Imports per entry point")
+@click.argument("modules", nargs=-1)
+def cli(repeat: int, modules: List[str]):
+    """Measure the import time of the given modules, all entry points by default"""
+    results = [measure_import(module, repeat) for module in modules or ENTRY_POINTS]
+    click.echo(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,102 @@
+"""Benchmark the training throughput of the input pipeline modes on CPU.
+
+Trains the baseline model on synthetic FMNIST-shaped data, feeding it from NumPy
+arrays, through the tf.data pipeline and streamed from memory-mapped npy shards, and
+reports the samples per second.
+
+    python -m benchmarks.input_pipeline --samples 60000 --epochs 2
+"""
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import click
+import numpy as np
+
+from training.model import get_model, train_model
+from training.streaming import load_sharded_dataset
+from training.utils import ShardedNpyWriter, write_processed_data_manifest
+
+MODES = ("numpy", "tf_data", "streaming")
+
+
+def synthetic_data(samples: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        "x": rng.integers(0, 256, size=(samples, 28, 28), dtype=np.uint8),
+        "y": rng.integers(0, 10, size=(samples, 1), dtype=np.uint8),
+    }
+
+
+def write_shards(data: dict, output_dir: Path, shard_size: int = 10000) -> None:
+    writer = ShardedNpyWriter(output_dir, "train", len(data["x"]), shard_size)
+    writer.write(data)
+    write_processed_data_manifest({"train": writer.close()}, output_dir)
+
+
+def benchmark_mode(
+    mode: str, data: dict, epochs: int, batch_size: int, steps_per_execution: int
+) -> dict:
+    params = {
+        "epochs": epochs,
+        "batch_size": batch_size,
+        "validation_split": 0.2,
+        "steps_per_execution": steps_per_execution,
+        "input_pipeline": {
+            "mode": mode,
+            "shuffle_buffer_size": 10000,
+            "cache": True,
+            "prefetch": True,
+        },
+    }
+    model = get_model("baseline", {"num_layers": 5}, training_parameters=params)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        train_data = data
+        if mode == "streaming":
+            # Train from memory-mapped shards on disk instead of the in-memory arrays
+            write_shards(data, Path(tmp_dir))
+            train_data = load_sharded_dataset(Path(tmp_dir))
+
+        start = time.perf_counter()
+        train_model(model=model, train_data=train_data, params=params)
+        seconds = time.perf_counter() - start
+
+    samples = len(data["x"]) * epochs
+    return {
+        "mode": mode,
+        "steps_per_execution": steps_per_execution,
+        "seconds": seconds,
+        "samples_per_second": samples / seconds,
+    }
+
+
+@click.command()
+@click.option("--samples", type=int, default=60000, help="Number of samples")
+@click.option("--epochs", type=int, default=2, help="Number of epochs per mode")
+@click.option("--batch-size", type=int, default=32, help="Batch size")
+@click.option(
+    "--steps-per-execution",
+    type=int,
+    default=1,
+    help="Batches per tf.function call for the tf.data mode",
+)
+def cli(samples: int, epochs: int, batch_size: int, steps_per_execution: int):
+    """Compare the training throughput of the input pipeline modes"""
+    data = synthetic_data(samples)
+    results = [
+        benchmark_mode(
+            mode,
+            data,
+            epochs=epochs,
+            batch_size=batch_size,
+            steps_per_execution=1 if mode == "numpy" else steps_per_execution,
+        )
+        for mode in MODES
+    ]
+    click.echo(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,58 @@
+"""Benchmark the per-call overhead of the application logger.
+
+Logs the same event repeatedly to /dev/null with different logging configurations and
+reports the time spent in the logging call. "baseline" is the configuration before the
+asynchronous mode and the call site cache were added.
+
+    python -m benchmarks.logging_overhead --calls 20000
+"""
+import json
+import os
+import time
+
+import click
+
+from training.logger import configure_logging, logger
+
+CONFIGURATIONS = {
+    "baseline": {"mode": "sync", "callsite": "full"},
+    "sync_cached": {"mode": "sync", "callsite": "cached"},
+    "async_cached": {"mode": "async", "callsite": "cached"},
+    "async_off": {"mode": "async", "callsite": "off"},
+    "async_cached_sampled": {
+        "mode": "async",
+        "callsite": "cached",
+        "sample_rates": "info=0.01",
+    },
+}
+
+
+def benchmark_configuration(name: str, calls: int, stream) -> dict:
+    configure_logging(stream=stream, **CONFIGURATIONS[name])
+    start = time.perf_counter()
+    for step in range(calls):
+        logger.info("Finished training step", step=step, loss=0.5)
+    seconds = time.perf_counter() - start
+    # Drain the queue of the asynchronous mode outside of the measurement
+    configure_logging(mode="sync", stream=stream)
+    return {
+        "configuration": name,
+        **CONFIGURATIONS[name],
+        "microseconds_per_call": seconds / calls * 1e6,
+    }
+
+
+@click.command()
+@click.option("--calls", type=int, default=20000, help="Logging calls per config")
+def cli(calls: int):
+    """Compare the per-call overhead of the logging configurations"""
+    with open(os.devnull, "w") as devnull:
+        results = [
+            benchmark_configuration(name, calls, devnull) for name in CONFIGURATIONS
+        ]
+    configure_logging()
+    click.echo(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    cli()
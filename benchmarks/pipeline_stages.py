@@ -0,0 +1,314 @@
+"""Benchmark every stage of the training pipeline on synthetic FMNIST-shaped data.
+
+Writes synthetic gzipped IDX files at a multiple of the size of Fashion-MNIST, so that
+it runs offline, and times the stages of the pipeline on them: reading the IDX files,
+preprocessing, saving and loading the processed data in both formats, a fixed number
+of training steps, evaluation and logging to a local MLflow store. The peak resident
+memory during each stage is sampled alongside.
+
+The results are printed as JSON. When a baseline of a previous run is given, the
+stages that got slower or use more memory than the tolerance allows are reported and
+the command fails, e.g. to catch regressions in CI:
+
+    python -m benchmarks.pipeline_stages --scale 1 --output baseline.json
+    python -m benchmarks.pipeline_stages --scale 1 --baseline baseline.json
+"""
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import click
+import numpy as np
+
+from training.idx import write_idx
+from training.utils import mnist_paths, peak_rss_bytes
+
+FMNIST_TRAIN_SAMPLES = 60000
+FMNIST_TEST_SAMPLES = 10000
+TRACKING_STORES = ("sqlite", "file")
+COMPARED_METRICS = ("seconds", "peak_rss_bytes")
+RSS_SAMPLE_INTERVAL = 0.01
+
+
+def write_synthetic_idx(data_dir: Path, scale: float = 1.0, seed: int = 0) -> dict:
+    """Write gzipped IDX files named like Fashion-MNIST, `scale` times its size"""
+    rng = np.random.default_rng(seed)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    samples = {}
+    for kind, n in (("train", FMNIST_TRAIN_SAMPLES), ("test", FMNIST_TEST_SAMPLES)):
+        n = max(1, int(n * scale))
+        images_path, labels_path = mnist_paths(data_dir, kind=kind)
+        write_idx(images_path, rng.integers(0, 256, (n, 28, 28), dtype=np.uint8))
+        write_idx(labels_path, rng.integers(0, 10, n, dtype=np.uint8))
+        samples[kind] = n
+    return samples
+
+
+def _current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Not Linux, fall back to the peak of the whole process
+        return peak_rss_bytes()
+
+
+class _RssSampler:
+    """Sample the resident memory in a background thread and keep the maximum.
+
+    Unlike tracemalloc, this also covers the memory allocated by TensorFlow.
+    """
+
+    def __init__(self, interval: float = RSS_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak = _current_rss_bytes()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _current_rss_bytes())
+
+    def __enter__(self) -> "_RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss_bytes())
+
+
+def measure(function: Callable[[], object], items: int) -> dict:
+    """Time a stage and sample its peak resident memory"""
+    with _RssSampler() as sampler:
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "items": items,
+        "items_per_second": items / seconds if seconds else 0.0,
+        "peak_rss_bytes": sampler.peak,
+    }
+
+
+def _tracking_uri(store: str, work_dir: Path) -> str:
+    if store == "sqlite":
+        return f"sqlite:///{work_dir / 'mlflow.db'}"
+    return f"file:{work_dir / 'mlruns'}"
+
+
+def _log_to_mlflow(tracking_uri: str, model_dir: Path, steps: int) -> None:
+    import mlflow
+
+    from training.tracker import end_run, get_batch_logger
+
+    mlflow.set_tracking_uri(tracking_uri)
+    mlflow.set_experiment("benchmark")
+    mlflow.start_run()
+    batch_logger = get_batch_logger()
+    batch_logger.log_params({f"param_{i}": i for i in range(50)})
+    for step in range(steps):
+        batch_logger.log_metrics({"loss": 1.0 / (step + 1), "acc": 0.5}, step=step)
+    mlflow.log_artifacts(str(model_dir), "model")
+    end_run()
+
+
+def run_benchmarks(
+    work_dir: Path,
+    scale: float = 1.0,
+    train_steps: int = 100,
+    batch_size: int = 32,
+    tracking_store: str = "sqlite",
+) -> dict:
+    """Benchmark all stages in a working folder, returns the results by stage"""
+    # Imported up front, so that the import time is not part of any stage
+    import mlflow  # noqa: F401
+
+    from training.model import evaluate_model, get_model, save_model, train_model
+    from training.preprocess_data import preprocess_data
+    from training.utils import (
+        load_raw_data,
+        load_train_test_dataset,
+        save_processed_data,
+    )
+
+    raw_dir = work_dir / "raw"
+    samples = write_synthetic_idx(raw_dir, scale=scale)
+    n_items = samples["train"] + samples["test"]
+    data: dict = {}
+    stages = {}
+
+    def read():
+        data["raw"] = load_raw_data(raw_dir)
+
+    def preprocess():
+        data["processed"] = preprocess_data(data["raw"])
+
+    stages["idx_read"] = measure(read, n_items)
+    stages["preprocess"] = measure(preprocess, n_items)
+    del data["raw"]
+
+    for data_format in ("npz", "npy"):
+        processed_dir = work_dir / data_format
+        processed_dir.mkdir()
+        stages[f"save_{data_format}"] = measure(
+            lambda: save_processed_data(data["processed"], processed_dir, data_format),
+            n_items,
+        )
+        # Read fully into memory to compare the formats, not the memory-mapping
+        stages[f"load_{data_format}"] = measure(
+            lambda: data.update(
+                loaded=load_train_test_dataset(processed_dir, mmap_mode=None)
+            ),
+            n_items,
+        )
+    del data["processed"]
+    train_data, test_data = data.pop("loaded")
+
+    params = {
+        "epochs": 1,
+        "batch_size": batch_size,
+        "validation_split": 0.0,
+        "instrumentation": {"enabled": False},
+    }
+    model = get_model("baseline", {"num_layers": 5}, training_parameters=params)
+    n_train = min(train_steps * batch_size, len(train_data["y"]))
+    subset = {name: array[:n_train] for name, array in train_data.items()}
+    stages["train_steps"] = measure(
+        lambda: train_model(model=model, train_data=subset, params=params), n_train
+    )
+    stages["evaluate"] = measure(
+        lambda: evaluate_model(model, test_data), len(test_data["y"])
+    )
+
+    model_dir = work_dir / "model"
+    save_model(model, model_dir, training_params=params, model_params={})
+    stages["mlflow_logging"] = measure(
+        lambda: _log_to_mlflow(
+            _tracking_uri(tracking_store, work_dir), model_dir, train_steps
+        ),
+        train_steps,
+    )
+    return {
+        "scale": scale,
+        "samples": samples,
+        "train_steps": train_steps,
+        "batch_size": batch_size,
+        "tracking_store": tracking_store,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "stages": stages,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.2) -> List[dict]:
+    """Stages whose time or peak memory exceed the baseline by more than tolerance.
+
+    Stages missing from either result are ignored, so that stages can be added.
+    """
+    regressions = []
+    for stage, current in results["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    {
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": previous[metric],
+                        "current": current[metric],
+                        "ratio": current[metric] / previous[metric],
+                    }
+                )
+    return regressions
+
+
+@click.command()
+@click.option(
+    "--scale",
+    type=click.FloatRange(min=0, min_open=True),
+    default=1.0,
+    help="Size of the synthetic data as a multiple of Fashion-MNIST, e.g. 1, 10, 100",
+)
+@click.option("--train-steps", type=int, default=100, help="Number of training steps")
+@click.option("--batch-size", type=int, default=32, help="Batch size")
+@click.option(
+    "--tracking-store",
+    type=click.Choice(TRACKING_STORES),
+    default="sqlite",
+    help="Local MLflow store to benchmark the logging against",
+)
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Folder for the synthetic and processed data, a temporary folder if unset",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="File to also write the results to, e.g. to store them as baseline",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Results of a previous run to compare against",
+)
+@click.option(
+    "--tolerance",
+    type=float,
+    default=0.2,
+    help="Allowed relative increase of time and memory over the baseline",
+)
+def cli(
+    scale: float,
+    train_steps: int,
+    batch_size: int,
+    tracking_store: str,
+    work_dir: Optional[str],
+    output: Optional[str],
+    baseline: Optional[str],
+    tolerance: float,
+):
+    """Benchmark the stages of the pipeline on synthetic data"""
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        results = run_benchmarks(
+            Path(tmp_dir),
+            scale=scale,
+            train_steps=train_steps,
+            batch_size=batch_size,
+            tracking_store=tracking_store,
+        )
+    regressions: List[Dict] = []
+    if baseline is not None:
+        regressions = compare(
+            results, json.loads(Path(baseline).read_text()), tolerance=tolerance
+        )
+        results["regressions"] = regressions
+    text = json.dumps(results, indent=2)
+    if output is not None:
+        Path(output).write_text(text + "\n")
+    click.echo(text)
+    if regressions:
+        click.echo(f"{len(regressions)} regression(s) over the baseline", err=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,11 +1,8 @@
 import logging
 
 import click
-from kfp import compiler
 from omegaconf.dictconfig import DictConfig
 
-from pipeline.pipeline import make_pipeline_func
-
 from .config import DEFAULT_PIPELINE_OUTPUT_FILE, get_config
 
 logger = logging.getLogger(__name__)
@@ -16,6 +13,11 @@ def compile(
     output_file: str,
     cfg: DictConfig,
 ):
+    # kfp is only imported when compiling, not for the CLI
+    from kfp import compiler
+
+    from pipeline.pipeline import make_pipeline_func
+
     pipeline_func = make_pipeline_func(
         image_tag=image_tag,
         cfg=cfg,
@@ -3,9 +3,9 @@ import typing
 from dataclasses import dataclass
 from pathlib import Path
 
-from hydra import compose, initialize
-from hydra.core.config_store import ConfigStore
-from omegaconf import OmegaConf
+from omegaconf import DictConfig, OmegaConf
+
+from training.config_cache import load_config
 
 logger = logging.getLogger(__name__)
 
@@ -22,11 +22,20 @@ def get_config(
     config_path: str = "../conf/pipeline",
     config_name: str = "config",
     overrides: list = None
-):
-    with initialize(config_path=config_path):
-        cfg = compose(config_name=config_name, overrides=overrides or [])
-        logger.info(f"Loaded cfg ({config_name}): {OmegaConf.to_yaml(cfg)}")
-
+) -> DictConfig:
+    """Load the configuration, from its cached snapshot if the config files and the
+    overrides did not change. Hydra and the structured configs are only loaded when
+    the configuration is composed.
+    """
+    cfg = OmegaConf.create(
+        load_config(
+            Path(__file__).parent / config_path,
+            config_name=config_name,
+            overrides=overrides,
+            register=_register_configs,
+        )
+    )
+    logger.info(f"Loaded cfg ({config_name}): {OmegaConf.to_yaml(cfg)}")
     return cfg
 
 
@@ -43,10 +52,18 @@ class GpuConfig:
     toleration_seconds: typing.Optional[int] = None
 
 
+@dataclass
+class SweepConfig:
+    candidates: typing.List[str]
+    parallelism: typing.Optional[int] = None
+
+
 @dataclass
 class CompileConfig:
     image_repository: str
     training_image_url: str
+    fuse_data_train: bool = False
+    training_retries: int = 0
 
 
 @dataclass
@@ -64,8 +81,12 @@ class PipelineConfig:
     compile_config: CompileConfig
     submit_config: SubmitConfig
     gpu_config: typing.Optional[GpuConfig] = None
+    sweep_config: typing.Optional[SweepConfig] = None
+
 
+def _register_configs() -> None:
+    """Register the config dataclasses to Hydra for typing support"""
+    from hydra.core.config_store import ConfigStore
 
-# Registering the config dataclasses to Hydra for typing support
-cs = ConfigStore.instance()
-cs.store(name="base_pipeline_config", node=PipelineConfig)
+    cs = ConfigStore.instance()
+    cs.store(name="base_pipeline_config", node=PipelineConfig)
@@ -0,0 +1,576 @@
+"""Run the training pipeline on the local machine, without Kubeflow.
+
+The steps are defined by the same component YAMLs as the Kubeflow pipeline. Their
+command lines are resolved like KFP does, with every output path placed in the
+working folder of the run and passed as is to the consuming steps, so artifacts are
+never copied. The steps run as subprocesses, steps whose inputs are ready run
+concurrently, or in-process one after another, which avoids starting an interpreter
+and importing TensorFlow for every step.
+
+With a step cache, see `pipeline.step_cache`, steps whose component, image tag,
+parameters and input contents did not change are not run again, their cached outputs
+are used instead.
+
+The steps mirror `pipeline.pipeline.make_pipeline_func`, their arguments are built by
+the same functions, see `pipeline.steps`.
+
+    python -m pipeline.local_runner --input-data data/fashion-mnist --no-register
+"""
+import importlib
+import json
+import logging
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Union
+
+import click
+import yaml
+
+from training.tracker import mlflow_default_tracking_uri
+
+from .config import COMPONENTS_PATH
+from .step_cache import (
+    DEFAULT_STEP_CACHE_DIR,
+    StepCache,
+    hash_path,
+    local_image_tag,
+    step_cache_key,
+)
+from .steps import (
+    evaluation_arguments,
+    registration_arguments,
+    select_best_arguments,
+    train_arguments,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORK_DIR = Path("output") / "local-pipeline"
+RUN_MODES = ("subprocess", "in-process")
+TIMINGS_FILE = "timings.json"
+STEP_LOG_FILE = "step.log"
+
+
+@dataclass(frozen=True)
+class OutputRef:
+    """Reference to an output of another step, e.g. `train_step.output`"""
+
+    step: str
+    output: str = "output_path"
+
+
+@dataclass
+class LocalStep:
+    """A step of the pipeline: a component and the arguments of its inputs"""
+
+    name: str
+    component_file: Union[str, Path]
+    arguments: Dict[str, Union[str, int, OutputRef]] = field(default_factory=dict)
+    condition: bool = True
+    """The step is skipped if False, like steps in a `dsl.Condition`"""
+    cacheable: bool = True
+    """False for steps whose side effects must happen on every run"""
+    after: List[str] = field(default_factory=list)
+    """Steps to wait for without using their outputs, like `.after()` in KFP"""
+
+    @property
+    def dependencies(self) -> List[str]:
+        return sorted(
+            {ref.step for ref in self.arguments.values() if isinstance(ref, OutputRef)}
+            | set(self.after)
+        )
+
+
+@dataclass
+class StepResult:
+    name: str
+    status: str
+    """"succeeded", "failed", "skipped" or "not run" if a dependency did not succeed"""
+    seconds: float = 0.0
+    started: float = 0.0
+    """Seconds since the start of the run"""
+    outputs: Dict[str, str] = field(default_factory=dict)
+    output_hashes: Dict[str, str] = field(default_factory=dict)
+    cache: str = "disabled"
+    """"hit" or "miss" when the step cache is used"""
+    cache_key: Optional[str] = None
+
+
+def load_component_spec(component_file: Union[str, Path]) -> dict:
+    """Load a component YAML, relative to the components folder of the pipeline"""
+    path = Path(component_file)
+    if not path.is_absolute():
+        path = COMPONENTS_PATH / path
+    with path.open() as f:
+        return yaml.safe_load(f)
+
+
+def _resolve(
+    item: Any, values: Mapping[str, str], paths: Mapping[str, str]
+) -> List[str]:
+    """Resolve an item of a KFP command line into its arguments.
+
+    Supports the constants and the inputValue, inputPath, outputPath, concat and
+    if/isPresent placeholders.
+    """
+    if not isinstance(item, dict):
+        return [str(item)]
+    ((kind, arg),) = item.items()
+    if kind == "inputValue":
+        return [values[arg]] if arg in values else []
+    if kind in ("inputPath", "outputPath"):
+        return [paths[arg]]
+    if kind == "concat":
+        return ["".join(a for part in arg for a in _resolve(part, values, paths))]
+    if kind == "if":
+        name = arg["cond"]["isPresent"]
+        present = name in values or name in paths
+        branch = arg.get("then", []) if present else arg.get("else", [])
+        return [a for part in branch for a in _resolve(part, values, paths)]
+    raise ValueError(f"Unsupported component placeholder {kind}")
+
+
+def resolve_command(
+    spec: dict, arguments: Mapping[str, str], output_paths: Mapping[str, str]
+) -> List[str]:
+    """Command line of a component for the given input arguments and output paths"""
+    values: Dict[str, str] = {}
+    paths = dict(output_paths)
+    for input_spec in spec.get("inputs", []):
+        name = input_spec["name"]
+        if name in arguments:
+            value = arguments[name]
+        elif "default" in input_spec:
+            value = str(input_spec["default"])
+        elif input_spec.get("optional"):
+            continue
+        else:
+            raise ValueError(f"Missing argument for input {name} of {spec['name']}")
+        if input_spec.get("type") == "LocalPath":
+            paths[name] = value
+        else:
+            values[name] = str(value)
+    container = spec["implementation"]["container"]
+    command = container.get("command", []) + container.get("args", [])
+    return [arg for item in command for arg in _resolve(item, values, paths)]
+
+
+def _run_in_process(command: List[str]) -> None:
+    """Run a `python -m <module> ...` command with the click CLI of the module"""
+    if len(command) < 3 or command[1] != "-m":
+        raise ValueError(f"Only 'python -m <module>' runs in-process: {command}")
+    module = importlib.import_module(command[2])
+    try:
+        module.cli.main(args=command[3:], prog_name=command[2], standalone_mode=False)
+    except SystemExit as e:
+        if e.code:
+            raise
+
+
+def _run_subprocess(command: List[str], log_file: Path) -> None:
+    if command[0] in ("python", "python3"):
+        # The interpreter of the runner, e.g. of the virtual environment
+        command = [sys.executable] + command[1:]
+    with log_file.open("w") as log:
+        subprocess.run(command, check=True, stdout=log, stderr=subprocess.STDOUT)
+
+
+class LocalRunner:
+    """Run pipeline steps in a working folder.
+
+    Args:
+        work_dir: Folder of the outputs, `<work_dir>/<step>/<output>`.
+        mode: "subprocess" or "in-process".
+        max_workers: Maximum number of concurrent steps in subprocess mode. The
+            in-process steps share the interpreter and its global state, e.g. the
+            active MLflow run, so they always run one at a time.
+        cache: Step cache to reuse the outputs of unchanged steps, None to run all.
+        image_tag: Part of the cache keys, the hash of the local sources if None.
+    """
+
+    def __init__(
+        self,
+        work_dir: Path,
+        mode: str = "subprocess",
+        max_workers: int = 4,
+        cache: Optional[StepCache] = None,
+        image_tag: Optional[str] = None,
+    ):
+        if mode not in RUN_MODES:
+            raise ValueError(f"Unsupported mode '{mode}', expected one of {RUN_MODES}")
+        self.work_dir = work_dir
+        self.mode = mode
+        self.max_workers = max_workers if mode == "subprocess" else 1
+        self.cache = cache
+        self.image_tag = image_tag
+        if cache is not None and image_tag is None:
+            self.image_tag = local_image_tag()
+
+    def output_paths(self, step: LocalStep, spec: dict) -> Dict[str, str]:
+        return {
+            output["name"]: str(self.work_dir / step.name / output["name"])
+            for output in spec.get("outputs", [])
+        }
+
+    def _cache_key(
+        self, step: LocalStep, spec: dict, results: Dict[str, StepResult]
+    ) -> str:
+        path_inputs = {
+            i["name"] for i in spec.get("inputs", []) if i.get("type") == "LocalPath"
+        }
+        parameters, input_hashes = {}, {}
+        for name, value in step.arguments.items():
+            if isinstance(value, OutputRef):
+                input_hashes[name] = results[value.step].output_hashes[value.output]
+            elif name in path_inputs:
+                input_hashes[name] = hash_path(Path(value))
+            else:
+                parameters[name] = str(value)
+        assert self.image_tag is not None
+        return step_cache_key(spec, self.image_tag, parameters, input_hashes)
+
+    def _run_step(
+        self, step: LocalStep, results: Dict[str, StepResult], start: float
+    ) -> StepResult:
+        spec = load_component_spec(step.component_file)
+        result = StepResult(step.name, "failed", started=time.perf_counter() - start)
+        step_start = time.perf_counter()
+        use_cache = self.cache is not None and step.cacheable
+        if use_cache:
+            assert self.cache is not None
+            result.cache_key = self._cache_key(step, spec, results)
+            cached = self.cache.lookup(result.cache_key)
+            result.cache = "miss" if cached is None else "hit"
+            if cached is not None:
+                result.status = "succeeded"
+                result.outputs = {name: o["path"] for name, o in cached.items()}
+                result.output_hashes = {name: o["sha256"] for name, o in cached.items()}
+                result.seconds = time.perf_counter() - step_start
+                logger.info(f"Step {step.name} cache hit {result.cache_key}")
+                return result
+
+        outputs = self.output_paths(step, spec)
+        arguments = {
+            name: results[value.step].outputs[value.output]
+            if isinstance(value, OutputRef)
+            else str(value)
+            for name, value in step.arguments.items()
+        }
+        command = resolve_command(spec, arguments, outputs)
+        step_dir = self.work_dir / step.name
+        # Like KFP, create the parent folders of the outputs but not the outputs. The
+        # outputs of a previous run are removed, they may be hardlinked in the cache
+        step_dir.mkdir(parents=True, exist_ok=True)
+        for path in map(Path, outputs.values()):
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+
+        logger.info(f"Running step {step.name}: {' '.join(command)}")
+        result.outputs = outputs
+        try:
+            if self.mode == "in-process":
+                _run_in_process(command)
+            else:
+                _run_subprocess(command, step_dir / STEP_LOG_FILE)
+            if use_cache:
+                assert self.cache is not None and result.cache_key is not None
+                cached = self.cache.add(result.cache_key, step.name, outputs)
+                result.output_hashes = {name: o["sha256"] for name, o in cached.items()}
+            result.status = "succeeded"
+        except Exception:
+            logger.exception(f"Step {step.name} failed, see {step_dir}")
+        result.seconds = time.perf_counter() - step_start
+        logger.info(f"Step {step.name} {result.status} in {result.seconds:.2f}s")
+        return result
+
+    def run(self, steps: List[LocalStep]) -> List[StepResult]:
+        """Run the steps as soon as their dependencies succeeded.
+
+        Returns:
+            List[StepResult]: Results of the steps in the order of the steps. A step
+                whose dependencies failed or were skipped is not run.
+        """
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        pending = {step.name: step for step in steps}
+        results: Dict[str, StepResult] = {}
+        running: Dict[Future, str] = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name, step in list(pending.items()):
+                    dependencies = [results.get(d) for d in step.dependencies]
+                    if any(r is None for r in dependencies):
+                        continue
+                    del pending[name]
+                    if not step.condition:
+                        results[name] = StepResult(name, "skipped")
+                    elif any(r.status != "succeeded" for r in dependencies):
+                        results[name] = StepResult(name, "not run")
+                    else:
+                        future = executor.submit(self._run_step, step, results, start)
+                        running[future] = name
+                if not running:
+                    if pending:
+                        raise ValueError(f"Unknown dependencies of {list(pending)}")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+
+        ordered = [results[step.name] for step in steps]
+        self._report(ordered, total_seconds=time.perf_counter() - start)
+        return ordered
+
+    def _report(self, results: List[StepResult], total_seconds: float) -> None:
+        report = {
+            "mode": self.mode,
+            "total_seconds": total_seconds,
+            "steps": [vars(result) for result in results],
+        }
+        (self.work_dir / TIMINGS_FILE).write_text(json.dumps(report, indent=2))
+        for result in results:
+            logger.info(
+                f"{result.name:<20} {result.status:<10} started {result.started:8.2f}s"
+                f" took {result.seconds:8.2f}s, cache {result.cache}"
+            )
+        logger.info(f"Pipeline finished in {total_seconds:.2f}s")
+
+
+def make_training_steps(
+    experiment: str,
+    mlflow_tracking_uri: str,
+    mlflow_s3_endpoint_url: str,
+    model_registry_name: str,
+    register_model: bool,
+    input_data: Optional[str] = None,
+    data_cache_dir: Optional[str] = None,
+    fuse_data_train: bool = False,
+    candidates: Sequence[str] = (),
+    pipeline_run_id: Optional[str] = None,
+) -> List[LocalStep]:
+    """Steps of the training pipeline, see `pipeline.pipeline.make_pipeline_func`.
+
+    Args:
+        input_data: Folder of already pulled data, skips pulling the data if set.
+        data_cache_dir: Dataset cache folder of the pull data step.
+        fuse_data_train: Pull, preprocess and train in a single step.
+        candidates: Training config overrides of the candidates of a sweep. They
+            are trained on the same preprocessed data and the best one is evaluated.
+        pipeline_run_id: Id the candidate runs are found by, a random id if None.
+    """
+    if candidates and fuse_data_train:
+        raise ValueError("The fused data and training step cannot sweep")
+    steps = []
+    if fuse_data_train:
+        data_train_arguments = train_arguments(
+            experiment, mlflow_tracking_uri, mlflow_s3_endpoint_url, input_data
+        )
+        if data_cache_dir:
+            data_train_arguments["cache_dir"] = data_cache_dir
+        steps.append(
+            LocalStep("training", "data_train_component.yaml", data_train_arguments)
+        )
+    elif input_data is None:
+        pull_data_arguments = {"cache_dir": data_cache_dir} if data_cache_dir else {}
+        steps.append(
+            LocalStep("pull-data", "pull_data_component.yaml", pull_data_arguments)
+        )
+    if not fuse_data_train:
+        raw_data = OutputRef("pull-data") if input_data is None else input_data
+        steps.append(
+            LocalStep(
+                "preprocess-data",
+                "preprocess_data_component.yaml",
+                {"input_data": raw_data},
+            )
+        )
+    train_output = OutputRef("training")
+    if candidates:
+        pipeline_run_id = pipeline_run_id or uuid.uuid4().hex
+        candidate_steps = [
+            LocalStep(
+                f"training-{i}",
+                "train_component.yaml",
+                train_arguments(
+                    experiment,
+                    mlflow_tracking_uri,
+                    mlflow_s3_endpoint_url,
+                    input_data=OutputRef("preprocess-data"),
+                    pipeline_run_id=pipeline_run_id,
+                    config_overrides=overrides,
+                ),
+            )
+            for i, overrides in enumerate(candidates)
+        ]
+        steps += candidate_steps + [
+            LocalStep(
+                "select-best",
+                "select_best_component.yaml",
+                select_best_arguments(
+                    experiment, mlflow_tracking_uri, pipeline_run_id, len(candidates)
+                ),
+                cacheable=False,
+                after=[step.name for step in candidate_steps],
+            )
+        ]
+        train_output = OutputRef("select-best")
+    elif not fuse_data_train:
+        steps.append(
+            LocalStep(
+                "training",
+                "train_component.yaml",
+                train_arguments(
+                    experiment,
+                    mlflow_tracking_uri,
+                    mlflow_s3_endpoint_url,
+                    input_data=OutputRef("preprocess-data"),
+                ),
+            )
+        )
+    steps += [
+        LocalStep(
+            "evaluation",
+            "evaluation_component.yaml",
+            evaluation_arguments(mlflow_tracking_uri, train_output),
+        ),
+        LocalStep(
+            "registration",
+            "registration_component.yaml",
+            registration_arguments(
+                model_registry_name,
+                mlflow_tracking_uri,
+                train_output,
+                OutputRef("evaluation"),
+            ),
+            condition=register_model,
+            cacheable=False,
+        ),
+    ]
+    return steps
+
+
+@click.command()
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False),
+    default=str(DEFAULT_WORK_DIR),
+    help="Folder to write the outputs of the steps to",
+)
+@click.option(
+    "--mode",
+    type=click.Choice(RUN_MODES),
+    default="subprocess",
+    help="Run the steps as subprocesses or in this process",
+)
+@click.option(
+    "--max-workers",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Maximum number of concurrent steps in subprocess mode",
+)
+@click.option(
+    "--input-data",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="Folder of already pulled data, the data is pulled if unset",
+)
+@click.option(
+    "--data-cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Dataset cache folder shared between runs of the pull data step",
+)
+@click.option(
+    "--fuse-data-train/--no-fuse-data-train",
+    default=False,
+    help="Pull, preprocess and train in a single step",
+)
+@click.option(
+    "--candidate",
+    "candidates",
+    multiple=True,
+    help="""Training config overrides of a candidate, repeated to train several
+    candidates and evaluate the best, e.g. --candidate 'model_config.num_layers=3'""",
+)
+@click.option(
+    "--step-cache/--no-step-cache",
+    default=False,
+    help="Reuse the outputs of steps whose inputs did not change",
+)
+@click.option(
+    "--step-cache-dir",
+    type=click.Path(file_okay=False),
+    default=str(DEFAULT_STEP_CACHE_DIR),
+    help="Folder of the step cache, see `python -m pipeline.step_cache --help`",
+)
+@click.option("--experiment", default="local", help="Name of the MLflow experiment")
+@click.option(
+    "--mlflow-tracking-uri",
+    default=mlflow_default_tracking_uri,
+    help="MLflow tracking URI, e.g. a local SQLite database",
+)
+@click.option(
+    "--mlflow-s3-endpoint-url", default="", help="MLflow S3 endpoint URL, if any"
+)
+@click.option(
+    "--model-registry-name",
+    default="default-model",
+    help="Name of the registered model",
+)
+@click.option(
+    "--register/--no-register",
+    default=True,
+    help="Register the model if it passes the evaluation",
+)
+def cli(
+    work_dir: str,
+    mode: str,
+    max_workers: int,
+    input_data: Optional[str],
+    data_cache_dir: Optional[str],
+    fuse_data_train: bool,
+    candidates: Sequence[str],
+    step_cache: bool,
+    step_cache_dir: str,
+    experiment: str,
+    mlflow_tracking_uri: str,
+    mlflow_s3_endpoint_url: str,
+    model_registry_name: str,
+    register: bool,
+):
+    """Run the training pipeline locally and report the time of every step"""
+    logging.basicConfig(level=logging.INFO)
+
+    steps = make_training_steps(
+        experiment=experiment,
+        mlflow_tracking_uri=mlflow_tracking_uri,
+        mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+        model_registry_name=model_registry_name,
+        register_model=register,
+        input_data=str(Path(input_data).resolve()) if input_data else None,
+        data_cache_dir=data_cache_dir,
+        fuse_data_train=fuse_data_train,
+        candidates=candidates,
+    )
+    runner = LocalRunner(
+        Path(work_dir).resolve(),
+        mode=mode,
+        max_workers=max_workers,
+        cache=StepCache(Path(step_cache_dir)) if step_cache else None,
+    )
+    results = runner.run(steps)
+    click.echo(json.dumps([vars(result) for result in results], indent=2))
+    if any(result.status in ("failed", "not run") for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
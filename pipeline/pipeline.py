@@ -6,7 +6,15 @@ from kfp.aws import use_aws_secret
 from kubernetes.client import V1Toleration
 from omegaconf.dictconfig import DictConfig
 
+from training.config import get_training_config
+
 from .config import COMPONENTS_PATH
+from .steps import (
+    evaluation_arguments,
+    registration_arguments,
+    select_best_arguments,
+    train_arguments,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +58,124 @@ def configure_gpu(train_step, cfg: DictConfig):
     return train_step
 
 
+def configure_training(train_step, cfg: DictConfig):
+    """Configure the credentials and the GPU of a training step."""
+
+    train_step.apply(use_aws_secret(secret_name="aws-secret"))
+    if cfg.compile_config.training_retries:
+        # A retried training resumes from its checkpoint, if enabled
+        train_step.set_retry(cfg.compile_config.training_retries)
+    if cfg.gpu_config:
+        logger.info("Use GPU for the training step")
+        train_step = configure_gpu(train_step=train_step, cfg=cfg)
+    return train_step
+
+
+def resume_arguments(cfg: DictConfig, resume_key: str) -> dict:
+    """Resume key argument of a training step, if a retried training resumes.
+
+    The key contains the id of the pipeline run, which changes on every run and would
+    prevent caching the training step. It is only passed when the training is retried
+    and checkpointing is enabled in the training config.
+    """
+    if not cfg.compile_config.training_retries:
+        return {}
+    _, _, training_parameters = get_training_config()
+    if not training_parameters.get("checkpoint", {}).get("enabled", False):
+        logger.info("Checkpointing is disabled, a retried training starts over")
+        return {}
+    return {"resume_key": resume_key}
+
+
+def _make_data_steps(cfg: DictConfig, image_tag: str):
+    """Pull data and preprocess data steps, returns the last"""
+    pull_data_component = load_component(
+        filename="pull_data_component.yaml", cfg=cfg, image_tag=image_tag
+    )
+    pull_data_step = pull_data_component()
+
+    preprocess_data_component = load_component(
+        filename="preprocess_data_component.yaml", cfg=cfg, image_tag=image_tag
+    )
+    return preprocess_data_component(input_data=pull_data_step.output)
+
+
+def _make_data_and_train_steps(
+    cfg: DictConfig,
+    image_tag: str,
+    experiment,
+    mlflow_tracking_uri,
+    mlflow_s3_endpoint_url,
+):
+    """Separate pull data, preprocess data and training steps, returns the last"""
+    preprocess_data_step = _make_data_steps(cfg=cfg, image_tag=image_tag)
+
+    train_component = load_component(
+        filename="train_component.yaml", cfg=cfg, image_tag=image_tag
+    )
+    train_step = train_component(
+        **train_arguments(
+            experiment,
+            mlflow_tracking_uri,
+            mlflow_s3_endpoint_url,
+            input_data=preprocess_data_step.output,
+        ),
+        **resume_arguments(cfg, resume_key=kfp.dsl.RUN_ID_PLACEHOLDER),
+    )
+    return configure_training(train_step=train_step, cfg=cfg)
+
+
+def _make_sweep_steps(
+    cfg: DictConfig,
+    image_tag: str,
+    experiment,
+    mlflow_tracking_uri,
+    mlflow_s3_endpoint_url,
+):
+    """Train the candidates of the sweep in parallel on the same preprocessed data,
+    returns the step selecting the best of them.
+    """
+    candidates = list(cfg.sweep_config.candidates)
+    if not candidates:
+        raise ValueError("The sweep config has no candidates")
+    logger.info(f"Train {len(candidates)} candidates in parallel")
+    preprocess_data_step = _make_data_steps(cfg=cfg, image_tag=image_tag)
+
+    train_component = load_component(
+        filename="train_component.yaml", cfg=cfg, image_tag=image_tag
+    )
+    # The candidates are found in MLflow by the id of the pipeline run, KFP v1
+    # cannot pass the outputs of all iterations of a loop to a later step
+    pipeline_run_id = kfp.dsl.RUN_ID_PLACEHOLDER
+    with dsl.ParallelFor(
+        candidates, parallelism=cfg.sweep_config.parallelism
+    ) as config_overrides:
+        train_step = train_component(
+            **train_arguments(
+                experiment,
+                mlflow_tracking_uri,
+                mlflow_s3_endpoint_url,
+                input_data=preprocess_data_step.output,
+                pipeline_run_id=pipeline_run_id,
+                config_overrides=config_overrides,
+            ),
+            **resume_arguments(cfg, resume_key=f"{pipeline_run_id}-{config_overrides}"),
+        )
+        configure_training(train_step=train_step, cfg=cfg)
+
+    select_best_component = load_component(
+        filename="select_best_component.yaml", cfg=cfg, image_tag=image_tag
+    )
+    select_best_step = select_best_component(
+        **select_best_arguments(
+            experiment, mlflow_tracking_uri, pipeline_run_id, len(candidates)
+        )
+    ).after(train_step)
+    # The candidates are looked up in MLflow, never reuse a cached result
+    select_best_step.execution_options.caching_strategy.max_cache_staleness = "P0D"
+    return select_best_step
+
+
 def make_pipeline_func(image_tag: str, cfg: DictConfig):
     """Create KFP pipeline function with given image tag."""
 
@@ -62,40 +188,41 @@ def make_pipeline_func(image_tag: str, cfg: DictConfig):
         register_model: bool,
     ):
 
-        pull_data_component = load_component(
-            filename="pull_data_component.yaml", cfg=cfg, image_tag=image_tag
-        )
-        pull_data_step = pull_data_component()
-
-        preprocess_data_component = load_component(
-            filename="preprocess_data_component.yaml", cfg=cfg, image_tag=image_tag
-        )
-        preprocess_data_step = preprocess_data_component(
-            input_data=pull_data_step.output
-        )
-
-        train_component = load_component(
-            filename="train_component.yaml", cfg=cfg, image_tag=image_tag
-        )
-        train_step = train_component(
-            experiment=experiment,
-            mlflow_tracking_uri=mlflow_tracking_uri,
-            mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
-            input_data=preprocess_data_step.output,
-            experiment_parameters="one=two",
-        )
-        train_step.apply(use_aws_secret(secret_name="aws-secret"))
-
-        if cfg.gpu_config:
-            logger.info("Use GPU for the training step")
-            train_step = configure_gpu(train_step=train_step, cfg=cfg)
+        if cfg.sweep_config:
+            if cfg.compile_config.fuse_data_train:
+                raise ValueError("The fused data and training step cannot sweep")
+            train_step = _make_sweep_steps(
+                cfg=cfg,
+                image_tag=image_tag,
+                experiment=experiment,
+                mlflow_tracking_uri=mlflow_tracking_uri,
+                mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+            )
+        elif cfg.compile_config.fuse_data_train:
+            logger.info("Fuse the data and training steps")
+            data_train_component = load_component(
+                filename="data_train_component.yaml", cfg=cfg, image_tag=image_tag
+            )
+            train_step = data_train_component(
+                **train_arguments(
+                    experiment, mlflow_tracking_uri, mlflow_s3_endpoint_url
+                )
+            )
+            train_step = configure_training(train_step=train_step, cfg=cfg)
+        else:
+            train_step = _make_data_and_train_steps(
+                cfg=cfg,
+                image_tag=image_tag,
+                experiment=experiment,
+                mlflow_tracking_uri=mlflow_tracking_uri,
+                mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+            )
 
         eval_component = load_component(
             filename="evaluation_component.yaml", cfg=cfg, image_tag=image_tag
         )
         eval_step = eval_component(
-            mlflow_tracking_uri=mlflow_tracking_uri,
-            training_output_dir=train_step.output
+            **evaluation_arguments(mlflow_tracking_uri, train_step.output)
         )
 
         register_component = load_component(
@@ -103,11 +230,17 @@ def make_pipeline_func(image_tag: str, cfg: DictConfig):
         )
 
         with dsl.Condition(register_model == "True"):
-            register_component(
-                model_registry_name=model_registry_name,
-                mlflow_tracking_uri=mlflow_tracking_uri,
-                training_output_dir=train_step.output,
-                evaluation_output_dir=eval_step.output,
+            register_step = register_component(
+                **registration_arguments(
+                    model_registry_name,
+                    mlflow_tracking_uri,
+                    train_step.output,
+                    eval_step.output,
+                )
+            )
+            # Registering is a side effect, never reuse a cached result
+            register_step.execution_options.caching_strategy.max_cache_staleness = (
+                "P0D"
             )
 
     return training_pipeline
@@ -0,0 +1,253 @@
+"""Cache of the outputs of pipeline steps for local runs.
+
+A step is keyed by the hash of its component spec, the image tag, the values of its
+parameters and the content hashes of its input artifacts. On a hit, the local runner
+skips the step and passes the cached outputs to the downstream steps. The content
+hash of every output is stored with it, so downstream keys never rehash cached data.
+
+Like the dataset cache of `training.cache`, the index is locked against concurrent
+runs and tracks the last use of each entry. Entries are only removed explicitly, by
+invalidating them or by evicting the least recently used ones over a size limit:
+
+    python -m pipeline.step_cache list
+    python -m pipeline.step_cache invalidate --step training
+    python -m pipeline.step_cache evict --max-size-mb 1000
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Mapping, Optional, Union
+
+import click
+
+from training.utils import directory_size, sha256sum
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+ENTRIES_DIR = "entries"
+DEFAULT_STEP_CACHE_DIR = Path(".cache") / "steps"
+
+SOURCE_DIRS = ("training", "conf")
+"""Folders copied into the training image, hashed as the image tag of local runs"""
+
+
+def hash_path(path: Path) -> str:
+    """Content hash of a file or of the relative paths and files of a folder"""
+    if path.is_file():
+        return sha256sum(path)
+    digest = hashlib.sha256()
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        digest.update(file.relative_to(path).as_posix().encode())
+        digest.update(b"\0")
+        digest.update(sha256sum(file).encode())
+    return digest.hexdigest()
+
+
+def local_image_tag(root: Path = Path(__file__).parent.parent) -> str:
+    """Tag of the local sources standing in for the image tag in local runs"""
+    digest = hashlib.sha256()
+    for source_dir in SOURCE_DIRS:
+        for file in sorted((root / source_dir).rglob("*")):
+            if file.is_file() and "__pycache__" not in file.parts:
+                digest.update(file.relative_to(root).as_posix().encode())
+                digest.update(sha256sum(file).encode())
+    return f"local-{digest.hexdigest()[:12]}"
+
+
+def step_cache_key(
+    spec: dict,
+    image_tag: str,
+    parameters: Mapping[str, str],
+    input_hashes: Mapping[str, str],
+) -> str:
+    key = {
+        "spec": spec,
+        "image_tag": image_tag,
+        "parameters": dict(parameters),
+        "inputs": dict(input_hashes),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _link_tree(source: Path, destination: Path) -> None:
+    """Hardlink a file or folder, copying if the file system does not support it"""
+
+    def link(src: str, dst: str) -> None:
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    if source.is_dir():
+        shutil.copytree(source, destination, copy_function=link)
+    else:
+        link(str(source), str(destination))
+
+
+class StepCache:
+    """Local cache of step outputs with explicit invalidation and LRU eviction.
+
+    Args:
+        cache_dir: Folder of the cache, created if it does not exist.
+    """
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir).resolve()
+        self.entries_dir = self.cache_dir / ENTRIES_DIR
+        self.entries_dir.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked_index(self) -> Iterator[dict]:
+        """Lock the cache against concurrent users and yield the mutable index"""
+        with (self.cache_dir / LOCK_FILE).open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index_path = self.cache_dir / INDEX_FILE
+                if index_path.exists():
+                    index = json.loads(index_path.read_text())
+                else:
+                    index = {}
+                yield index
+                tmp_path = index_path.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps(index, indent=2))
+                tmp_path.replace(index_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def lookup(self, key: str) -> Optional[Dict[str, dict]]:
+        """Cached outputs of a step key, as paths and hashes by output name.
+
+        Returns None on a cache miss.
+        """
+        with self._locked_index() as index:
+            entry = index.get(key)
+            if entry is None:
+                return None
+            if not all(Path(o["path"]).exists() for o in entry["outputs"].values()):
+                del index[key]
+                return None
+            entry["last_used"] = time.time()
+            return entry["outputs"]
+
+    def add(
+        self, key: str, step: str, outputs: Mapping[str, Union[str, Path]]
+    ) -> Dict[str, dict]:
+        """Store the outputs of a step, hardlinked into the cache when possible"""
+        entry_dir = self.entries_dir / key
+        tmp_dir = self.entries_dir / f"{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        for name, path in outputs.items():
+            _link_tree(Path(path), tmp_dir / name)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        tmp_dir.replace(entry_dir)
+
+        cached = {
+            name: {"path": str(entry_dir / name), "sha256": hash_path(entry_dir / name)}
+            for name in outputs
+        }
+        with self._locked_index() as index:
+            index[key] = {
+                "step": step,
+                "outputs": cached,
+                "size": directory_size(entry_dir),
+                "created": time.time(),
+                "last_used": time.time(),
+            }
+        return cached
+
+    def entries(self) -> Dict[str, dict]:
+        with self._locked_index() as index:
+            return dict(index)
+
+    def _remove(self, index: dict, keys: List[str]) -> int:
+        freed = 0
+        for key in keys:
+            freed += index.pop(key)["size"]
+            shutil.rmtree(self.entries_dir / key, ignore_errors=True)
+        return freed
+
+    def invalidate(self, step: Optional[str] = None, key: Optional[str] = None) -> int:
+        """Remove the entries of a step, or with a key, or all if neither is given.
+
+        Returns the number of removed entries.
+        """
+        with self._locked_index() as index:
+            keys = [
+                k
+                for k, entry in index.items()
+                if (step is None or entry["step"] == step) and (key is None or k == key)
+            ]
+            self._remove(index, keys)
+        return len(keys)
+
+    def evict(self, max_size_bytes: int) -> int:
+        """Evict least recently used entries until the cache fits the size limit.
+
+        Returns the number of bytes freed.
+        """
+        with self._locked_index() as index:
+            total = sum(entry["size"] for entry in index.values())
+            evicted = []
+            for key in sorted(index, key=lambda k: index[k]["last_used"]):
+                if total <= max_size_bytes:
+                    break
+                total -= index[key]["size"]
+                evicted.append(key)
+            return self._remove(index, evicted)
+
+
+@click.group()
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=str(DEFAULT_STEP_CACHE_DIR),
+    help="Folder of the step cache",
+)
+@click.pass_context
+def cli(ctx: click.Context, cache_dir: str):
+    """Manage the cache of the outputs of local pipeline steps"""
+    ctx.obj = StepCache(Path(cache_dir))
+
+
+@cli.command("list")
+@click.pass_obj
+def list_entries(cache: StepCache):
+    """List the cached entries"""
+    click.echo(json.dumps(cache.entries(), indent=2))
+
+
+@cli.command()
+@click.option("--step", default=None, help="Remove the entries of this step")
+@click.option("--key", default=None, help="Remove the entry with this key")
+@click.option("--all", "all_entries", is_flag=True, help="Remove all entries")
+@click.pass_obj
+def invalidate(
+    cache: StepCache, step: Optional[str], key: Optional[str], all_entries: bool
+):
+    """Remove entries, so that their steps run again"""
+    if not (step or key or all_entries):
+        raise click.UsageError("Give --step, --key or --all")
+    click.echo(f"Removed {cache.invalidate(step=step, key=key)} entries")
+
+
+@cli.command()
+@click.option(
+    "--max-size-mb",
+    type=click.IntRange(min=0),
+    required=True,
+    help="Size limit of the cache",
+)
+@click.pass_obj
+def evict(cache: StepCache, max_size_mb: int):
+    """Evict the least recently used entries over the size limit"""
+    click.echo(f"Freed {cache.evict(max_size_mb * 1024 * 1024)} bytes")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,89 @@
+"""Arguments of the components of the training pipeline.
+
+The Kubeflow pipeline, `pipeline.pipeline.make_pipeline_func`, and the local runner,
+`pipeline.local_runner.make_training_steps`, build the arguments of their steps with
+these functions, so that both wire the components the same way. The values are
+pipeline parameters and step outputs in the Kubeflow pipeline and strings and output
+references in the local runner. Kubeflow is not imported, the local runner runs
+without it.
+"""
+from typing import Any, Dict, Optional
+
+from training.select_best import PIPELINE_RUN_PARAMETER
+
+EXPERIMENT_PARAMETERS = "one=two"
+"""Experiment parameters logged by every training of the pipeline"""
+
+
+def experiment_parameters(pipeline_run_id: Optional[str] = None) -> str:
+    """Experiment parameters of a training, with the id of the pipeline run for the
+    candidates of a sweep, which are found in MLflow by it.
+    """
+    if pipeline_run_id is None:
+        return EXPERIMENT_PARAMETERS
+    return f"{EXPERIMENT_PARAMETERS},{PIPELINE_RUN_PARAMETER}={pipeline_run_id}"
+
+
+def train_arguments(
+    experiment: Any,
+    mlflow_tracking_uri: Any,
+    mlflow_s3_endpoint_url: Any,
+    input_data: Any = None,
+    pipeline_run_id: Optional[str] = None,
+    config_overrides: Any = None,
+) -> Dict[str, Any]:
+    """Arguments of the training, or of the fused data and training step without
+    input data.
+
+    Args:
+        input_data: Preprocessed data, or pulled data of the fused step.
+        pipeline_run_id: Id of the pipeline run of a sweep candidate.
+        config_overrides: Training config overrides of a sweep candidate.
+    """
+    arguments = {
+        "experiment": experiment,
+        "mlflow_tracking_uri": mlflow_tracking_uri,
+        "mlflow_s3_endpoint_url": mlflow_s3_endpoint_url,
+        "experiment_parameters": experiment_parameters(pipeline_run_id),
+    }
+    if input_data is not None:
+        arguments["input_data"] = input_data
+    if config_overrides is not None:
+        arguments["config_overrides"] = config_overrides
+    return arguments
+
+
+def select_best_arguments(
+    experiment: Any,
+    mlflow_tracking_uri: Any,
+    pipeline_run_id: str,
+    candidates: int,
+) -> Dict[str, Any]:
+    """Arguments of the step selecting the best of the candidates of a sweep"""
+    return {
+        "experiment": experiment,
+        "mlflow_tracking_uri": mlflow_tracking_uri,
+        "pipeline_run_id": pipeline_run_id,
+        "expected_candidates": candidates,
+    }
+
+
+def evaluation_arguments(mlflow_tracking_uri: Any, training_output: Any) -> dict:
+    return {
+        "mlflow_tracking_uri": mlflow_tracking_uri,
+        "training_output_dir": training_output,
+    }
+
+
+def registration_arguments(
+    model_registry_name: Any,
+    mlflow_tracking_uri: Any,
+    training_output: Any,
+    evaluation_output: Any,
+) -> dict:
+    return {
+        "model_registry_name": model_registry_name,
+        "mlflow_tracking_uri": mlflow_tracking_uri,
+        "training_output_dir": training_output,
+        "evaluation_output_dir": evaluation_output,
+    }
@@ -4,12 +4,13 @@ import typing
 from dataclasses import dataclass
 
 import click
-import kfp
-import kfp_server_api
 
 from .config import DEFAULT_RUN_PIPELINE_FILE, get_config
 from .auth_kubeflow import get_istio_auth_session
 
+if typing.TYPE_CHECKING:
+    import kfp_server_api
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,7 +21,7 @@ class ArgoWorkflowDetails:
 
 
 def _parse_argo_workflow(
-    run: kfp_server_api.ApiRunDetail,
+    run: "kfp_server_api.ApiRunDetail",
 ) -> typing.Optional[ArgoWorkflowDetails]:
     """
     Parse Argo workflow name. Allow this to fail because other
@@ -37,7 +38,7 @@ def _parse_argo_workflow(
         pass
 
 
-def _display_helper_commands(run: kfp_server_api.ApiRunDetail):
+def _display_helper_commands(run: "kfp_server_api.ApiRunDetail"):
     argo_workflow = _parse_argo_workflow(run=run)
     run_id = run.run.id
 
@@ -54,7 +55,7 @@ def _display_helper_commands(run: kfp_server_api.ApiRunDetail):
         )
 
 
-def _handle_job_end(run_detail: kfp_server_api.ApiRunDetail):
+def _handle_job_end(run_detail: "kfp_server_api.ApiRunDetail"):
     finished_run = run_detail.to_dict()["run"]
 
     created_at = finished_run["created_at"]
@@ -84,9 +85,20 @@ def run_pipeline(
     wait: bool,
     register_model: bool,
     run_name: typing.Optional[str] = None,
+    enable_caching: bool = False,
 ):
+    """Submit a run of the pipeline file.
+
+    With caching enabled, KFP reuses the outputs of steps that ran before with the
+    same component spec, image and inputs, except for the steps that opt out with a
+    maximum cache staleness of zero, e.g. the model registration.
+    """
+    # kfp is only imported when submitting, not for the CLI
+    import kfp
+
     logger.info(
-        f"Running pipeline from file: {pipeline_file} with run name: {run_name}"
+        f"Running pipeline from file: {pipeline_file} with run name: {run_name}, "
+        f"caching: {enable_caching}"
     )
     auth_session = get_istio_auth_session(
         url=kubeflow_url,
@@ -107,7 +119,7 @@ def run_pipeline(
             "model_registry_name": model_registry_name,
             "register_model": str(register_model),
         },
-        enable_caching=False,
+        enable_caching=enable_caching,
         run_name=run_name,
         experiment_name=experiment,
         namespace=namespace,
@@ -153,6 +165,12 @@ def run_pipeline(
     type=bool,
     help="""Whether to wait until the Kubeflow pipeline finishes execution""",
 )
+@click.option(
+    "--enable-caching/--disable-caching",
+    default=False,
+    help="""Whether KFP reuses the outputs of steps that ran before with the same
+    component, image and inputs""",
+)
 @click.argument(
     "overrides",
     nargs=-1,
@@ -190,6 +208,7 @@ def cli(
     kubeflow_username: str,
     kubeflow_password: str,
     wait: bool,
+    enable_caching: bool,
     overrides: list = None,
 ):
     """Submit and run a Kubeflow Pipeline file"""
@@ -211,6 +230,7 @@ def cli(
         kubeflow_password=kubeflow_password,
         wait=wait,
         register_model=register,
+        enable_caching=enable_caching,
     )
 
 
@@ -0,0 +1,57 @@
+from benchmarks.pipeline_stages import compare, run_benchmarks, write_synthetic_idx
+from training.utils import load_raw_data
+
+
+def test_write_synthetic_idx(tmp_path):
+    samples = write_synthetic_idx(tmp_path, scale=0.01)
+
+    train_images, train_labels, test_images, test_labels = load_raw_data(tmp_path)
+    assert samples == {"train": 600, "test": 100}
+    assert train_images.shape == (600, 28, 28)
+    assert test_labels.shape == (100, 1)
+    assert train_labels.max() < 10
+
+
+def test_run_benchmarks_reports_every_stage(tmp_path):
+    results = run_benchmarks(
+        tmp_path, scale=0.01, train_steps=2, batch_size=8, tracking_store="file"
+    )
+
+    assert list(results["stages"]) == [
+        "idx_read",
+        "preprocess",
+        "save_npz",
+        "load_npz",
+        "save_npy",
+        "load_npy",
+        "train_steps",
+        "evaluate",
+        "mlflow_logging",
+    ]
+    assert results["stages"]["train_steps"]["items"] == 16
+    assert all(stage["peak_rss_bytes"] > 0 for stage in results["stages"].values())
+    assert compare(results, results) == []
+
+
+def test_compare_reports_regressions_over_tolerance():
+    baseline = {
+        "stages": {
+            "idx_read": {"seconds": 1.0, "peak_rss_bytes": 100},
+            "evaluate": {"seconds": 1.0, "peak_rss_bytes": 100},
+        }
+    }
+    results = {
+        "stages": {
+            "idx_read": {"seconds": 1.1, "peak_rss_bytes": 150},
+            "evaluate": {"seconds": 2.0, "peak_rss_bytes": 100},
+            "new_stage": {"seconds": 5.0, "peak_rss_bytes": 100},
+        }
+    }
+
+    regressions = compare(results, baseline, tolerance=0.2)
+
+    assert [(r["stage"], r["metric"]) for r in regressions] == [
+        ("idx_read", "peak_rss_bytes"),
+        ("evaluate", "seconds"),
+    ]
+    assert regressions[1]["ratio"] == 2.0
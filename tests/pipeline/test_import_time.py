@@ -0,0 +1,13 @@
+import pytest
+
+from benchmarks.import_time import measure_import
+
+MAX_IMPORT_SECONDS = 2.0
+
+
+@pytest.mark.parametrize("module", ["pipeline.compile", "pipeline.submit"])
+def test_cli_import_does_not_load_kfp(module):
+    result = measure_import(module)
+
+    assert result["heavy_modules"] == []
+    assert result["seconds"] < MAX_IMPORT_SECONDS
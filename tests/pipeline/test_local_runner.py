@@ -0,0 +1,225 @@
+import json
+from pathlib import Path
+
+import yaml
+
+from pipeline.local_runner import (
+    TIMINGS_FILE,
+    LocalRunner,
+    LocalStep,
+    OutputRef,
+    load_component_spec,
+    make_training_steps,
+    resolve_command,
+)
+from pipeline.step_cache import StepCache
+
+SAMPLE_MNIST_DIR = Path("tests").joinpath("resources/data/mnist-small").resolve()
+
+_WRITE = (
+    "import pathlib, sys, time; time.sleep(float(sys.argv[2]));"
+    " pathlib.Path(sys.argv[1]).write_text(sys.argv[3])"
+)
+_CONCAT = (
+    "import pathlib, sys;"
+    " pathlib.Path(sys.argv[1]).write_text("
+    "''.join(pathlib.Path(p).read_text() for p in sys.argv[2:]))"
+)
+
+
+def _component(path, name, code, inputs, input_kinds):
+    spec = {
+        "name": name,
+        "inputs": [{"name": i, "type": t} for i, t in zip(inputs, input_kinds)],
+        "outputs": [{"name": "output_path", "type": "LocalPath"}],
+        "implementation": {
+            "container": {
+                "image": "unused",
+                "command": ["python3", "-c", code, {"outputPath": "output_path"}]
+                + [
+                    {"inputPath" if t == "LocalPath" else "inputValue": i}
+                    for i, t in zip(inputs, input_kinds)
+                ],
+            }
+        },
+    }
+    path.write_text(yaml.safe_dump(spec))
+    return path
+
+
+def test_resolve_command_of_pipeline_components():
+    pull_data = load_component_spec("pull_data_component.yaml")
+    assert resolve_command(pull_data, {}, {"output_path": "/out"})[-2:] == [
+        "--output-dir",
+        "/out",
+    ]
+    assert resolve_command(
+        pull_data, {"cache_dir": "/cache"}, {"output_path": "/out"}
+    )[-2:] == ["--cache-dir", "/cache"]
+
+    preprocess = load_component_spec("preprocess_data_component.yaml")
+    assert resolve_command(
+        preprocess, {"input_data": "/raw"}, {"output_path": "/out"}
+    ) == [
+        "python3",
+        "-m",
+        "training.preprocess_data",
+        "--input-data",
+        "/raw",
+        "--output-dir",
+        "/out",
+        "--data-format",
+        "npy",
+    ]
+
+
+def test_runner_runs_independent_steps_concurrently(tmp_path):
+    write = _component(
+        tmp_path / "write.yaml", "Write", _WRITE, ["delay", "text"], ["String"] * 2
+    )
+    concat = _component(
+        tmp_path / "concat.yaml", "Concat", _CONCAT, ["a", "b"], ["LocalPath"] * 2
+    )
+    steps = [
+        LocalStep("a", write, {"delay": "1", "text": "a"}),
+        LocalStep("b", write, {"delay": "1", "text": "b"}),
+        LocalStep("ab", concat, {"a": OutputRef("a"), "b": OutputRef("b")}),
+        LocalStep("skipped", concat, {"a": OutputRef("a")}, condition=False),
+    ]
+
+    results = LocalRunner(tmp_path / "run", max_workers=2).run(steps)
+
+    a, b, ab, skipped = results
+    assert [r.status for r in results] == ["succeeded"] * 3 + ["skipped"]
+    assert b.started < a.started + a.seconds and a.started < b.started + b.seconds
+    assert Path(ab.outputs["output_path"]).read_text() == "ab"
+    timings = json.loads((tmp_path / "run" / TIMINGS_FILE).read_text())
+    assert [step["name"] for step in timings["steps"]] == ["a", "b", "ab", "skipped"]
+
+
+def test_runner_does_not_run_steps_after_failure(tmp_path):
+    fail = _component(tmp_path / "fail.yaml", "Fail", "raise SystemExit(1)", [], [])
+    concat = _component(
+        tmp_path / "concat.yaml", "Concat", _CONCAT, ["a"], ["LocalPath"]
+    )
+    steps = [
+        LocalStep("fail", fail),
+        LocalStep("after", concat, {"a": OutputRef("fail")}),
+    ]
+
+    results = LocalRunner(tmp_path / "run").run(steps)
+
+    assert [r.status for r in results] == ["failed", "not run"]
+    assert (tmp_path / "run" / "fail" / "step.log").is_file()
+
+
+def test_training_pipeline_in_process(tmp_path):
+    steps = make_training_steps(
+        experiment="local",
+        mlflow_tracking_uri=f"file:{tmp_path}/mlruns",
+        mlflow_s3_endpoint_url="",
+        model_registry_name="model",
+        register_model=False,
+        input_data=str(SAMPLE_MNIST_DIR),
+    )
+
+    results = LocalRunner(tmp_path / "run", mode="in-process").run(steps)
+
+    assert [(r.name, r.status) for r in results] == [
+        ("preprocess-data", "succeeded"),
+        ("training", "succeeded"),
+        ("evaluation", "succeeded"),
+        ("registration", "skipped"),
+    ]
+    evaluation = Path(results[2].outputs["output_path"])
+    assert (evaluation / "result.json").is_file()
+
+
+def test_runner_reuses_cached_steps(tmp_path):
+    write = _component(
+        tmp_path / "write.yaml", "Write", _WRITE, ["delay", "text"], ["String"] * 2
+    )
+    concat = _component(
+        tmp_path / "concat.yaml", "Concat", _CONCAT, ["a", "b"], ["LocalPath"] * 2
+    )
+    source = tmp_path / "source.txt"
+    source.write_text("s")
+    cache = StepCache(tmp_path / "cache")
+
+    def run(text):
+        steps = [
+            LocalStep("a", write, {"delay": "0", "text": text}),
+            LocalStep("ab", concat, {"a": OutputRef("a"), "b": str(source)}),
+            LocalStep(
+                "always",
+                concat,
+                {"a": OutputRef("ab"), "b": str(source)},
+                cacheable=False,
+            ),
+        ]
+        runner = LocalRunner(tmp_path / "run", cache=cache, image_tag="test")
+        return runner.run(steps)
+
+    assert [r.cache for r in run("a")] == ["miss", "miss", "disabled"]
+    results = run("a")
+    assert [r.cache for r in results] == ["hit", "hit", "disabled"]
+    assert Path(results[2].outputs["output_path"]).read_text() == "ass"
+
+    assert [r.cache for r in run("x")] == ["miss", "miss", "disabled"]
+    source.write_text("t")
+    results = run("x")
+    assert [r.cache for r in results] == ["hit", "miss", "disabled"]
+    assert Path(results[2].outputs["output_path"]).read_text() == "xtt"
+
+
+def test_fused_training_pipeline_in_process(tmp_path):
+    steps = make_training_steps(
+        experiment="local",
+        mlflow_tracking_uri=f"file:{tmp_path}/mlruns",
+        mlflow_s3_endpoint_url="",
+        model_registry_name="model",
+        register_model=False,
+        input_data=str(SAMPLE_MNIST_DIR),
+        fuse_data_train=True,
+    )
+
+    results = LocalRunner(tmp_path / "run", mode="in-process").run(steps)
+
+    assert [(r.name, r.status) for r in results] == [
+        ("training", "succeeded"),
+        ("evaluation", "succeeded"),
+        ("registration", "skipped"),
+    ]
+    training = Path(results[0].outputs["output_path"])
+    assert (training / "run_id.json").is_file()
+    assert (Path(results[1].outputs["output_path"]) / "result.json").is_file()
+
+
+def test_sweep_training_pipeline_in_process(tmp_path):
+    steps = make_training_steps(
+        experiment="local",
+        mlflow_tracking_uri=f"file:{tmp_path}/mlruns",
+        mlflow_s3_endpoint_url="",
+        model_registry_name="model",
+        register_model=False,
+        input_data=str(SAMPLE_MNIST_DIR),
+        candidates=["model_config.num_layers=1", "model_config.num_layers=2"],
+    )
+
+    results = LocalRunner(tmp_path / "run", mode="in-process").run(steps)
+
+    assert [(r.name, r.status) for r in results] == [
+        ("preprocess-data", "succeeded"),
+        ("training-0", "succeeded"),
+        ("training-1", "succeeded"),
+        ("select-best", "succeeded"),
+        ("evaluation", "succeeded"),
+        ("registration", "skipped"),
+    ]
+    selection = json.loads(
+        (Path(results[3].outputs["output_path"]) / "candidates.json").read_text()
+    )
+    assert sorted(c["config_overrides"] for c in selection["candidates"]) == [
+        "model_config.num_layers=1",
+        "model_config.num_layers=2",
+    ]
@@ -1,8 +1,10 @@
 import tempfile
 from pathlib import Path
 
+import yaml
 from click.testing import CliRunner
 
+import pipeline.pipeline
 from pipeline import compile
 from pipeline.config import get_config
 
@@ -45,3 +47,65 @@ def test_smoke_cli_gpu(tmp_path):
 
     assert result.exit_code == 0, f"Program exited with code: {result.exit_code}"
     assert output_yaml.is_file(), f"Expected to exist: {output_yaml}"
+
+
+def test_smoke_cli_fused_data_train(tmp_path):
+    runner = CliRunner()
+    output_yaml = tmp_path / "pipeline.yaml"
+
+    result = runner.invoke(
+        compile.cli,
+        [TEST_IMAGE_TAG, "-o", str(output_yaml), "compile_config.fuse_data_train=true"],
+    )
+
+    assert result.exit_code == 0, f"Program exited with code: {result.exit_code}"
+    assert "training.fused" in output_yaml.read_text()
+    assert "training.pull_data" not in output_yaml.read_text()
+
+
+def test_smoke_cli_sweep(tmp_path):
+    runner = CliRunner()
+    output_yaml = tmp_path / "pipeline.yaml"
+
+    result = runner.invoke(
+        compile.cli,
+        [TEST_IMAGE_TAG, "-o", str(output_yaml), "sweep_config=default"],
+    )
+
+    assert result.exit_code == 0, f"Program exited with code: {result.exit_code}"
+    assert "training.select_best" in output_yaml.read_text()
+    assert "for-loop" in output_yaml.read_text()
+
+
+def _training_args(output_yaml: Path) -> list:
+    workflow = yaml.safe_load(output_yaml.read_text())
+    (template,) = [t for t in workflow["spec"]["templates"] if t["name"] == "training"]
+    return template["container"]["command"] + template["container"].get("args", [])
+
+
+def test_training_step_cacheable_without_checkpointing(tmp_path):
+    output_yaml = tmp_path / "pipeline.yaml"
+    cfg = get_config(overrides=["compile_config.training_retries=2"])
+
+    compile.compile(image_tag=TEST_IMAGE_TAG, output_file=str(output_yaml), cfg=cfg)
+
+    # The id of the pipeline run would change the cache key of every run
+    args = _training_args(output_yaml)
+    assert "--resume-key" not in args
+    assert not any("{{workflow.uid}}" in arg for arg in args)
+
+
+def test_training_step_resumes_with_checkpointing(tmp_path, monkeypatch):
+    training_config = {"checkpoint": {"enabled": True}}
+    monkeypatch.setattr(
+        pipeline.pipeline,
+        "get_training_config",
+        lambda: ("model", {}, training_config),
+    )
+    output_yaml = tmp_path / "pipeline.yaml"
+    cfg = get_config(overrides=["compile_config.training_retries=2"])
+
+    compile.compile(image_tag=TEST_IMAGE_TAG, output_file=str(output_yaml), cfg=cfg)
+
+    args = _training_args(output_yaml)
+    assert args[args.index("--resume-key") + 1] == "{{workflow.uid}}"
@@ -0,0 +1,48 @@
+from pipeline.step_cache import StepCache, hash_path, step_cache_key
+
+
+def _output(tmp_path, name, content):
+    path = tmp_path / name
+    (path / "nested").mkdir(parents=True)
+    (path / "nested" / "data.bin").write_bytes(content)
+    return path
+
+
+def test_add_and_lookup(tmp_path):
+    cache = StepCache(tmp_path / "cache")
+    output = _output(tmp_path, "output", b"x" * 10)
+
+    assert cache.lookup("key") is None
+    cached = cache.add("key", "step", {"output_path": output})
+
+    assert cache.lookup("key") == cached
+    expected_path = tmp_path / "cache" / "entries" / "key" / "output_path"
+    assert cached["output_path"]["path"] == str(expected_path)
+    assert (expected_path / "nested" / "data.bin").read_bytes() == b"x" * 10
+    assert cached["output_path"]["sha256"] == hash_path(output)
+
+
+def test_key_depends_on_spec_image_parameters_and_inputs():
+    key = step_cache_key({"name": "a"}, "tag", {"p": "1"}, {"i": "h"})
+
+    assert key == step_cache_key({"name": "a"}, "tag", {"p": "1"}, {"i": "h"})
+    assert key != step_cache_key({"name": "b"}, "tag", {"p": "1"}, {"i": "h"})
+    assert key != step_cache_key({"name": "a"}, "tag2", {"p": "1"}, {"i": "h"})
+    assert key != step_cache_key({"name": "a"}, "tag", {"p": "2"}, {"i": "h"})
+    assert key != step_cache_key({"name": "a"}, "tag", {"p": "1"}, {"i": "h2"})
+
+
+def test_invalidate_and_evict(tmp_path):
+    cache = StepCache(tmp_path / "cache")
+    for key, step in [("k1", "a"), ("k2", "b"), ("k3", "b")]:
+        cache.add(key, step, {"out": _output(tmp_path, key, b"x" * 100)})
+    cache.lookup("k1")
+
+    assert cache.invalidate(step="b", key="k2") == 1
+    assert set(cache.entries()) == {"k1", "k3"}
+    # k3 was used least recently, k1 was looked up after it was added
+    assert cache.evict(max_size_bytes=150) == 100
+    assert set(cache.entries()) == {"k1"}
+    assert not (tmp_path / "cache" / "entries" / "k3").exists()
+    assert cache.invalidate() == 1
+    assert cache.lookup("k1") is None
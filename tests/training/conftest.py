@@ -0,0 +1 @@
+from .http_stub import http_server  # noqa: F401
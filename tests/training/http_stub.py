@@ -0,0 +1,66 @@
+"""Local HTTP server standing in for the remote data storage"""
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+FILES = {
+    "a.gz": b"a" * 5000,
+    "b.gz": bytes(range(256)) * 20,
+}
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves FILES with support for range requests and injected failures"""
+
+    failures: dict = {}
+    requests: list = []
+
+    def do_HEAD(self):
+        name = self.path.lstrip("/")
+        if name not in FILES:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("ETag", f'"{hashlib.md5(FILES[name]).hexdigest()}"')
+        self.send_header("Content-Length", str(len(FILES[name])))
+        self.end_headers()
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        self.requests.append((name, self.headers.get("Range")))
+        if self.failures.get(name, 0) > 0:
+            self.failures[name] -= 1
+            self.send_error(503)
+            return
+        if name not in FILES:
+            self.send_error(404)
+            return
+
+        body = FILES[name]
+        range_header = self.headers.get("Range")
+        if range_header:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/*")
+            body = body[start:]
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    RangeHandler.failures = {}
+    RangeHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
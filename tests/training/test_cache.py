@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+from training.cache import DatasetCache
+from training.download import ManifestEntry
+from training.pull_data import pull_data
+
+from .http_stub import FILES, RangeHandler
+
+
+def _output_dirs(tmp_path):
+    dirs = tmp_path / "run1", tmp_path / "run2"
+    for d in dirs:
+        d.mkdir()
+    return dirs
+
+
+def _write_manifest(path, base_url, with_checksums=True):
+    files = []
+    for name, content in FILES.items():
+        item = {"url": f"{base_url}/{name}"}
+        if with_checksums:
+            item["sha256"] = hashlib.sha256(content).hexdigest()
+        files.append(item)
+    path.write_text(json.dumps({"files": files}))
+    return path
+
+
+def test_pull_data_second_run_is_served_from_cache(http_server, tmp_path):
+    manifest = _write_manifest(tmp_path / "manifest.json", http_server)
+    cache_dir = tmp_path / "cache"
+    run1, run2 = _output_dirs(tmp_path)
+
+    pull_data(run1, manifest_path=manifest, cache_dir=cache_dir)
+    requests_first_run = len(RangeHandler.requests)
+    results = pull_data(run2, manifest_path=manifest, cache_dir=cache_dir)
+
+    assert requests_first_run == len(FILES)
+    assert len(RangeHandler.requests) == requests_first_run
+    assert results == []
+    for name, content in FILES.items():
+        cached_file = run2 / name
+        assert cached_file.read_bytes() == content
+        assert os.stat(cached_file).st_nlink > 1
+
+
+def test_pull_data_without_checksums_uses_etag(http_server, tmp_path):
+    manifest = _write_manifest(
+        tmp_path / "manifest.json", http_server, with_checksums=False
+    )
+    cache_dir = tmp_path / "cache"
+    run1, run2 = _output_dirs(tmp_path)
+
+    pull_data(run1, manifest_path=manifest, cache_dir=cache_dir)
+    pull_data(run2, manifest_path=manifest, cache_dir=cache_dir)
+
+    assert len(RangeHandler.requests) == len(FILES)
+    for name, content in FILES.items():
+        assert (run2 / name).read_bytes() == content
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = DatasetCache(tmp_path / "cache", max_size_bytes=6000)
+    entries = {}
+    for name, content in FILES.items():
+        (tmp_path / name).write_bytes(content)
+        entries[name] = ManifestEntry(
+            url=f"http://example.com/{name}",
+            filename=name,
+            sha256=hashlib.sha256(content).hexdigest(),
+        )
+        cache.add(entries[name], tmp_path / name)
+
+    # Using a.gz makes b.gz the least recently used object
+    assert cache.lookup(entries["a.gz"]) is not None
+    freed = cache.evict()
+
+    assert freed == len(FILES["b.gz"])
+    assert cache.lookup(entries["b.gz"]) is None
+    assert cache.lookup(entries["a.gz"]) is not None
+    assert cache.size() == len(FILES["a.gz"])
+
+
+def test_pull_data_keeps_linked_objects_over_the_limit(http_server, tmp_path):
+    manifest = _write_manifest(tmp_path / "manifest.json", http_server)
+    run1, run2 = _output_dirs(tmp_path)
+    cache_args = dict(
+        cache_dir=tmp_path / "cache",
+        cache_max_size_bytes=1,
+        cache_link_mode="symlink",
+    )
+
+    pull_data(run1, manifest_path=manifest, **cache_args)
+    pull_data(run2, manifest_path=manifest, **cache_args)
+
+    # The dataset is larger than the cache, the symlinks still resolve
+    assert len(RangeHandler.requests) == len(FILES)
+    for name, content in FILES.items():
+        assert (run2 / name).is_symlink()
+        assert (run2 / name).read_bytes() == content
@@ -0,0 +1,142 @@
+from pathlib import Path
+
+import keras
+import mlflow
+import numpy as np
+import pytest
+from mlflow.tracking import MlflowClient
+
+import training.model
+from training.checkpoint import (
+    CheckpointState,
+    find_checkpoint,
+    load_state,
+    restore_checkpoint,
+    save_checkpoint,
+)
+from training.config import get_training_config
+from training.model import build_model
+from training.train import train_on_data
+from training.utils import load_model_training_run_id
+
+
+def _trained_model():
+    model = build_model({"num_layers": 1})
+    x = np.random.default_rng(0).integers(0, 256, (64, 28, 28), dtype=np.uint8)
+    model.fit(x, np.arange(64) % 10, epochs=1, verbose=0)
+    return model
+
+
+def test_checkpoint_round_trip(tmp_path):
+    model = _trained_model()
+    for i in range(1, 4):
+        state = CheckpointState("run", epoch=i, step=2 * i, checkpoint=f"ckpt-{i}")
+        save_checkpoint(model, tmp_path, state, keep=2)
+
+    restored = build_model({"num_layers": 1})
+    assert restore_checkpoint(restored, tmp_path) == state
+    for weight, restored_weight in zip(model.get_weights(), restored.get_weights()):
+        np.testing.assert_array_equal(weight, restored_weight)
+    assert int(restored.optimizer.iterations) == int(model.optimizer.iterations)
+    assert sorted(p.name for p in tmp_path.glob("*.index")) == [
+        "ckpt-2.index",
+        "ckpt-3.index",
+    ]
+
+
+@pytest.mark.parametrize(
+    "resume_key, config_hash, resumed",
+    [
+        ("pipeline-run", "config", True),
+        ("other-pipeline-run", "config", False),
+        ("pipeline-run", "other-config", False),
+    ],
+)
+def test_checkpoint_of_another_training_is_not_resumed(
+    tmp_path, resume_key, config_hash, resumed
+):
+    checkpoint_dir = tmp_path / "checkpoints"
+    state = CheckpointState(
+        "stale-run",
+        epoch=1,
+        step=2,
+        checkpoint="ckpt-1",
+        resume_key="pipeline-run",
+        config_hash="config",
+    )
+    save_checkpoint(_trained_model(), checkpoint_dir, state)
+
+    found = find_checkpoint(
+        checkpoint_dir,
+        tracking_uri=f"file:{tmp_path}/mlruns",
+        experiment_name="resume",
+        resume_key=resume_key,
+        config_hash=config_hash,
+    )
+
+    assert found == (state if resumed else None)
+    assert checkpoint_dir.exists() is resumed
+
+
+class _Preempt(keras.callbacks.Callback):
+    def on_epoch_begin(self, epoch, logs=None):
+        if epoch == 1:
+            raise RuntimeError("Preempted")
+
+
+def test_training_resumes_in_the_same_run(tmp_path, monkeypatch):
+    tracking_uri = f"file:{tmp_path}/mlruns"
+    model_name, model_parameters, training_parameters = get_training_config()
+    training_parameters = {
+        **training_parameters,
+        "epochs": 2,
+        "checkpoint": {"enabled": True, "every_n_steps": 1},
+    }
+    x = np.random.default_rng(0).integers(0, 256, (64, 28, 28), dtype=np.uint8)
+    data = {"x": x, "y": np.arange(64) % 10}
+    checkpoint_dir = tmp_path / "checkpoints"
+
+    def train(output_dir):
+        train_on_data(
+            model=model_name,
+            experiment_name="resume",
+            tracking_uri=tracking_uri,
+            train_data=data,
+            test_data=data,
+            output_dir=output_dir,
+            experiment_parameters={},
+            training_parameters=training_parameters,
+            model_parameters=model_parameters,
+            checkpoint_dir=checkpoint_dir,
+            resume_key="pipeline-run",
+        )
+
+    make_callbacks = training.model.make_callbacks
+    monkeypatch.setattr(
+        training.model, "make_callbacks", lambda params: [_Preempt()]
+    )
+    with pytest.raises(RuntimeError):
+        train(tmp_path / "first")
+    first_run_id = load_state(checkpoint_dir).run_id
+    mlflow.end_run(status="KILLED")
+    client = MlflowClient(tracking_uri)
+    # Like the local folder, the uploaded checkpoints are pruned
+    uploaded = client.list_artifacts(first_run_id, "checkpoints")
+    assert sorted(Path(info.path).name for info in uploaded if info.is_dir) == [
+        "ckpt-2",
+        "ckpt-3",
+    ]
+    # A retried pod only finds the checkpoint uploaded to the run
+    for path in checkpoint_dir.iterdir():
+        path.unlink()
+
+    monkeypatch.setattr(training.model, "make_callbacks", make_callbacks)
+    train(tmp_path / "retry")
+
+    assert load_model_training_run_id(tmp_path / "retry") == first_run_id
+    assert [m.step for m in client.get_metric_history(first_run_id, "loss")] == [0, 1]
+    assert client.get_run(first_run_id).info.status == "FINISHED"
+    assert not checkpoint_dir.exists()
+    assert client.list_artifacts(first_run_id, "checkpoints") == []
+    model = client.list_artifacts(first_run_id, "model")
+    assert "model/MLmodel" in [info.path for info in model]
@@ -0,0 +1,73 @@
+import importlib
+import json
+import shutil
+import sys
+
+import pytest
+
+from training import config_cache
+from training.config_cache import TRAINING_CONFIG_DIR, load_config
+
+
+@pytest.fixture
+def config_dir(tmp_path):
+    return shutil.copytree(TRAINING_CONFIG_DIR, tmp_path / "conf")
+
+
+def test_load_config_reuses_snapshot(config_dir, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    config = load_config(
+        config_dir, overrides=["training_config.epochs=3"], cache_dir=cache_dir
+    )
+    (snapshot,) = (tmp_path / "cache").iterdir()
+    assert json.loads(snapshot.read_text()) == config
+    assert config["training_config"]["epochs"] == 3
+
+    def fail(*args):
+        raise AssertionError("The config should be loaded from the snapshot")
+
+    monkeypatch.setattr(config_cache, "compose_config", fail)
+    assert load_config(
+        config_dir, overrides=["training_config.epochs=3"], cache_dir=cache_dir
+    ) == config
+
+
+def test_load_config_key_changes_with_config_files_and_overrides(config_dir, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    load_config(config_dir, cache_dir=cache_dir)
+    load_config(config_dir, overrides=["training_config.epochs=3"], cache_dir=cache_dir)
+    model_config = config_dir / "model_config" / "baseline.yaml"
+    model_config.write_text(model_config.read_text().replace("5", "2"))
+
+    config = load_config(config_dir, cache_dir=cache_dir)
+
+    assert config["model_config"]["num_layers"] == 2
+    assert len(list((tmp_path / "cache").iterdir())) == 3
+
+
+def test_load_config_without_cache(config_dir, tmp_path):
+    config = load_config(config_dir, cache_dir="")
+
+    assert config["model_config"]["name"] == "baseline"
+    assert not (tmp_path / "cache").exists()
+
+
+def test_load_config_key_changes_with_structured_configs(
+    config_dir, tmp_path, monkeypatch
+):
+    module_path = tmp_path / "structured_configs.py"
+    module_path.write_text("def register():\n    pass\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # The module is removed from the imported modules at the end of the test
+    monkeypatch.delitem(sys.modules, "structured_configs", raising=False)
+    module = importlib.import_module("structured_configs")
+    cache_dir = str(tmp_path / "cache")
+    load_config(config_dir, cache_dir=cache_dir, register=module.register)
+    load_config(config_dir, cache_dir=cache_dir, register=module.register)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+    # E.g. a field added to the dataclasses of the structured configs
+    module_path.write_text("FIELD = 1\n\n\ndef register():\n    pass\n")
+    load_config(config_dir, cache_dir=cache_dir, register=module.register)
+
+    assert len(list((tmp_path / "cache").iterdir())) == 2
@@ -0,0 +1,100 @@
+import hashlib
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from training.download import (
+    ChecksumMismatchError,
+    ManifestEntry,
+    download_all,
+    download_file,
+)
+from training.pull_data import cli
+
+from .http_stub import FILES, RangeHandler
+
+
+def _entry(base_url, name, sha256=None):
+    sha256 = sha256 or hashlib.sha256(FILES[name]).hexdigest()
+    return ManifestEntry(url=f"{base_url}/{name}", filename=name, sha256=sha256)
+
+
+def test_download_all_verifies_files(http_server, tmp_path):
+    entries = [_entry(http_server, name) for name in FILES]
+
+    results = download_all(entries, output_dir=tmp_path)
+
+    assert [r.filename for r in results] == list(FILES)
+    for name, content in FILES.items():
+        assert (tmp_path / name).read_bytes() == content
+    assert all(r.throughput > 0 for r in results)
+
+
+def test_download_resumes_partial_file(http_server, tmp_path):
+    content = FILES["a.gz"]
+    (tmp_path / "a.gz.part").write_bytes(content[:1000])
+
+    result = download_file(_entry(http_server, "a.gz"), output_dir=tmp_path)
+
+    assert result.resumed
+    assert result.bytes_downloaded == len(content) - 1000
+    assert (tmp_path / "a.gz").read_bytes() == content
+    assert RangeHandler.requests == [("a.gz", "bytes=1000-")]
+
+
+def test_download_retries_server_errors(http_server, tmp_path):
+    RangeHandler.failures = {"b.gz": 2}
+
+    result = download_file(
+        _entry(http_server, "b.gz"), output_dir=tmp_path, backoff_seconds=0
+    )
+
+    assert result.attempts == 3
+    assert (tmp_path / "b.gz").read_bytes() == FILES["b.gz"]
+
+
+def test_download_skips_verified_file(http_server, tmp_path):
+    (tmp_path / "a.gz").write_bytes(FILES["a.gz"])
+
+    result = download_file(_entry(http_server, "a.gz"), output_dir=tmp_path)
+
+    assert result.skipped
+    assert RangeHandler.requests == []
+
+
+def test_download_checksum_mismatch(http_server, tmp_path):
+    entry = _entry(http_server, "a.gz", sha256="0" * 64)
+
+    with pytest.raises(ChecksumMismatchError):
+        download_file(entry, output_dir=tmp_path, retries=1, backoff_seconds=0)
+
+    assert not (tmp_path / "a.gz").exists()
+    assert not (tmp_path / "a.gz.part").exists()
+
+
+def test_pull_data_cli_with_manifest(http_server, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            {
+                "files": [
+                    {
+                        "url": f"{http_server}/{name}",
+                        "sha256": hashlib.sha256(content).hexdigest(),
+                    }
+                    for name, content in FILES.items()
+                ]
+            }
+        )
+    )
+    output_dir = tmp_path / "data"
+
+    result = CliRunner().invoke(
+        cli, ["--output-dir", output_dir, "--manifest", manifest]
+    )
+
+    if result.exit_code:
+        raise result.exception
+    for name in FILES:
+        assert (output_dir / name).is_file()
@@ -1,6 +1,15 @@
+import json
+
 import pytest
+from mlflow.tracking import MlflowClient
+
+from training.config import get_training_config
+from training.evaluate import EVALUATION_OUTPUT_FILE, compare_metrics, run_evaluate
+from training.split import load_split
+from training.train import train_with_tracking
+from training.utils import load_model_training_run_id
 
-from training.evaluate import compare_metrics
+from .test_train import PREPROCESSED_DATA_PATH
 
 
 @pytest.mark.parametrize(
@@ -49,3 +58,38 @@ from training.evaluate import compare_metrics
 def test_evaluate_metric(input_metrics, threshold_metrics, evaluation_passed):
     eval = compare_metrics(input_metrics, threshold_metrics)
     assert eval["passed"] is evaluation_passed
+
+
+def test_evaluate_on_saved_validation_split(tmp_path):
+    tracking_uri = f"file:{tmp_path}/mlruns"
+    model_name, model_parameters, training_parameters = get_training_config()
+    training_output_dir = tmp_path / "training"
+    train_with_tracking(
+        model=model_name,
+        experiment_name="validation",
+        tracking_uri=tracking_uri,
+        input_data=PREPROCESSED_DATA_PATH,
+        output_dir=training_output_dir,
+        experiment_parameters={},
+        training_parameters=training_parameters,
+        model_parameters=model_parameters,
+    )
+    thresholds = tmp_path / "thresholds.json"
+    thresholds.write_text(json.dumps({"validation_acc": 0.0}))
+
+    run_evaluate(
+        training_output_dir=training_output_dir,
+        output_dir=tmp_path,
+        threshold_metrics_file_path=thresholds,
+        mlflow_tracking_uri=tracking_uri,
+        validation_data_dir=PREPROCESSED_DATA_PATH,
+    )
+
+    split = load_split(training_output_dir)
+    assert len(split.validation) > 0
+    assert json.loads((tmp_path / EVALUATION_OUTPUT_FILE).read_text()) == {
+        "passed": True
+    }
+    run_id = load_model_training_run_id(training_output_dir)
+    metrics = MlflowClient(tracking_uri).get_run(run_id).data.metrics
+    assert {"validation_acc", "validation_loss"} <= set(metrics)
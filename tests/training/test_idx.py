@@ -0,0 +1,91 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from training.idx import (
+    iter_idx_chunks,
+    memmap_idx,
+    read_idx,
+    read_idx_shape,
+    write_idx,
+)
+
+SAMPLE_MNIST_DIR = Path("tests").joinpath("resources/data/mnist-small")
+SAMPLE_IMAGES = SAMPLE_MNIST_DIR / "train-images-idx3-ubyte.gz"
+SAMPLE_LABELS = SAMPLE_MNIST_DIR / "train-labels-idx1-ubyte.gz"
+
+
+def test_read_idx_uses_header_shape():
+    assert read_idx_shape(SAMPLE_IMAGES) == (20, 28, 28)
+    assert read_idx(SAMPLE_IMAGES).shape == (20, 28, 28)
+    assert read_idx(SAMPLE_LABELS).shape == (20,)
+
+
+@pytest.mark.parametrize("chunk_items", [1, 7, 20, 100])
+def test_chunks_match_one_shot_read(chunk_items):
+    chunks = list(iter_idx_chunks(SAMPLE_IMAGES, chunk_items=chunk_items))
+
+    assert all(len(chunk) <= chunk_items for chunk in chunks)
+    np.testing.assert_array_equal(np.concatenate(chunks), read_idx(SAMPLE_IMAGES))
+
+
+def test_truncated_file_is_rejected(tmp_path):
+    header = bytes([0, 0, 0x08, 1]) + (10).to_bytes(4, "big")
+    path = tmp_path / "truncated-idx1-ubyte"
+    path.write_bytes(header + bytes(5))
+
+    with pytest.raises(ValueError, match="Unexpected end"):
+        read_idx(path)
+
+
+def _write_idx(path, array, dtype_code):
+    header = bytes([0, 0, dtype_code, array.ndim])
+    header += b"".join(dim.to_bytes(4, "big") for dim in array.shape)
+    path.write_bytes(header + array.astype(array.dtype.newbyteorder(">")).tobytes())
+    return path
+
+
+@pytest.mark.parametrize(
+    "dtype,dtype_code,shape",
+    [
+        (np.int8, 0x09, (6,)),
+        (np.int16, 0x0B, (4, 3)),
+        (np.int32, 0x0C, (2, 3, 4)),
+        (np.float32, 0x0D, (3, 2)),
+        (np.float64, 0x0E, (2, 2, 2, 2)),
+    ],
+)
+def test_read_idx_dtypes_and_ranks(tmp_path, dtype, dtype_code, shape):
+    expected = np.arange(np.prod(shape)).astype(dtype).reshape(shape) - 3
+    path = _write_idx(tmp_path / "data.idx", expected, dtype_code)
+
+    np.testing.assert_array_equal(read_idx(path), expected)
+    np.testing.assert_array_equal(memmap_idx(path), expected)
+
+
+def test_trailing_data_is_rejected(tmp_path):
+    path = _write_idx(tmp_path / "data.idx", np.zeros(4, dtype=np.uint8), 0x08)
+    path.write_bytes(path.read_bytes() + b"\x00")
+
+    with pytest.raises(ValueError, match="longer"):
+        read_idx(path)
+    with pytest.raises(ValueError, match="bytes of data"):
+        memmap_idx(path)
+
+
+def test_read_idx_memory_maps_decompressed_cache(tmp_path):
+    array = read_idx(SAMPLE_IMAGES, cache_dir=tmp_path)
+
+    assert isinstance(array, np.memmap)
+    assert (tmp_path / "train-images-idx3-ubyte").is_file()
+    np.testing.assert_array_equal(array, read_idx(SAMPLE_IMAGES))
+
+
+@pytest.mark.parametrize("name", ["data-idx3-ubyte", "data-idx3-ubyte.gz"])
+def test_write_idx_round_trip(tmp_path, name):
+    array = np.arange(2 * 3 * 4, dtype=np.float32).reshape(2, 3, 4)
+
+    path = write_idx(tmp_path / name, array, chunk_items=1)
+
+    np.testing.assert_array_equal(read_idx(path), array)
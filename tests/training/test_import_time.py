@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.import_time import measure_import
+
+MAX_IMPORT_SECONDS = 2.0
+"""Generous bound, importing TensorFlow or MLflow alone takes several seconds"""
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "training.pull_data",
+        "training.preprocess_data",
+        "training.train",
+        "training.evaluate",
+        "training.register",
+    ],
+)
+def test_cli_import_does_not_load_heavy_dependencies(module):
+    result = measure_import(module)
+
+    assert result["heavy_modules"] == []
+    assert result["seconds"] < MAX_IMPORT_SECONDS
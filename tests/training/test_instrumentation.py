@@ -0,0 +1,52 @@
+import mlflow
+import numpy as np
+from mlflow.tracking import MlflowClient
+
+from training.instrumentation import ThroughputCallback
+from training.model import get_model, train_model
+from training.tracker import end_run
+
+
+def _train(tmp_path, epochs=2):
+    train_data = {
+        "x": np.ones((64, 28, 28), dtype=np.uint8),
+        "y": np.ones((64, 1), dtype=np.uint8),
+    }
+    params = {
+        "epochs": epochs,
+        "batch_size": 8,
+        "validation_split": 0.0,
+        "instrumentation": {"enabled": False},
+    }
+    callback = ThroughputCallback(
+        batch_size=8, prometheus_textfile=tmp_path / "training.prom"
+    )
+    model = get_model("baseline", {"num_layers": 1}, training_parameters=params)
+    train_model(model, train_data, params, callbacks=[callback])
+    return callback
+
+
+def test_throughput_callback_records_percentiles(tmp_path):
+    callback = _train(tmp_path)
+
+    assert len(callback.epoch_metrics) == 2
+    metrics = callback.epoch_metrics[-1]
+    assert 0 < metrics["step_seconds_p50"] <= metrics["step_seconds_p99"]
+    assert metrics["samples_per_second"] > 0
+    assert metrics["peak_rss_bytes"] > 0
+    textfile = (tmp_path / "training.prom").read_text()
+    assert "# TYPE training_samples_per_second gauge" in textfile
+
+
+def test_throughput_metrics_are_logged_to_active_run(tmp_path):
+    mlflow.set_tracking_uri(f"file:{tmp_path}/mlruns")
+    mlflow.set_experiment("throughput")
+    run_id = mlflow.start_run().info.run_id
+
+    _train(tmp_path)
+    end_run()
+
+    client = MlflowClient()
+    history = client.get_metric_history(run_id, "throughput_samples_per_second")
+    assert sorted(m.step for m in history) == [0, 1]
+    assert "throughput_data_wait_seconds_p90" in client.get_run(run_id).data.metrics
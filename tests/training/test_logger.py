@@ -0,0 +1,47 @@
+import io
+import json
+
+import pytest
+
+from training.logger import configure_logging, logger, parse_sample_rates
+
+
+@pytest.fixture
+def log_stream():
+    stream = io.StringIO()
+    yield stream
+    configure_logging()
+
+
+def _events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_async_logging_writes_events_with_call_site(log_stream):
+    configure_logging(mode="async", callsite="cached", stream=log_stream)
+    for step in range(3):
+        logger.info("step", step=step)
+    logger.info("done")
+    # Reconfiguring stops the listener after it has written all queued events
+    configure_logging(mode="sync", stream=log_stream)
+
+    events = _events(log_stream)
+    assert [e["event"] for e in events] == ["step", "step", "step", "done"]
+    assert events[0]["module"] == __name__
+    assert events[0]["lineno"] == events[2]["lineno"]
+    assert events[3]["lineno"] == events[0]["lineno"] + 1
+
+
+def test_sampling_drops_events_of_sampled_levels(log_stream):
+    configure_logging(sample_rates="info=0", callsite="off", stream=log_stream)
+    logger.info("dropped")
+    logger.warning("kept")
+
+    assert [e["event"] for e in _events(log_stream)] == ["kept"]
+    assert "lineno" not in _events(log_stream)[0]
+
+
+def test_parse_sample_rates():
+    assert parse_sample_rates("debug=0.01, INFO=0.5") == {"debug": 0.01, "info": 0.5}
+    with pytest.raises(ValueError):
+        parse_sample_rates("info")
@@ -1,9 +1,19 @@
+import json
+import shutil
 from pathlib import Path
 
 import numpy as np
+import pytest
 from click.testing import CliRunner
 
-from training.preprocess_data import cli
+from training.idx import write_idx
+from training.preprocess_data import cli, preprocess_data, run_streaming_preprocess
+from training.utils import (
+    load_raw_data,
+    load_train_test_dataset,
+    read_mnist,
+    verify_processed_data,
+)
 
 SAMPLE_MNIST_DIR = Path("tests").joinpath("resources/data/mnist-small")
 
@@ -29,3 +39,84 @@ def test_prepare_writes_expected_output(tmp_path):
 
     assert x.shape == (20, 28, 28)
     assert y.shape == (20, 1)
+
+
+def test_prepare_writes_memory_mappable_output(tmp_path):
+    runner = CliRunner()
+
+    result = runner.invoke(
+        cli,
+        [
+            "--input-data", SAMPLE_MNIST_DIR,
+            "--output-dir", tmp_path,
+            "--data-format", "npy",
+        ]
+    )
+
+    assert result.exit_code == 0
+    assert (tmp_path / "manifest.json").is_file()
+
+    verify_processed_data(tmp_path)
+    train_data, test_data = load_train_test_dataset(data_dir=tmp_path)
+    x, y = train_data["x"], train_data["y"]
+
+    assert isinstance(x, np.memmap)
+    assert x.shape == (20, 28, 28)
+    assert y.shape == (20, 1)
+    assert test_data["x"].shape[1:] == (28, 28)
+
+
+@pytest.mark.parametrize("image_dtype", ["uint8", "float32"])
+def test_preprocess_keeps_raw_pixels(image_dtype):
+    images = np.arange(2 * 28 * 28, dtype=np.uint8).reshape(2, 28, 28)
+    labels = np.zeros((2, 1), dtype=np.uint8)
+
+    train_images, *_ = preprocess_data(
+        (images, labels, images, labels), image_dtype=image_dtype
+    )
+
+    assert train_images.dtype == np.dtype(image_dtype)
+    np.testing.assert_array_equal(train_images, images)
+
+
+def test_streaming_preprocess_writes_shards(tmp_path):
+    runner = CliRunner()
+
+    result = runner.invoke(
+        cli,
+        [
+            "--input-data", SAMPLE_MNIST_DIR,
+            "--output-dir", tmp_path,
+            "--data-format", "npy",
+            "--chunk-size", 3,
+            "--shard-size", 8,
+        ]
+    )
+
+    assert result.exit_code == 0
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert len(manifest["splits"]["train"]["shards"]) == 3
+
+    verify_processed_data(tmp_path)
+    train_data, _ = load_train_test_dataset(data_dir=tmp_path)
+    expected_x, expected_y = read_mnist(SAMPLE_MNIST_DIR, kind="train")
+    np.testing.assert_array_equal(train_data["x"], expected_x)
+    np.testing.assert_array_equal(train_data["y"], expected_y)
+
+
+def test_streaming_preprocess_checks_labels_match_images(tmp_path):
+    input_dir = shutil.copytree(SAMPLE_MNIST_DIR, tmp_path / "mnist")
+    _, labels = read_mnist(SAMPLE_MNIST_DIR, kind="train")
+    write_idx(input_dir / "train-labels-idx1-ubyte.gz", labels[:-1])
+
+    with pytest.raises(ValueError, match="images but .* has .* labels"):
+        run_streaming_preprocess(input_dir, tmp_path / "output", chunk_size=3)
+
+
+def test_concurrent_load_matches_sequential_load():
+    sequential = load_raw_data(SAMPLE_MNIST_DIR, max_workers=1)
+    concurrent = load_raw_data(SAMPLE_MNIST_DIR, max_workers=4)
+
+    assert len(concurrent) == len(sequential) == 4
+    for expected, actual in zip(sequential, concurrent):
+        np.testing.assert_array_equal(actual, expected)
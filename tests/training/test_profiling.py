@@ -0,0 +1,69 @@
+import click
+import mlflow
+from click.testing import CliRunner
+from mlflow.tracking import MlflowClient
+
+from training.profiling import profile_options, profiled
+from training.tracker import end_run
+from training.utils import save_run_id
+
+
+def _work():
+    return sorted(str(i) for i in range(10000))
+
+
+def test_profiled_does_nothing_without_profiler(tmp_path):
+    with profiled("step", tmp_path):
+        _work()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiled_writes_cprofile_and_memory_reports(tmp_path):
+    with profiled("step", tmp_path, "cprofile", memory=True):
+        _work()
+
+    profile_dir = tmp_path / "profile"
+    assert sorted(path.name for path in profile_dir.iterdir()) == [
+        "step-cprofile.txt",
+        "step-memory.txt",
+        "step.prof",
+    ]
+    assert "_work" in (profile_dir / "step-cprofile.txt").read_text()
+    assert "peak" in (profile_dir / "step-memory.txt").read_text()
+
+
+def test_profiled_logs_to_saved_run(tmp_path):
+    tracking_uri = f"file:{tmp_path}/mlruns"
+    mlflow.set_tracking_uri(tracking_uri)
+    mlflow.set_experiment("profiles")
+    run_id = mlflow.start_run().info.run_id
+    end_run()
+    save_run_id(run_id, tmp_path)
+
+    with profiled(
+        "evaluate",
+        tmp_path / "evaluation",
+        "cprofile",
+        run_id_dir=tmp_path,
+        tracking_uri=tracking_uri,
+    ):
+        _work()
+
+    artifacts = MlflowClient(tracking_uri).list_artifacts(run_id, "profile/evaluate")
+    assert sorted(info.path for info in artifacts) == [
+        "profile/evaluate/evaluate-cprofile.txt",
+        "profile/evaluate/evaluate.prof",
+    ]
+
+
+def test_profile_options():
+    @click.command()
+    @profile_options
+    def command(profile, profile_memory):
+        click.echo(f"{profile} {profile_memory}")
+
+    runner = CliRunner()
+    assert runner.invoke(command, []).output == "None False\n"
+    result = runner.invoke(command, ["--profile", "cprofile", "--profile-memory"])
+    assert result.output == "cprofile True\n"
+    assert runner.invoke(command, ["--profile", "perf"]).exit_code != 0
@@ -0,0 +1,86 @@
+import keras
+import numpy as np
+import pytest
+
+from training.model import build_model
+from training.schedules import (
+    EarlyStoppingReport,
+    cosine_learning_rate,
+    get_lr_schedule_parameters,
+    make_schedule_callbacks,
+)
+
+
+def test_cosine_learning_rate():
+    assert cosine_learning_rate(0, 10, 0.1) == pytest.approx(0.1)
+    assert cosine_learning_rate(5, 10, 0.1) == pytest.approx(0.05)
+    assert cosine_learning_rate(10, 10, 0.1, minimum=0.01) == pytest.approx(0.01)
+
+
+def test_unknown_lr_schedule():
+    with pytest.raises(ValueError, match="Unsupported learning rate schedule"):
+        get_lr_schedule_parameters({"lr_schedule": {"name": "step"}})
+
+
+@pytest.mark.parametrize(
+    "params, expected",
+    [
+        ({}, []),
+        (
+            {"lr_schedule": {"name": "plateau"}},
+            [keras.callbacks.ReduceLROnPlateau],
+        ),
+        (
+            {
+                "lr_schedule": {"name": "cosine"},
+                "early_stopping": {"enabled": True},
+            },
+            [
+                keras.callbacks.LearningRateScheduler,
+                keras.callbacks.EarlyStopping,
+                EarlyStoppingReport,
+            ],
+        ),
+        ({"early_stopping": {"target": 0.9}}, [EarlyStoppingReport]),
+    ],
+)
+def test_make_schedule_callbacks(params, expected):
+    callbacks = make_schedule_callbacks({"epochs": 4, **params})
+    assert [type(c) for c in callbacks] == expected
+
+
+def test_early_stopping_report():
+    params = {
+        "epochs": 20,
+        "learning_rate": 0.01,
+        "lr_schedule": {"name": "cosine"},
+        # The loss of random labels stops improving quickly
+        "early_stopping": {
+            "enabled": True,
+            "monitor": "val_loss",
+            "patience": 0,
+            "min_delta": 1.0,
+            "target": 1e6,
+        },
+    }
+    x = np.random.default_rng(0).integers(0, 256, (64, 28, 28), dtype=np.uint8)
+    y = np.random.default_rng(1).integers(0, 10, 64)
+    model = build_model({"num_layers": 1}, params)
+    callbacks = make_schedule_callbacks(params)
+    history = model.fit(
+        x,
+        y,
+        validation_split=0.25,
+        epochs=params["epochs"],
+        callbacks=callbacks,
+        verbose=0,
+    )
+
+    report = callbacks[-1].metrics
+    epochs_run = len(history.history["loss"])
+    assert epochs_run < params["epochs"]
+    assert report["epochs_run"] == epochs_run
+    assert report["epochs_saved"] == params["epochs"] - epochs_run
+    assert report["epochs_to_target"] == 1
+    assert 0 < report["time_to_target_seconds"] <= report["training_seconds"]
+    assert history.history["lr"][1] < params["learning_rate"]
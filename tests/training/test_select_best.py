@@ -0,0 +1,53 @@
+import json
+
+import mlflow
+import pytest
+from mlflow.tracking import MlflowClient
+
+from training.select_best import (
+    CANDIDATES_FILE,
+    default_metric,
+    select_best_run,
+)
+from training.utils import load_model_training_run_id
+
+
+def _log_candidate(pipeline_run: str, metrics: dict) -> str:
+    with mlflow.start_run() as run:
+        mlflow.log_param("pipeline_run", pipeline_run)
+        mlflow.log_metrics(metrics)
+    return run.info.run_id
+
+
+def test_select_best_run(tmp_path):
+    tracking_uri = f"file:{tmp_path}/mlruns"
+    mlflow.set_tracking_uri(tracking_uri)
+    mlflow.set_experiment("sweep")
+    worse = _log_candidate("a", {"eval_acc": 0.7})
+    best = _log_candidate("a", {"eval_acc": 0.8})
+    _log_candidate("b", {"eval_acc": 0.9})
+
+    selected = select_best_run(
+        mlflow_tracking_uri=tracking_uri,
+        experiment_name="sweep",
+        pipeline_run_id="a",
+        metric="eval_acc",
+        output_dir=tmp_path / "selection",
+        expected_candidates=2,
+    )
+
+    assert selected == best
+    assert load_model_training_run_id(tmp_path / "selection") == best
+    candidates = json.loads((tmp_path / "selection" / CANDIDATES_FILE).read_text())
+    assert {c["run_id"] for c in candidates["candidates"]} == {worse, best}
+    client = MlflowClient(tracking_uri)
+    assert client.get_run(best).data.tags["best_candidate"] == "True"
+    with pytest.raises(ValueError):
+        select_best_run(tracking_uri, "sweep", "a", "eval_acc", tmp_path, 3)
+
+
+def test_default_metric_is_the_first_threshold_metric(tmp_path):
+    thresholds = tmp_path / "thresholds.json"
+    thresholds.write_text(json.dumps({"eval_acc": 0.6, "eval_loss": 1.0}))
+
+    assert default_metric(thresholds) == "eval_acc"
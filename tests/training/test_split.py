@@ -0,0 +1,54 @@
+import numpy as np
+
+from training.input_pipeline import make_indexed_dataset
+from training.split import load_split, save_split, split_indices, take
+
+
+def test_default_split_is_contiguous_view() -> None:
+    x = np.arange(100).reshape(10, 10)
+    split = split_indices(10, validation_split=0.2)
+
+    validation = take(x, split.validation)
+
+    assert split.train.tolist() == list(range(8))
+    assert np.shares_memory(validation, x)
+    assert validation[:, 0].tolist() == [80, 90]
+
+
+def test_stratified_split_keeps_label_distribution() -> None:
+    labels = np.repeat(np.arange(4), 25).reshape(-1, 1)
+    split = split_indices(100, validation_split=0.2, labels=labels, seed=1)
+
+    counts = np.bincount(labels[split.validation].ravel())
+
+    assert counts.tolist() == [5, 5, 5, 5]
+    assert np.intersect1d(split.train, split.validation).size == 0
+    assert len(split.train) + len(split.validation) == 100
+
+
+def test_shuffled_split_is_reproducible(tmp_path) -> None:
+    split = split_indices(50, validation_split=0.3, shuffle=True, seed=3)
+    save_split(split, tmp_path)
+
+    loaded = load_split(tmp_path)
+
+    assert np.array_equal(loaded.validation, split.validation)
+    assert np.array_equal(
+        split.validation,
+        split_indices(50, validation_split=0.3, shuffle=True, seed=3).validation,
+    )
+
+
+def test_indexed_dataset_gathers_selected_samples() -> None:
+    x = np.arange(10 * 28 * 28, dtype=np.uint8).reshape(10, 28, 28)
+    y = np.arange(10, dtype=np.uint8).reshape(10, 1)
+    indices = np.array([1, 3, 4, 8, 9])
+
+    dataset = make_indexed_dataset(
+        x, y, indices, batch_size=2, shuffle_buffer_size=5, seed=1
+    )
+    batches = list(dataset)
+    labels = np.concatenate([batch_y.numpy() for _, batch_y in batches])
+
+    assert sorted(labels.ravel().tolist()) == indices.tolist()
+    assert batches[0][0].shape[1:] == (28, 28)
@@ -0,0 +1,118 @@
+import numpy as np
+
+from training.model import get_model, train_model
+from training.split import split_indices
+from training.streaming import StreamingSource, load_sharded_dataset
+from training.utils import ShardedNpyWriter, write_processed_data_manifest
+
+
+def _write_shards(output_dir, n_items=100, shard_size=30):
+    writer = ShardedNpyWriter(output_dir, "train", n_items, shard_size)
+    writer.write(
+        {
+            "x": np.repeat(np.arange(n_items, dtype=np.uint8), 28 * 28).reshape(
+                n_items, 28, 28
+            ),
+            "y": (np.arange(n_items) % 10).astype(np.uint8).reshape(-1, 1),
+        }
+    )
+    write_processed_data_manifest({"train": writer.close()}, output_dir)
+
+
+def test_streaming_source_yields_selected_samples_once(tmp_path) -> None:
+    _write_shards(tmp_path)
+    dataset = load_sharded_dataset(tmp_path)
+    split = split_indices(len(dataset), validation_split=0.2, shuffle=True, seed=0)
+
+    source = StreamingSource(
+        dataset,
+        batch_size=8,
+        indices=split.train,
+        shuffle_buffer_size=16,
+        block_size=7,
+        prefetch_blocks=2,
+        num_threads=3,
+        seed=0,
+    )
+    for _ in range(2):
+        batches = list(source)
+        first_pixels = np.concatenate([x[:, 0, 0] for x, _ in batches])
+
+        assert len(batches) == len(source)
+        assert all(len(x) == 8 for x, _ in batches[:-1])
+        assert len(dataset.shards) == 4
+        # Every pixel of an image is its index
+        assert sorted(first_pixels.tolist()) == sorted(split.train.tolist())
+
+
+def test_streaming_source_stops_reader_threads_on_early_exit(tmp_path) -> None:
+    _write_shards(tmp_path)
+    source = StreamingSource(
+        load_sharded_dataset(tmp_path), batch_size=4, block_size=5, prefetch_blocks=1
+    )
+
+    batches = iter(source)
+    next(batches)
+    batches.close()
+
+    assert len(list(source)) == 25
+
+
+def test_model_training_streaming_from_shards(tmp_path) -> None:
+    _write_shards(tmp_path)
+    params = {
+        "epochs": 2,
+        "batch_size": 16,
+        "validation_split": 0.2,
+        "input_pipeline": {"mode": "streaming", "shuffle_buffer_size": 32},
+    }
+
+    model = get_model("baseline", {"num_layers": 1}, training_parameters=params)
+    history = train_model(
+        model=model, train_data=load_sharded_dataset(tmp_path), params=params
+    )
+
+    assert len(history.history["val_loss"]) == 2
+
+
+def test_sharded_dataset_takes_samples_across_shards(tmp_path) -> None:
+    _write_shards(tmp_path)
+    dataset = load_sharded_dataset(tmp_path)
+    indices = np.array([0, 29, 30, 31, 75, 99])
+
+    samples = dataset.take(indices)
+
+    assert len(dataset.shards) == 4
+    np.testing.assert_array_equal(samples["x"][:, 0, 0], indices)
+    np.testing.assert_array_equal(samples["y"].reshape(-1), indices % 10)
+
+
+def test_streaming_source_keeps_the_order_without_shuffling(tmp_path) -> None:
+    _write_shards(tmp_path)
+    source = StreamingSource(
+        load_sharded_dataset(tmp_path), batch_size=8, block_size=7, num_threads=1
+    )
+
+    first_pixels = np.concatenate([x[:, 0, 0] for x, _ in source])
+
+    assert first_pixels.tolist() == list(range(100))
+
+
+def test_streaming_source_shuffles_within_the_buffer(tmp_path) -> None:
+    _write_shards(tmp_path)
+    source = StreamingSource(
+        load_sharded_dataset(tmp_path),
+        batch_size=4,
+        shuffle_buffer_size=32,
+        block_size=10,
+        seed=0,
+    )
+
+    batches = list(source)
+    first_pixels = np.concatenate([x[:, 0, 0] for x, _ in batches])
+    labels = np.concatenate([y[:, 0] for _, y in batches])
+
+    assert sorted(first_pixels.tolist()) == list(range(100))
+    assert first_pixels.tolist() != sorted(first_pixels.tolist())
+    # Samples and labels stay paired
+    assert (labels == first_pixels % 10).all()
@@ -0,0 +1,130 @@
+import json
+from pathlib import Path
+
+import mlflow
+import numpy as np
+import pytest
+from mlflow.tracking import MlflowClient
+
+from training.config import get_training_config
+from training.sweep import (
+    SharedArrays,
+    apply_trial,
+    attach_arrays,
+    make_trials,
+    parse_search_space,
+    partition_threads,
+    run_sweep,
+)
+
+PREPROCESSED_DATA_PATH = Path("tests").joinpath("resources/data/preprocessed").resolve()
+
+
+def test_parse_search_space():
+    space = parse_search_space(
+        ["model_config.num_layers=3,5", "training_config.split.shuffle=true"]
+    )
+
+    assert space == {
+        "model_config.num_layers": [3, 5],
+        "training_config.split.shuffle": [True],
+    }
+    with pytest.raises(ValueError):
+        parse_search_space(["num_layers=3,5"])
+
+
+def test_make_trials():
+    space = {"a": [1, 2, 3], "b": ["x", "y"]}
+
+    grid = make_trials(space)
+    sample = make_trials(space, strategy="random", num_trials=4, seed=1)
+
+    assert len(grid) == 6 and grid[0] == {"a": 1, "b": "x"}
+    assert len(sample) == 4 and all(trial in grid for trial in sample)
+    assert sample == make_trials(space, strategy="random", num_trials=4, seed=1)
+
+
+def test_apply_trial_does_not_modify_the_config():
+    config = {"training_config": {"split": {"shuffle": False}, "epochs": 1}}
+
+    trial_config = apply_trial(config, {"training_config.split.shuffle": True})
+
+    assert trial_config["training_config"] == {"split": {"shuffle": True}, "epochs": 1}
+    assert config["training_config"]["split"]["shuffle"] is False
+
+
+def test_partition_threads():
+    assert partition_threads(workers=4, cpus=16) == (4, 2)
+    assert partition_threads(workers=4, cpus=2) == (1, 1)
+
+
+def test_shared_arrays_attach_without_copying():
+    images = np.arange(24, dtype=np.uint8).reshape(2, 3, 4)
+
+    with SharedArrays({"train": {"x": images}}) as shared:
+        arrays, memories = attach_arrays(shared.specs)
+        attached = arrays["train"]["x"]
+
+        np.testing.assert_array_equal(attached, images)
+        assert not attached.flags.writeable
+        assert not attached.flags.owndata
+        del arrays, attached
+        for memory in memories:
+            memory.close()
+
+
+def test_sweep_logs_nested_runs(tmp_path):
+    tracking_uri = f"file:{tmp_path}/mlruns"
+    model_name, model_parameters, training_parameters = get_training_config()
+
+    summary = run_sweep(
+        model=model_name,
+        experiment_name="sweep",
+        tracking_uri=tracking_uri,
+        input_data=PREPROCESSED_DATA_PATH,
+        output_dir=tmp_path / "sweep",
+        trials=make_trials({"model_config.num_layers": [1, 2]}),
+        model_parameters=model_parameters,
+        training_parameters=training_parameters,
+        workers=2,
+    )
+
+    assert [t["parameters"] for t in summary["trials"]] == [
+        {"model_config.num_layers": 1},
+        {"model_config.num_layers": 2},
+    ]
+    assert 0 < summary["utilisation"] <= 1
+    assert json.loads((tmp_path / "sweep" / "sweep_summary.json").read_text())
+    client = MlflowClient(tracking_uri)
+    for trial in summary["trials"]:
+        run = client.get_run(trial["run_id"])
+        assert run.data.tags["mlflow.parentRunId"] == summary["run_id"]
+        assert run.data.params["num_layers"] == str(
+            trial["parameters"]["model_config.num_layers"]
+        )
+        assert "eval_acc" in run.data.metrics
+
+
+def test_failed_trial_fails_the_sweep_run(tmp_path):
+    tracking_uri = f"file:{tmp_path}/mlruns"
+    model_name, model_parameters, training_parameters = get_training_config()
+
+    with pytest.raises(ValueError, match="Unsupported learning rate schedule"):
+        run_sweep(
+            model=model_name,
+            experiment_name="sweep",
+            tracking_uri=tracking_uri,
+            input_data=PREPROCESSED_DATA_PATH,
+            output_dir=tmp_path / "sweep",
+            trials=make_trials({"training_config.lr_schedule.name": ["step"]}),
+            model_parameters=model_parameters,
+            training_parameters=training_parameters,
+            workers=1,
+        )
+
+    client = MlflowClient(tracking_uri)
+    experiment = client.get_experiment_by_name("sweep")
+    runs = client.search_runs([experiment.experiment_id])
+    assert sorted(run.info.run_name for run in runs) == ["sweep", "trial-0"]
+    assert {run.info.status for run in runs} == {"FAILED"}
+    assert mlflow.active_run() is None
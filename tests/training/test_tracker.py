@@ -0,0 +1,130 @@
+import mlflow
+import pytest
+from mlflow.tracking import MlflowClient
+
+from training.tracker import (
+    BatchLogger,
+    end_run,
+    ending_run,
+    log_metrics_if_active,
+    save_metrics,
+    save_parameters,
+)
+
+
+class CountingClient(MlflowClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=(), **kwargs):
+        self.batches.append((len(metrics), len(params), len(tags)))
+        return super().log_batch(run_id, metrics, params, tags, **kwargs)
+
+
+def _client_and_run(tmp_path):
+    client = CountingClient(tracking_uri=f"file:{tmp_path}/mlruns")
+    experiment_id = client.create_experiment("batch")
+    return client, client.create_run(experiment_id).info.run_id
+
+
+def test_batch_logger_splits_batches_within_mlflow_limits(tmp_path):
+    client, run_id = _client_and_run(tmp_path)
+
+    with BatchLogger(client, run_id, max_pending=10000) as batch_logger:
+        batch_logger.log_params({f"p{i}": i for i in range(150)})
+        batch_logger.set_tags({f"t{i}": i for i in range(20)})
+        batch_logger.log_metrics({f"m{i}": i for i in range(1900)})
+
+    assert client.batches == [(880, 100, 20), (950, 50, 0), (70, 0, 0)]
+    data = client.get_run(run_id).data
+    assert len(data.params) == 150
+    assert data.metrics["m1899"] == 1899
+    assert data.tags["t19"] == "19"
+
+
+def test_batch_logger_flushes_on_size_threshold(tmp_path):
+    client, run_id = _client_and_run(tmp_path)
+    batch_logger = BatchLogger(client, run_id, max_pending=5, flush_interval=3600)
+
+    batch_logger.log_metrics({"a": 1.0, "b": 2.0}, step=0)
+    assert client.batches == []
+    batch_logger.log_metrics({"a": 1.5, "b": 2.5, "c": 3.0}, step=1)
+
+    assert client.batches == [(5, 0, 0)]
+    assert batch_logger.pending == 0
+    history = client.get_metric_history(run_id, "a")
+    assert [m.step for m in history] == [0, 1]
+
+
+def test_save_helpers_are_flushed_at_run_end(tmp_path):
+    mlflow.set_tracking_uri(f"file:{tmp_path}/mlruns")
+    mlflow.set_experiment("helpers")
+    run_id = mlflow.start_run().info.run_id
+
+    save_parameters({"lr": 0.1})
+    save_metrics({"acc": 0.9}, prefix="eval_")
+    end_run()
+
+    data = MlflowClient().get_run(run_id).data
+    assert data.params == {"lr": "0.1"}
+    assert data.metrics == {"eval_acc": 0.9}
+
+
+class FailingClient(CountingClient):
+    def __init__(self, *args, failures=1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    def log_batch(self, run_id, metrics=(), params=(), tags=(), **kwargs):
+        if len(self.batches) == 1 and self.failures:
+            self.failures -= 1
+            raise ConnectionError("Transient error")
+        return super().log_batch(run_id, metrics, params, tags, **kwargs)
+
+
+def test_batch_logger_keeps_entities_of_failed_flush(tmp_path):
+    client = FailingClient(tracking_uri=f"file:{tmp_path}/mlruns")
+    run_id = client.create_run(client.create_experiment("retry")).info.run_id
+    batch_logger = BatchLogger(client, run_id, max_pending=10000)
+    batch_logger.log_params({f"p{i}": i for i in range(150)})
+    batch_logger.log_metrics({f"m{i}": i for i in range(1000)})
+
+    # The first request is logged, the second one fails
+    with pytest.raises(ConnectionError):
+        batch_logger.flush()
+    assert batch_logger.pending == 50 + 100
+    assert batch_logger.flush() == 1
+
+    data = client.get_run(run_id).data
+    assert len(data.params) == 150
+    assert len(data.metrics) == 1000
+
+
+def test_failed_run_is_flushed_and_marked_failed(tmp_path):
+    mlflow.set_tracking_uri(f"file:{tmp_path}/mlruns")
+    mlflow.set_experiment("failed")
+    run_id = mlflow.start_run().info.run_id
+
+    with pytest.raises(RuntimeError):
+        with ending_run():
+            save_metrics({"loss": 0.5})
+            raise RuntimeError("Training failed")
+
+    run = MlflowClient().get_run(run_id)
+    assert run.info.status == "FAILED"
+    assert run.data.metrics["loss"] == 0.5
+
+
+def test_log_metrics_if_active(tmp_path):
+    mlflow.set_tracking_uri(f"file:{tmp_path}/mlruns")
+    mlflow.set_experiment("callbacks")
+    # Without an active run, the metrics are not logged
+    log_metrics_if_active({"loss": 1.0})
+    run_id = mlflow.start_run().info.run_id
+
+    log_metrics_if_active({"loss": 0.5}, step=3)
+    end_run()
+
+    history = MlflowClient().get_metric_history(run_id, "loss")
+    assert [(m.value, m.step) for m in history] == [(0.5, 3)]
@@ -10,6 +10,8 @@ from mlflow.tracking import MlflowClient
 
 from training.config import get_training_config
 from training.train import train_with_tracking
+from training.uploader import ArtifactUploader
+from training.utils import load_model_training_run_id
 
 PREPROCESSED_DATA_PATH = Path("tests").joinpath("resources/data/preprocessed").resolve()
 
@@ -52,6 +54,55 @@ def test_train_creates_experiment(tmp_path):
             assert experiment is not None
 
 
+def _artifact_sizes(client, run_id, path=None):
+    sizes = {}
+    for info in client.list_artifacts(run_id, path):
+        if info.is_dir:
+            sizes.update(_artifact_sizes(client, run_id, info.path))
+        else:
+            sizes[info.path] = info.file_size
+    return sizes
+
+
+def test_train_logs_the_model_once(tmp_path):
+    tracking_uri = f"file:{tmp_path}/mlruns"
+    model_name, model_parameters, training_parameters = get_training_config()
+    output_dir = tmp_path / "output"
+    output_dir.mkdir()
+
+    train_with_tracking(
+        model=model_name,
+        experiment_name="model-upload",
+        tracking_uri=tracking_uri,
+        input_data=PREPROCESSED_DATA_PATH,
+        experiment_parameters={},
+        training_parameters={**training_parameters, "epochs": 1},
+        model_parameters=model_parameters,
+        output_dir=output_dir,
+    )
+
+    client = MlflowClient(tracking_uri=tracking_uri)
+    run_id = load_model_training_run_id(output_dir)
+    sizes = _artifact_sizes(client, run_id, "model")
+    # The MLflow model to register and the versioned SavedModel to serve
+    assert "model/MLmodel" in sizes
+    saved_models = [path for path in sizes if path.endswith("saved_model.pb")]
+    assert sorted(saved_models) == [
+        "model/data/model/0001/saved_model.pb",
+        "model/data/model/saved_model.pb",
+    ]
+    metrics = client.get_run(run_id).data.metrics
+    assert metrics["artifact_upload_files"] == len(sizes)
+    assert metrics["artifact_upload_skipped_files"] == 0
+
+    # Uploading the model again, e.g. by a retried training, skips the logged files
+    with ArtifactUploader(run_id, client=client) as uploader:
+        assert uploader.upload_dir(output_dir / "0001", "model/data/model/") == 0
+    assert uploader.stats.skipped_files == len(
+        [path for path in sizes if path.startswith("model/data/model/0001/")]
+    )
+
+
 @pytest.mark.parametrize(
     "params,raise_exception",
     [
@@ -3,7 +3,8 @@ from pathlib import Path
 import numpy as np
 from tensorflow import keras
 
-from training.model import get_model
+from training.input_pipeline import make_dataset
+from training.model import MODELS_FACTORY, get_model, train_model
 from training.utils import load_train_test_dataset
 
 DATASET_SHAPE_X = (28, 28)
@@ -36,3 +37,47 @@ def test_load_dataset(tmp_path) -> None:
     assert y_train.shape == (64, 1)
     assert x_test.shape == (64, 28, 28)
     assert y_test.shape == (64, 1)
+
+
+def test_model_training_with_tf_data_pipeline() -> None:
+    dataset_size = 10
+    train_data = {
+        "x": np.ones((dataset_size, *DATASET_SHAPE_X), dtype=np.uint8),
+        "y": np.ones((dataset_size, *DATASET_SHAPE_Y), dtype=np.uint8),
+    }
+    params = {
+        "epochs": 1,
+        "batch_size": 4,
+        "validation_split": 0.2,
+        "steps_per_execution": 2,
+        "input_pipeline": {"mode": "tf_data", "shuffle_buffer_size": 8, "cache": True},
+    }
+
+    model = get_model("baseline", {"num_layers": 2}, training_parameters=params)
+    history = train_model(model=model, train_data=train_data, params=params)
+
+    assert "val_loss" in history.history
+
+
+def test_make_dataset_batches_all_samples() -> None:
+    x = np.arange(10 * 28 * 28, dtype=np.uint8).reshape(10, 28, 28)
+    y = np.arange(10, dtype=np.uint8).reshape(10, 1)
+
+    dataset = make_dataset(x, y, batch_size=4, shuffle_buffer_size=10, seed=1)
+    labels = np.concatenate([batch_y.numpy() for _, batch_y in dataset])
+
+    assert sorted(labels.ravel().tolist()) == list(range(10))
+
+
+def test_get_model_with_one_argument_builder(monkeypatch) -> None:
+    def build(model_parameters):
+        model = keras.Sequential(
+            [keras.Input(shape=DATASET_SHAPE_X), keras.layers.Flatten()]
+            + [keras.layers.Dense(10) for _ in range(model_parameters["num_layers"])]
+        )
+        model.compile(loss="mse")
+        return model
+
+    monkeypatch.setitem(MODELS_FACTORY, "custom", build)
+    model = get_model("custom", {"num_layers": 2}, training_parameters={"epochs": 1})
+    assert len(model.layers) == 3
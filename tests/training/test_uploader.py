@@ -0,0 +1,60 @@
+import mlflow
+import pytest
+from mlflow.tracking import MlflowClient
+
+from training.tracker import end_run
+from training.uploader import ArtifactUploader
+
+
+def _model_dir(tmp_path):
+    model_dir = tmp_path / "0001"
+    (model_dir / "variables").mkdir(parents=True)
+    (model_dir / "saved_model.pb").write_bytes(b"graph" * 100)
+    (model_dir / "variables" / "variables.index").write_bytes(b"index")
+    (model_dir / "variables" / "variables.data-00000-of-00001").write_bytes(
+        b"weights" * 1000
+    )
+    return model_dir
+
+
+def test_uploader_logs_directory_and_skips_logged_files(tmp_path):
+    mlflow.set_tracking_uri(f"file:{tmp_path}/mlruns")
+    mlflow.set_experiment("uploads")
+    run_id = mlflow.start_run().info.run_id
+    model_dir = _model_dir(tmp_path)
+
+    with ArtifactUploader(run_id, max_workers=2) as uploader:
+        assert uploader.upload_dir(model_dir, artifact_path="model/data/model/") == 3
+    with ArtifactUploader(run_id) as uploader:
+        assert uploader.upload_dir(model_dir, artifact_path="model/data/model/") == 0
+    end_run()
+
+    client = MlflowClient()
+    variables = client.list_artifacts(run_id, "model/data/model/0001/variables")
+    assert sorted(info.path.rsplit("/", 1)[-1] for info in variables) == [
+        "variables.data-00000-of-00001",
+        "variables.index",
+    ]
+    metrics = client.get_run(run_id).data.metrics
+    assert metrics["artifact_upload_skipped_files"] == 3
+    history = client.get_metric_history(run_id, "artifact_upload_bytes")
+    assert sorted(m.value for m in history) == [0, 7505]
+
+
+class FailingUploadClient(MlflowClient):
+    def log_artifact(self, run_id, local_path, artifact_path=None):
+        raise ConnectionError("Upload failed")
+
+
+def test_uploader_does_not_hide_the_error_of_the_context(tmp_path):
+    client = FailingUploadClient(tracking_uri=f"file:{tmp_path}/mlruns")
+    run_id = client.create_run(client.create_experiment("uploads")).info.run_id
+    model_dir = _model_dir(tmp_path)
+
+    with pytest.raises(ConnectionError):
+        with ArtifactUploader(run_id, client=client) as uploader:
+            uploader.upload_dir(model_dir, artifact_path="model")
+    with pytest.raises(RuntimeError, match="Training failed"):
+        with ArtifactUploader(run_id, client=client) as uploader:
+            uploader.upload_dir(model_dir, artifact_path="model")
+            raise RuntimeError("Training failed")
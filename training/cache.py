@@ -0,0 +1,186 @@
+"""Content-addressed cache for downloaded dataset files.
+
+The cache directory can be shared between pipeline runs, e.g. by mounting the same
+volume into the pull data pod. Files are stored once by their SHA-256 digest under
+``objects/`` and looked up either directly by the checksum from the data manifest or
+by the combination of URL and ETag reported by the server. An index file keeps track
+of the last use of each object so that the least recently used objects can be evicted
+when the cache grows over its size limit.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Collection, Iterator, Optional
+
+from .download import ManifestEntry
+from .logger import logger
+from .utils import sha256sum
+
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+OBJECTS_DIR = "objects"
+
+LINK_MODES = ("hardlink", "symlink", "copy")
+
+
+def cache_key(url: str, etag: str) -> str:
+    """Key of a remote file version in the cache index"""
+    return hashlib.sha256(f"{url}\n{etag}".encode()).hexdigest()
+
+
+class DatasetCache:
+    """Local content-addressed file cache with LRU eviction by total size.
+
+    Args:
+        cache_dir: Folder of the cache, created if it does not exist.
+        max_size_bytes: Maximum total size of the cached objects. No limit if None.
+        link_mode: How cache hits are placed in the output folder. "hardlink" falls
+            back to copying if the output is on a different file system.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_size_bytes: Optional[int] = None,
+        link_mode: str = "hardlink",
+    ):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unsupported link mode `{link_mode}`")
+        self.cache_dir = Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+        self.link_mode = link_mode
+        self.objects_dir = self.cache_dir / OBJECTS_DIR
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked_index(self) -> Iterator[dict]:
+        """Lock the cache against concurrent users and yield the mutable index"""
+        with (self.cache_dir / LOCK_FILE).open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                index_path = self.cache_dir / INDEX_FILE
+                if index_path.exists():
+                    index = json.loads(index_path.read_text())
+                else:
+                    index = {"keys": {}, "objects": {}}
+                yield index
+                tmp_path = index_path.with_suffix(".tmp")
+                tmp_path.write_text(json.dumps(index))
+                tmp_path.replace(index_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.objects_dir / sha256
+
+    def lookup(
+        self, entry: ManifestEntry, etag: Optional[str] = None
+    ) -> Optional[Path]:
+        """Find a cached object for the manifest entry.
+
+        The checksum from the manifest is used if available, otherwise the URL and
+        ETag. Returns None on a cache miss.
+        """
+        with self._locked_index() as index:
+            sha256 = entry.sha256
+            if sha256 is None and etag is not None:
+                sha256 = index["keys"].get(cache_key(entry.url, etag))
+            if sha256 is None or sha256 not in index["objects"]:
+                return None
+
+            path = self._object_path(sha256)
+            if not path.is_file():
+                del index["objects"][sha256]
+                return None
+            index["objects"][sha256]["last_used"] = time.time()
+            return path
+
+    def add(self, entry: ManifestEntry, path: Path, etag: Optional[str] = None) -> Path:
+        """Store a downloaded file in the cache and return the cached object path"""
+        sha256 = entry.sha256 or sha256sum(path)
+        object_path = self._object_path(sha256)
+        if not object_path.exists():
+            with tempfile.NamedTemporaryFile(dir=self.objects_dir, delete=False) as f:
+                tmp_path = Path(f.name)
+            shutil.copyfile(path, tmp_path)
+            tmp_path.replace(object_path)
+
+        with self._locked_index() as index:
+            index["objects"][sha256] = {
+                "size": object_path.stat().st_size,
+                "last_used": time.time(),
+            }
+            if etag is not None:
+                index["keys"][cache_key(entry.url, etag)] = sha256
+        return object_path
+
+    def link(self, object_path: Path, destination: Path) -> None:
+        """Place a cached object at the destination path"""
+        if destination.exists() or destination.is_symlink():
+            destination.unlink()
+        if self.link_mode == "hardlink":
+            try:
+                os.link(object_path, destination)
+                return
+            except OSError:
+                logger.info(f"Cannot hardlink {object_path}, copying instead")
+        elif self.link_mode == "symlink":
+            destination.symlink_to(object_path)
+            return
+        shutil.copyfile(object_path, destination)
+
+    def size(self) -> int:
+        """Total size of the cached objects in bytes"""
+        with self._locked_index() as index:
+            return sum(o["size"] for o in index["objects"].values())
+
+    def evict(
+        self,
+        max_size_bytes: Optional[int] = None,
+        protected: Collection[Path] = (),
+    ) -> int:
+        """Evict least recently used objects until the cache fits the size limit.
+
+        Args:
+            max_size_bytes: Size limit instead of the one of the cache.
+            protected: Object paths that are not evicted, e.g. the objects linked into
+                the output of the current pull. The cache stays over the limit if they
+                do not fit in it.
+
+        Returns the number of bytes freed.
+        """
+        limit = self.max_size_bytes if max_size_bytes is None else max_size_bytes
+        if limit is None:
+            return 0
+
+        freed = 0
+        protected_objects = {Path(path).name for path in protected}
+        with self._locked_index() as index:
+            objects = index["objects"]
+            total = sum(o["size"] for o in objects.values())
+            by_last_use = sorted(objects, key=lambda sha: objects[sha]["last_used"])
+            for sha256 in by_last_use:
+                if total <= limit:
+                    break
+                if sha256 in protected_objects:
+                    continue
+                size = objects.pop(sha256)["size"]
+                self._object_path(sha256).unlink(missing_ok=True)
+                total -= size
+                freed += size
+            index["keys"] = {k: v for k, v in index["keys"].items() if v in objects}
+
+        if total > limit:
+            logger.warning(
+                f"Dataset cache {self.cache_dir} holds {total} bytes in use, over its "
+                f"limit of {limit} bytes"
+            )
+        if freed:
+            logger.info(f"Evicted {freed} bytes from dataset cache {self.cache_dir}")
+        return freed
@@ -0,0 +1,369 @@
+"""Periodic checkpoints of the training, to resume it after the pod is preempted.
+
+The weights, the optimizer state and the epoch and step counters are written to a
+checkpoint folder every `every_n_steps` training steps or `every_seconds` seconds and
+at the end of every epoch, and optionally uploaded to the `checkpoints` artifacts of
+the MLflow run. Like the local folder, the artifacts keep the `keep` latest
+checkpoints, and they are deleted when the training finishes. A restarted training
+resumes from the checkpoint folder, or from the artifacts of the unfinished run
+tagged with the same resume key, e.g. the id of the pipeline run, and keeps logging
+to the same MLflow run. A checkpoint is only resumed by a training with the same resume
+key and the same model and training config, others start from scratch.
+
+Keras resumes at the start of an epoch, so a checkpoint taken during an epoch trains
+that epoch again, from the weights of the checkpoint. MLflow autolog cannot continue a
+run, the parameters of `fit` differ on resume, so with checkpointing the training logs
+its parameters and the metrics of every epoch itself.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+
+import keras
+
+from .logger import logger
+from .tracker import get_batch_logger
+from .types import Model, ModelParameters, TrainingParameters
+
+if TYPE_CHECKING:
+    from mlflow.tracking import MlflowClient
+
+CHECKPOINT_STATE_FILE = "state.json"
+CHECKPOINT_ARTIFACT_PATH = "checkpoints"
+RESUME_KEY_TAG = "resume_key"
+DEFAULT_CHECKPOINT_FOLDER = Path("output") / "checkpoints"
+
+
+def get_checkpoint_parameters(params: TrainingParameters) -> dict:
+    """Checkpoint parameters from the training parameters, with defaults"""
+    defaults = {
+        "enabled": False,
+        "every_n_steps": None,
+        "every_seconds": 600,
+        "keep": 2,
+        "upload": True,
+    }
+    return {**defaults, **params.get("checkpoint", {})}
+
+
+@dataclass
+class CheckpointState:
+    run_id: str
+    epoch: int
+    """Epoch to resume at"""
+    step: int
+    """Training steps done, including the steps of the epoch to resume at"""
+    checkpoint: str
+    """Name of the checkpoint files, without extension"""
+    resume_key: Optional[str] = None
+    """Resume key of the training the checkpoint belongs to"""
+    config_hash: str = ""
+    """Hash of the model and training config of the training, see `config_hash`"""
+
+
+def config_hash(
+    model: str,
+    model_parameters: ModelParameters,
+    training_parameters: TrainingParameters,
+) -> str:
+    """Hash of the config of a training, a checkpoint only resumes the same config"""
+    config = {
+        "model": model,
+        "model_parameters": model_parameters,
+        "training_parameters": training_parameters,
+    }
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def load_state(checkpoint_dir: Path) -> Optional[CheckpointState]:
+    state_path = checkpoint_dir / CHECKPOINT_STATE_FILE
+    if not state_path.is_file():
+        return None
+    return CheckpointState(**json.loads(state_path.read_text()))
+
+
+def _checkpoint(model: Model):
+    import tensorflow as tf
+
+    # The optimizer creates its variables lazily, they have to exist to be restored
+    model.optimizer.build(model.trainable_variables)
+    return tf.train.Checkpoint(model=model, optimizer=model.optimizer)
+
+
+def _checkpoint_files(checkpoint_dir: Path, name: str) -> List[Path]:
+    return sorted(checkpoint_dir.glob(f"{name}.*"))
+
+
+def _checkpoint_number(name: str) -> int:
+    return int(name.split("-")[1])
+
+
+def save_checkpoint(
+    model: Model, checkpoint_dir: Path, state: CheckpointState, keep: int = 2
+) -> List[Path]:
+    """Write a checkpoint and its state, returns the written files.
+
+    The state is replaced atomically after the checkpoint is written, so that an
+    interrupted save leaves the previous checkpoint usable.
+    """
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    _checkpoint(model).write(str(checkpoint_dir / state.checkpoint))
+    state_path = checkpoint_dir / CHECKPOINT_STATE_FILE
+    tmp_path = state_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(asdict(state)))
+    os.replace(tmp_path, state_path)
+
+    names = sorted(
+        {p.name.split(".")[0] for p in checkpoint_dir.glob("ckpt-*.index")},
+        key=_checkpoint_number,
+    )
+    for name in names[:-keep]:
+        for path in _checkpoint_files(checkpoint_dir, name):
+            path.unlink()
+    return _checkpoint_files(checkpoint_dir, state.checkpoint) + [state_path]
+
+
+def restore_checkpoint(model: Model, checkpoint_dir: Path) -> Optional[CheckpointState]:
+    """Restore the weights and the optimizer state of the latest checkpoint"""
+    state = load_state(checkpoint_dir)
+    if state is None:
+        return None
+    _checkpoint(model).read(str(checkpoint_dir / state.checkpoint)).assert_consumed()
+    logger.info(
+        f"Restored checkpoint {state.checkpoint} of run {state.run_id} at epoch "
+        f"{state.epoch}, step {state.step}"
+    )
+    return state
+
+
+def find_resumable_run(
+    client: "MlflowClient", experiment_name: str, resume_key: str
+) -> Optional[str]:
+    """Latest unfinished run tagged with the resume key"""
+    experiment = client.get_experiment_by_name(experiment_name)
+    if experiment is None:
+        return None
+    runs = client.search_runs(
+        [experiment.experiment_id],
+        filter_string=f"tags.{RESUME_KEY_TAG} = '{resume_key}'",
+        order_by=["attributes.start_time DESC"],
+    )
+    for run in runs:
+        if run.info.status != "FINISHED":
+            return run.info.run_id
+    return None
+
+
+def download_checkpoint(
+    client: "MlflowClient", run_id: str, checkpoint_dir: Path
+) -> Optional[CheckpointState]:
+    """Download the latest checkpoint uploaded to a run into the checkpoint folder"""
+    from mlflow.exceptions import MlflowException
+
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        state_path = client.download_artifacts(
+            run_id, f"{CHECKPOINT_ARTIFACT_PATH}/{CHECKPOINT_STATE_FILE}"
+        )
+    except (MlflowException, OSError):
+        logger.info(f"Run {run_id} has no checkpoint")
+        return None
+    state = CheckpointState(**json.loads(Path(state_path).read_text()))
+    artifact_dir = f"{CHECKPOINT_ARTIFACT_PATH}/{state.checkpoint}"
+    for artifact in client.list_artifacts(run_id, artifact_dir):
+        path = client.download_artifacts(run_id, artifact.path)
+        shutil.copy(path, checkpoint_dir / Path(artifact.path).name)
+    # Written last, the checkpoint files have to be complete before it is used
+    (checkpoint_dir / CHECKPOINT_STATE_FILE).write_text(json.dumps(asdict(state)))
+    logger.info(f"Downloaded checkpoint {state.checkpoint} of run {run_id}")
+    return state
+
+
+def _delete_artifacts(client: "MlflowClient", run_id: str, artifact_path: str) -> None:
+    from mlflow.exceptions import MlflowException
+    from mlflow.store.artifact.artifact_repository_registry import (
+        get_artifact_repository,
+    )
+
+    repository = get_artifact_repository(client.get_run(run_id).info.artifact_uri)
+    try:
+        repository.delete_artifacts(artifact_path)
+    except (NotImplementedError, MlflowException, OSError) as e:
+        logger.warning(f"Could not delete the artifacts {artifact_path}: {e}")
+
+
+def prune_uploaded_checkpoints(
+    client: "MlflowClient", run_id: str, keep: int
+) -> List[str]:
+    """Delete all but the `keep` latest checkpoints uploaded to a run, returns the
+    names of the deleted checkpoints.
+    """
+    names = sorted(
+        (
+            Path(artifact.path).name
+            for artifact in client.list_artifacts(run_id, CHECKPOINT_ARTIFACT_PATH)
+            if artifact.is_dir
+        ),
+        key=_checkpoint_number,
+    )
+    pruned = names[:-keep] if keep > 0 else names
+    for name in pruned:
+        _delete_artifacts(client, run_id, f"{CHECKPOINT_ARTIFACT_PATH}/{name}")
+    return pruned
+
+
+def delete_uploaded_checkpoints(client: "MlflowClient", run_id: str) -> None:
+    """Delete the checkpoints uploaded to a run, e.g. once its training finished"""
+    if client.list_artifacts(run_id, CHECKPOINT_ARTIFACT_PATH):
+        _delete_artifacts(client, run_id, CHECKPOINT_ARTIFACT_PATH)
+        logger.info(f"Deleted the uploaded checkpoints of run {run_id}")
+
+
+class CheckpointCallback(keras.callbacks.Callback):
+    """Save checkpoints periodically during the training and after every epoch.
+
+    Args:
+        checkpoint_dir: Folder of the checkpoints.
+        run_id: MLflow run the checkpoints belong to.
+        params: Training parameters with the `checkpoint` section.
+        state: State of the restored checkpoint, None when training from scratch.
+        client: MLflow client to upload the checkpoints with, None to keep them local.
+        resume_key: Resume key of the training, saved with the checkpoints.
+        config_hash: Hash of the config of the training, saved with the checkpoints.
+    """
+
+    def __init__(
+        self,
+        checkpoint_dir: Path,
+        run_id: str,
+        params: TrainingParameters,
+        state: Optional[CheckpointState] = None,
+        client: Optional["MlflowClient"] = None,
+        resume_key: Optional[str] = None,
+        config_hash: str = "",
+    ):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.run_id = run_id
+        self.checkpoint_params = get_checkpoint_parameters(params)
+        self.client = client if self.checkpoint_params["upload"] else None
+        self.epoch = state.epoch if state else 0
+        self.step = state.step if state else 0
+        self.saves = _checkpoint_number(state.checkpoint) if state else 0
+        self.resume_key = resume_key
+        self.config_hash = config_hash
+        self._steps_since_save = 0
+        self._last_save = time.monotonic()
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step += 1
+        self._steps_since_save += 1
+        every_n_steps = self.checkpoint_params["every_n_steps"]
+        every_seconds = self.checkpoint_params["every_seconds"]
+        if (every_n_steps and self._steps_since_save >= every_n_steps) or (
+            every_seconds and time.monotonic() - self._last_save >= every_seconds
+        ):
+            self.save(epoch=self.epoch)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.save(epoch=epoch + 1)
+
+    def save(self, epoch: int) -> None:
+        start = time.perf_counter()
+        self.saves += 1
+        state = CheckpointState(
+            run_id=self.run_id,
+            epoch=epoch,
+            step=self.step,
+            checkpoint=f"ckpt-{self.saves}",
+            resume_key=self.resume_key,
+            config_hash=self.config_hash,
+        )
+        files = save_checkpoint(
+            self.model, self.checkpoint_dir, state, keep=self.checkpoint_params["keep"]
+        )
+        if self.client is not None:
+            # The files of a checkpoint are uploaded to their own folder, and the state
+            # last, like it is written last
+            *checkpoint_files, state_path = files
+            for path in checkpoint_files:
+                self.client.log_artifact(
+                    self.run_id,
+                    str(path),
+                    f"{CHECKPOINT_ARTIFACT_PATH}/{state.checkpoint}",
+                )
+            self.client.log_artifact(
+                self.run_id, str(state_path), CHECKPOINT_ARTIFACT_PATH
+            )
+            prune_uploaded_checkpoints(
+                self.client, self.run_id, keep=self.checkpoint_params["keep"]
+            )
+        self._steps_since_save = 0
+        self._last_save = time.monotonic()
+        logger.info(
+            f"Saved checkpoint {state.checkpoint} at epoch {epoch}, step {self.step} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+
+class EpochMetricsCallback(keras.callbacks.Callback):
+    """Log the metrics of every epoch to the active run, in place of autolog"""
+
+    def on_epoch_end(self, epoch, logs=None):
+        if logs:
+            get_batch_logger().log_metrics(
+                {name: float(value) for name, value in logs.items()}, step=epoch
+            )
+
+
+def _belongs_to(
+    state: CheckpointState, resume_key: Optional[str], config_hash: str
+) -> bool:
+    if state.resume_key == resume_key and state.config_hash == config_hash:
+        return True
+    logger.warning(
+        f"Ignoring checkpoint {state.checkpoint} of run {state.run_id}, it belongs to "
+        f"the training with resume key {state.resume_key} and config hash "
+        f"{state.config_hash}"
+    )
+    return False
+
+
+def find_checkpoint(
+    checkpoint_dir: Path,
+    tracking_uri: str,
+    experiment_name: str,
+    resume_key: Optional[str] = None,
+    config_hash: str = "",
+) -> Optional[CheckpointState]:
+    """Checkpoint to resume from, in the checkpoint folder or uploaded to the
+    unfinished run with the resume key. None if the training starts from scratch.
+
+    Checkpoints of a training with another resume key or config, e.g. left behind by
+    a failed training, are deleted from the checkpoint folder.
+    """
+    from mlflow.tracking import MlflowClient
+
+    state = load_state(checkpoint_dir)
+    if state is not None and not _belongs_to(state, resume_key, config_hash):
+        shutil.rmtree(checkpoint_dir)
+        state = None
+    if state is None and resume_key:
+        client = MlflowClient(tracking_uri=tracking_uri)
+        run_id = find_resumable_run(client, experiment_name, resume_key)
+        if run_id is not None:
+            state = download_checkpoint(client, run_id, checkpoint_dir)
+        if state is not None and not _belongs_to(state, resume_key, config_hash):
+            shutil.rmtree(checkpoint_dir)
+            state = None
+    return state
@@ -1,34 +1,41 @@
-from typing import Tuple
-
-from hydra import compose, initialize
-from omegaconf import OmegaConf
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
 
+from .config_cache import load_config
 from .logger import logger
 from .types import ModelParameters, TrainingParameters
 
 
-def get_config(config_path="../conf/training", config_name="config") -> dict:
+def get_config(
+    config_path="../conf/training",
+    config_name="config",
+    overrides: Optional[Sequence[str]] = None,
+) -> dict:
     """
-    Load configuration.
+    Load configuration, from its cached snapshot if the config files did not change.
 
     Args:
-      config_path (str): Path relative to the path of the caller,
+      config_path (str): Path relative to the path of this module,
       config_name (str): Name of the config file without YAML extension.
+      overrides (list): Hydra overrides, e.g. ["model_config.num_layers=3"].
 
     Returns:
         dict: Configuration as dictionary.
     """
-
-    with initialize(config_path=config_path):
-        cfg = compose(config_name=config_name, overrides=[])
-        as_dict = OmegaConf.to_container(cfg)
-        assert isinstance(as_dict, dict)
-        return as_dict
+    return load_config(
+        Path(__file__).parent / config_path,
+        config_name=config_name,
+        overrides=overrides,
+    )
 
 
-def get_training_config() -> Tuple[str, ModelParameters, TrainingParameters]:
+def get_training_config(
+    overrides: Optional[Sequence[str]] = None,
+) -> Tuple[str, ModelParameters, TrainingParameters]:
     logger.info("Loading training configuration ")
-    config = get_config(config_path="../conf/training", config_name="config")
+    config = get_config(
+        config_path="../conf/training", config_name="config", overrides=overrides
+    )
 
     model_config = config["model_config"]
     model_name = model_config.pop('name')
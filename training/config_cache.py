@@ -0,0 +1,140 @@
+"""Cache of the composed Hydra configurations as plain JSON snapshots.
+
+Composing a configuration with Hydra imports Hydra, registers the structured configs
+and resolves the defaults lists on every call, which dominates the startup time of
+the CLIs. The composed configuration is therefore resolved once and stored as a JSON
+snapshot, keyed by the hash of the content of the config folder, the config name, the
+overrides and the source of the module of the structured configs. Later calls load the
+snapshot without importing Hydra. Editing any YAML file of the config folder, or the
+dataclasses of the structured configs, changes the key, so stale snapshots are never
+used.
+
+The cache folder is set with the CONFIG_CACHE_DIR environment variable, an empty value
+disables the cache. Snapshots can be created ahead of time, e.g. in the Docker image
+of the pipeline components:
+
+    python -m training.config_cache
+"""
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+import click
+
+from .logger import logger
+
+CONFIG_CACHE_DIR = os.getenv("CONFIG_CACHE_DIR", str(Path(".cache") / "config"))
+CONFIG_CACHE_VERSION = 1
+"""Part of the cache key, to be increased when the snapshot format changes"""
+
+TRAINING_CONFIG_DIR = Path(__file__).parent.parent / "conf" / "training"
+
+
+def hash_config_dir(config_dir: Path) -> str:
+    """Hash of the names and contents of the YAML files of a config folder"""
+    digest = hashlib.sha256()
+    for path in sorted(config_dir.rglob("*.yaml")):
+        digest.update(path.relative_to(config_dir).as_posix().encode())
+        digest.update(b"\0")
+        digest.update(path.read_bytes())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def hash_module_source(function: Callable) -> str:
+    """Hash of the source of the module defining a function, e.g. of the structured
+    config dataclasses registered by it, without importing anything else.
+    """
+    source_file = sys.modules[function.__module__].__file__
+    assert source_file is not None
+    return hashlib.sha256(Path(source_file).read_bytes()).hexdigest()
+
+
+def cache_key(
+    config_dir: Path,
+    config_name: str,
+    overrides: Sequence[str] = (),
+    register: Optional[Callable[[], None]] = None,
+) -> str:
+    key = {
+        "version": CONFIG_CACHE_VERSION,
+        "config_dir": hash_config_dir(config_dir),
+        "config_name": config_name,
+        "overrides": list(overrides),
+    }
+    if register is not None:
+        key["structured_configs"] = hash_module_source(register)
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+
+def compose_config(
+    config_dir: Path, config_name: str, overrides: Sequence[str] = ()
+) -> dict:
+    """Compose a configuration with Hydra and resolve it into a dictionary"""
+    from hydra import compose, initialize_config_dir
+    from omegaconf import OmegaConf
+
+    with initialize_config_dir(config_dir=str(config_dir.resolve())):
+        cfg = compose(config_name=config_name, overrides=list(overrides))
+        as_dict = OmegaConf.to_container(cfg, resolve=True)
+    assert isinstance(as_dict, dict)
+    return as_dict
+
+
+def load_config(
+    config_dir: Path,
+    config_name: str = "config",
+    overrides: Optional[Sequence[str]] = None,
+    cache_dir: Optional[str] = CONFIG_CACHE_DIR,
+    register: Optional[Callable[[], None]] = None,
+) -> dict:
+    """Load a composed configuration from its snapshot, composing it on a cache miss.
+
+    Args:
+        config_dir: Folder of the configuration.
+        config_name: Name of the primary config file without YAML extension.
+        overrides: Hydra overrides, e.g. ["gpu_config=default"].
+        cache_dir: Folder of the snapshots, the cache is disabled if None or empty.
+        register: Function registering the structured configs to the ConfigStore
+            of Hydra, only called when the configuration is composed. The source of
+            its module is part of the cache key.
+
+    Returns:
+        dict: Configuration with the interpolations resolved.
+    """
+    overrides = list(overrides or [])
+    snapshot_path = None
+    if cache_dir:
+        key = cache_key(config_dir, config_name, overrides, register)
+        snapshot_path = Path(cache_dir) / f"{config_name}-{key}.json"
+        if snapshot_path.is_file():
+            logger.info(f"Loading config snapshot {snapshot_path}")
+            return json.loads(snapshot_path.read_text())
+
+    if register is not None:
+        register()
+    config = compose_config(config_dir, config_name, overrides)
+    if snapshot_path is not None:
+        snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        # Written atomically, concurrent components may load the same snapshot
+        tmp_path = snapshot_path.with_name(f"{snapshot_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(config))
+        os.replace(tmp_path, snapshot_path)
+        logger.info(f"Saved config snapshot {snapshot_path}")
+    return config
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.argument("overrides", nargs=-1, type=click.UNPROCESSED)
+def cli(overrides: Sequence[str]):
+    """Create the snapshot of the training configuration with Hydra OVERRIDES"""
+    if not CONFIG_CACHE_DIR:
+        raise click.UsageError("The config cache is disabled, set CONFIG_CACHE_DIR")
+    load_config(TRAINING_CONFIG_DIR, "config", overrides)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,242 @@
+"""Concurrent, resumable and checksum-verified file downloads.
+
+Files are described by a manifest of URLs with optional SHA-256 checksums and sizes.
+Each file is downloaded into a ``.part`` file next to its destination, so that an
+interrupted transfer can be resumed with an HTTP range request on the next attempt.
+"""
+import json
+import socket
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+from .logger import logger
+from .utils import sha256sum
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 1.0
+DEFAULT_TIMEOUT_SECONDS = 30.0
+PARTIAL_SUFFIX = ".part"
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when a downloaded file does not match the checksum in the manifest."""
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    url: str
+    filename: str
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class DownloadResult:
+    filename: str
+    path: Path
+    bytes_downloaded: int
+    seconds: float
+    attempts: int
+    resumed: bool = False
+    skipped: bool = False
+
+    @property
+    def throughput(self) -> float:
+        """Download throughput in bytes per second."""
+        if self.seconds <= 0:
+            return 0.0
+        return self.bytes_downloaded / self.seconds
+
+
+def load_manifest(path: Path) -> List[ManifestEntry]:
+    """Load the list of files to download from a JSON manifest.
+
+    The manifest is a JSON object with a ``files`` list, each item having a ``url``
+    and optionally ``filename`` (defaults to the last URL segment), ``sha256`` and
+    ``size``.
+    """
+    content = json.loads(Path(path).read_text())
+    entries = []
+    for item in content["files"]:
+        url = item["url"]
+        entries.append(
+            ManifestEntry(
+                url=url,
+                filename=item.get("filename") or url.rsplit("/", 1)[-1],
+                sha256=item.get("sha256"),
+                size=item.get("size"),
+            )
+        )
+    return entries
+
+
+def fetch_etag(url: str, timeout: float = DEFAULT_TIMEOUT_SECONDS) -> Optional[str]:
+    """Get the ETag of a remote file with a HEAD request, None if not available"""
+    request = urllib.request.Request(url, method="HEAD")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.headers.get("ETag")
+    except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+        logger.warning(f"Failed to get ETag of {url}: {e}")
+        return None
+
+
+def _is_complete(entry: ManifestEntry, path: Path) -> bool:
+    if not path.is_file():
+        return False
+    if entry.size is not None and path.stat().st_size != entry.size:
+        return False
+    if entry.sha256 is None:
+        # Without a checksum there is no way to tell a stale file from a valid one
+        return False
+    return sha256sum(path) == entry.sha256
+
+
+def _verify(entry: ManifestEntry, path: Path) -> None:
+    if entry.sha256 is None:
+        logger.info(f"No checksum for {entry.filename}, skipping verification")
+        return
+    actual = sha256sum(path)
+    if actual != entry.sha256:
+        raise ChecksumMismatchError(
+            f"Checksum mismatch for {entry.filename}: "
+            f"expected {entry.sha256}, got {actual}"
+        )
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code in (408, 429)
+    return isinstance(
+        error,
+        (urllib.error.URLError, ConnectionError, socket.timeout, ChecksumMismatchError),
+    )
+
+
+def _fetch(
+    entry: ManifestEntry, partial_path: Path, timeout: float, chunk_size: int
+) -> int:
+    """Fetch the remaining bytes of a file into its partial file.
+
+    Returns the number of bytes received over the network.
+    """
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    request = urllib.request.Request(entry.url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset:
+            # The partial file already holds the full content
+            return 0
+        raise
+
+    with response:
+        if offset and response.status != 206:
+            logger.info(f"Range request ignored for {entry.filename}, restarting")
+            offset = 0
+        received = 0
+        with partial_path.open("ab" if offset else "wb") as f:
+            for chunk in iter(lambda: response.read(chunk_size), b""):
+                f.write(chunk)
+                received += len(chunk)
+    return received
+
+
+def download_file(
+    entry: ManifestEntry,
+    output_dir: Path,
+    retries: int = DEFAULT_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> DownloadResult:
+    """Download a single file, resuming a previous partial download if present.
+
+    Args:
+        entry: The file to download.
+        output_dir: Folder to write the file to.
+        retries: Number of retries after the first failed attempt.
+        backoff_seconds: Initial wait between attempts, doubled after each failure.
+        timeout: Socket timeout in seconds.
+        chunk_size: Number of bytes to read from the network at a time.
+
+    Returns:
+        DownloadResult: Statistics of the download.
+    """
+    path = output_dir / entry.filename
+    if _is_complete(entry, path):
+        logger.info(f"File {path} already downloaded and verified")
+        return DownloadResult(entry.filename, path, 0, 0.0, 0, skipped=True)
+
+    partial_path = path.with_name(path.name + PARTIAL_SUFFIX)
+    resumed = partial_path.exists()
+    received = 0
+    start = time.perf_counter()
+    for attempt in range(1, retries + 2):
+        try:
+            logger.info(f"Downloading file: {entry.url} (attempt {attempt})")
+            received += _fetch(entry, partial_path, timeout, chunk_size)
+            _verify(entry, partial_path)
+            partial_path.replace(path)
+            break
+        except Exception as e:
+            if isinstance(e, ChecksumMismatchError):
+                partial_path.unlink()
+            if attempt > retries or not _is_retryable(e):
+                logger.exception(f"Failed to download {entry.url}")
+                raise
+            wait = backoff_seconds * 2 ** (attempt - 1)
+            logger.warning(f"Download of {entry.url} failed ({e}), retry in {wait}s")
+            time.sleep(wait)
+
+    result = DownloadResult(
+        filename=entry.filename,
+        path=path,
+        bytes_downloaded=received,
+        seconds=time.perf_counter() - start,
+        attempts=attempt,
+        resumed=resumed,
+    )
+    logger.info(
+        f"Downloaded {result.filename}: {result.bytes_downloaded} bytes in "
+        f"{result.seconds:.2f}s ({result.throughput / 1e6:.2f} MB/s)"
+    )
+    return result
+
+
+def download_all(
+    entries: Sequence[ManifestEntry],
+    output_dir: Path,
+    max_workers: Optional[int] = None,
+    **kwargs,
+) -> List[DownloadResult]:
+    """Download all files in parallel.
+
+    Keyword arguments are passed on to `download_file`. Results are returned in
+    the order of the given entries.
+    """
+    workers = max_workers or len(entries) or 1
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(download_file, entry, output_dir, **kwargs)
+            for entry in entries
+        ]
+        results = [future.result() for future in futures]
+
+    seconds = time.perf_counter() - start
+    total_bytes = sum(r.bytes_downloaded for r in results)
+    logger.info(
+        f"Downloaded {len(results)} files, {total_bytes} bytes in {seconds:.2f}s "
+        f"using {workers} workers"
+    )
+    return results
@@ -1,25 +1,33 @@
 from pathlib import Path
+from typing import Optional
 
 import click
-from mlflow.tracking import MlflowClient
 
 from .logger import logger
+from .profiling import profile_options, profiled
+from .split import load_split
+from .streaming import ShardedDataset, load_sharded_dataset
 from .tracker import (
     MLFLOW_TRACKING_URI_DESCRIPTION,
+    BatchLogger,
     get_metrics_from_run_id,
     mlflow_default_tracking_uri,
     tag_run,
 )
-from .train import DEFAULT_OUTPUT_FOLDER as DEFAULT_TRAINING_OUTPUT_FOLDER
 from .types import EvaluationResult
 from .utils import (
+    DEFAULT_TRAINING_OUTPUT_FOLDER,
+    MODEL_VERSION_FOLDER,
+    load_dataset_split,
     load_model_training_run_id,
     read_json_from_file,
+    read_processed_data_manifest,
     save_evaluation_result,
 )
 
 DEFAULT_EVALUATION_OUTPUT_FOLDER = Path("output") / "evaluation"
 EVALUATION_OUTPUT_FILE = "result.json"
+PREFIX_VALIDATION_METRICS = "validation_"
 
 
 def compare_metrics(
@@ -50,18 +58,67 @@ def _read_threshold_metrics(file_path: Path) -> dict:
         raise
 
 
+def evaluate_validation_split(training_output_dir: Path, data_dir: Path) -> dict:
+    """Evaluate the trained model on the validation samples of its training.
+
+    The validation samples are selected from the training data by the split indices
+    saved by the training step, see `training.split.load_split`.
+    """
+    import keras
+
+    from .model import evaluate_model
+
+    split = load_split(training_output_dir)
+    if len(split.validation) == 0:
+        logger.info("The training used no validation samples")
+        return {}
+    if read_processed_data_manifest(data_dir) is not None:
+        # Only the validation samples are read from the memory-mapped shards
+        train_data = load_sharded_dataset(data_dir, split="train")
+    else:
+        train_data = ShardedDataset.from_arrays(
+            load_dataset_split(data_dir, split="train")
+        )
+    validation_data = train_data.take(split.validation)
+    logger.info(f"Evaluating the model on {len(split.validation)} validation samples")
+    model = keras.models.load_model(training_output_dir / MODEL_VERSION_FOLDER)
+    metrics = evaluate_model(model=model, test_data=validation_data)
+    return {
+        f"{PREFIX_VALIDATION_METRICS}{name}": float(value)
+        for name, value in metrics.items()
+    }
+
+
 def run_evaluate(
     training_output_dir: Path,
     output_dir: Path,
     threshold_metrics_file_path: Path,
     mlflow_tracking_uri: str,
+    validation_data_dir: Optional[Path] = None,
 ) -> None:
+    """Compare the metrics of the training run with the thresholds.
+
+    Args:
+        validation_data_dir: Processed data of the training. If set, the model is
+            also evaluated on the validation samples of its training, and these
+            metrics, prefixed with `validation_`, are logged to the run and compared
+            too.
+    """
+    from mlflow.tracking import MlflowClient
+
     logger.info(f"Reading training output from {training_output_dir}")
     run_id = load_model_training_run_id(
         training_output_dir=training_output_dir
     )
     client = MlflowClient(tracking_uri=mlflow_tracking_uri)
     training_metrics = get_metrics_from_run_id(run_id=run_id, client=client)
+    if validation_data_dir is not None:
+        validation_metrics = evaluate_validation_split(
+            training_output_dir, validation_data_dir
+        )
+        with BatchLogger(client, run_id) as batch_logger:
+            batch_logger.log_metrics(validation_metrics)
+        training_metrics = {**training_metrics, **validation_metrics}
 
     logger.info(f"Using threshold metrics file: {threshold_metrics_file_path}")
     threshold_metrics = _read_threshold_metrics(threshold_metrics_file_path)
@@ -101,11 +158,22 @@ def run_evaluate(
     default=DEFAULT_EVALUATION_OUTPUT_FOLDER,
     help="Path to the folder containing the evaluation outcomes",
 )
+@click.option(
+    "--validation-data",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="""Processed data of the training. If set, the model is also evaluated on the
+    validation samples of the split saved by the training""",
+)
+@profile_options
 def cli(
     training_output_dir: str,
     threshold_metrics_file: str,
     mlflow_tracking_uri: str,
     output_dir: str,
+    validation_data: Optional[str],
+    profile: Optional[str],
+    profile_memory: bool,
 ):
     """
     This script reads the evaluation metrics generated during training (stored in
@@ -119,12 +187,23 @@ def cli(
     output_dir = Path(output_dir).resolve()
     threshold_metrics_file_path = Path(threshold_metrics_file).resolve()
 
-    run_evaluate(
-        training_output_dir=training_output_dir,
-        output_dir=output_dir,
-        mlflow_tracking_uri=mlflow_tracking_uri,
-        threshold_metrics_file_path=threshold_metrics_file_path,
-    )
+    with profiled(
+        "evaluate",
+        output_dir,
+        profile,
+        memory=profile_memory,
+        run_id_dir=training_output_dir,
+        tracking_uri=mlflow_tracking_uri,
+    ):
+        run_evaluate(
+            training_output_dir=training_output_dir,
+            output_dir=output_dir,
+            mlflow_tracking_uri=mlflow_tracking_uri,
+            threshold_metrics_file_path=threshold_metrics_file_path,
+            validation_data_dir=Path(validation_data).resolve()
+            if validation_data
+            else None,
+        )
 
 
 if __name__ == "__main__":
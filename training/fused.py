@@ -0,0 +1,175 @@
+"""Pull, preprocess and train in a single step.
+
+The separate pipeline steps each write their full output to the artifact store, from
+where the next step downloads it again. For small and medium datasets this staging
+takes longer than the computation. This step downloads the raw data to a local
+folder, and passes the arrays in memory from loading to preprocessing to training.
+The training outputs and the MLflow run are the same as those of the training step,
+so the evaluation and registration steps are unchanged.
+"""
+import tempfile
+from pathlib import Path
+from typing import Mapping, Optional
+
+import click
+
+from .config import get_training_config
+from .logger import logger
+from .preprocess_data import IMAGE_DTYPES, preprocess_data
+from .profiling import profile_options, profiled
+from .pull_data import DEFAULT_MANIFEST_FILE, pull_data
+from .tracker import MLFLOW_TRACKING_URI_DESCRIPTION, mlflow_default_tracking_uri
+from .train import DEFAULT_OUTPUT_FOLDER, train_on_data
+from .types import ModelParameters, TrainingParameters
+from .utils import CustomParamType, load_raw_data
+
+
+def run_fused(
+    model: str,
+    experiment_name: str,
+    tracking_uri: str,
+    output_dir: Path,
+    experiment_parameters: Mapping[str, str],
+    training_parameters: TrainingParameters,
+    model_parameters: ModelParameters,
+    mlflow_s3_endpoint_url: str = None,
+    input_data: Optional[Path] = None,
+    manifest_path: Path = Path(DEFAULT_MANIFEST_FILE),
+    cache_dir: Optional[Path] = None,
+    image_dtype: str = "uint8",
+) -> None:
+    """Pull the data, preprocess it in memory and train the model on it.
+
+    Args:
+        input_data: Folder of already pulled raw data, the data is pulled if None.
+        manifest_path: Manifest of the data files to pull.
+        cache_dir: Dataset cache folder shared between runs of the pull.
+        image_dtype: Dtype of the preprocessed images.
+
+    See `training.train.train_with_tracking` for the other arguments.
+    """
+    with tempfile.TemporaryDirectory(prefix="raw-data-") as tmp_dir:
+        if input_data is None:
+            input_data = Path(tmp_dir)
+            pull_data(
+                output_path=input_data, manifest_path=manifest_path, cache_dir=cache_dir
+            )
+        train_images, train_labels, test_images, test_labels = preprocess_data(
+            load_raw_data(input_data, max_workers=4), image_dtype=image_dtype
+        )
+
+    logger.info(f"Training on {len(train_images)} preprocessed samples in memory")
+    train_on_data(
+        model=model,
+        experiment_name=experiment_name,
+        tracking_uri=tracking_uri,
+        train_data={"x": train_images, "y": train_labels},
+        test_data={"x": test_images, "y": test_labels},
+        output_dir=output_dir,
+        experiment_parameters=experiment_parameters,
+        training_parameters=training_parameters,
+        model_parameters=model_parameters,
+        mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+    )
+
+
+@click.command()
+@click.argument(
+    "experiment",
+    type=str,
+)
+@click.option(
+    "--mlflow-tracking-uri",
+    type=str,
+    default=mlflow_default_tracking_uri(),
+    help=MLFLOW_TRACKING_URI_DESCRIPTION,
+)
+@click.option(
+    "--mlflow-s3-endpoint-url",
+    type=str,
+    default=None,
+    help="MLflow S3 endpoint to use as artifact store",
+)
+@click.option(
+    "--input-data",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="Folder of already pulled raw data, the data is pulled if unset",
+)
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False),
+    default=DEFAULT_MANIFEST_FILE,
+    help="Path to the JSON manifest listing the file URLs and SHA-256 checksums",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Path to a dataset cache folder shared between runs",
+)
+@click.option(
+    "--image-dtype",
+    type=click.Choice(IMAGE_DTYPES),
+    default="uint8",
+    help="Dtype of the preprocessed images",
+)
+@click.option(
+    "--output-dir",
+    "-o",
+    default=DEFAULT_OUTPUT_FOLDER,
+    help="Path to the folder containing the training outcomes",
+)
+@click.option(
+    "--experiment-parameters",
+    type=CustomParamType(),
+    help="""Additional experiment parameters to be logged by the tracking service.
+    In the form of comma-separated KEY=VALUE.
+    E.g. --experiment-parameters one=two,otherKey=otherVal""",
+)
+@profile_options
+def cli(
+    experiment: str,
+    mlflow_tracking_uri: str,
+    mlflow_s3_endpoint_url: Optional[str],
+    input_data: Optional[str],
+    manifest: str,
+    cache_dir: Optional[str],
+    image_dtype: str,
+    output_dir: str,
+    experiment_parameters,
+    profile: Optional[str],
+    profile_memory: bool,
+):
+    """Pull and preprocess the data and train the model in a single step"""
+    output_path = Path(output_dir).resolve()
+    logger.info(f"Writing all output to {output_path}")
+
+    model_name, model_parameters, training_parameters = get_training_config()
+
+    with profiled(
+        "data_train",
+        output_path,
+        profile,
+        memory=profile_memory,
+        run_id_dir=output_path,
+        tracking_uri=mlflow_tracking_uri,
+    ):
+        run_fused(
+            model=model_name,
+            experiment_name=experiment,
+            tracking_uri=mlflow_tracking_uri,
+            mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+            output_dir=output_path,
+            experiment_parameters=experiment_parameters,
+            training_parameters=training_parameters,
+            model_parameters=model_parameters,
+            input_data=Path(input_data).resolve() if input_data else None,
+            manifest_path=Path(manifest).resolve(),
+            cache_dir=Path(cache_dir).resolve() if cache_dir else None,
+            image_dtype=image_dtype,
+        )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,231 @@
+"""Reader for files in the IDX format used by the (Fashion-)MNIST datasets.
+
+An IDX file starts with a magic number encoding the data type and the number of
+dimensions, followed by the size of each dimension as big endian 32-bit integers and
+the data itself. See http://yann.lecun.com/exdb/mnist/ for the specification.
+
+The payload can be read in fixed size chunks, so that arbitrarily large files can be
+processed with bounded memory. Reading the whole file at once is the special case of a
+single chunk. Uncompressed files can also be memory-mapped, optionally after
+decompressing a gzipped file once into a cache folder.
+"""
+import gzip
+import shutil
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .logger import logger
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+IDX_DTYPES = {
+    0x08: np.dtype(">u1"),
+    0x09: np.dtype(">i1"),
+    0x0B: np.dtype(">i2"),
+    0x0C: np.dtype(">i4"),
+    0x0D: np.dtype(">f4"),
+    0x0E: np.dtype(">f8"),
+}
+"""Map IDX data type codes to numpy dtypes. Multi-byte values are big endian."""
+
+
+@dataclass(frozen=True)
+class IdxHeader:
+    dtype: np.dtype
+    shape: Tuple[int, ...]
+    offset: int
+
+    @property
+    def item_shape(self) -> Tuple[int, ...]:
+        """Shape of a single item, e.g. an image"""
+        return self.shape[1:]
+
+    @property
+    def item_size(self) -> int:
+        """Number of bytes of a single item"""
+        return int(np.prod(self.item_shape, dtype=np.int64)) * self.dtype.itemsize
+
+    @property
+    def payload_size(self) -> int:
+        """Number of bytes of the data following the header"""
+        return self.shape[0] * self.item_size
+
+
+def is_gzipped(path: Path) -> bool:
+    with path.open("rb") as f:
+        return f.read(2) == GZIP_MAGIC
+
+
+@contextmanager
+def open_idx(path: Path) -> Iterator[BinaryIO]:
+    """Open an IDX file, decompressing it on the fly if it is gzipped"""
+    with path.open("rb") as f:
+        if f.read(2) == GZIP_MAGIC:
+            f.seek(0)
+            with gzip.open(f, "rb") as gz:
+                yield gz  # type: ignore
+        else:
+            f.seek(0)
+            yield f
+
+
+def read_idx_header(f: BinaryIO) -> IdxHeader:
+    """Read the header of an IDX file from the beginning of a binary stream"""
+    magic = f.read(4)
+    if len(magic) != 4 or magic[:2] != b"\x00\x00":
+        raise ValueError("Not an IDX file: invalid magic number")
+    dtype_code, ndim = magic[2], magic[3]
+    if dtype_code not in IDX_DTYPES:
+        raise ValueError(f"Unsupported IDX data type code {dtype_code:#04x}")
+    if ndim == 0:
+        raise ValueError("Not an IDX file: no dimensions")
+    dims = f.read(4 * ndim)
+    if len(dims) != 4 * ndim:
+        raise ValueError("Not an IDX file: truncated header")
+    shape = struct.unpack(f">{ndim}I", dims)
+    return IdxHeader(dtype=IDX_DTYPES[dtype_code], shape=shape, offset=4 + 4 * ndim)
+
+
+def _read_exact(f: BinaryIO, buffer: bytearray) -> int:
+    view, total = memoryview(buffer), 0
+    while total < len(buffer):
+        read = f.readinto(view[total:])  # type: ignore
+        if not read:
+            break
+        total += read
+    return total
+
+
+def iter_idx_chunks(
+    path: Path, chunk_items: Optional[int] = None
+) -> Iterator[np.ndarray]:
+    """Iterate over the items of an IDX file in chunks.
+
+    Args:
+        path: Path to the IDX file, optionally gzipped.
+        chunk_items: Number of items, e.g. images, per chunk. The whole file is read
+            as a single chunk if None.
+
+    Yields:
+        np.ndarray: Chunks of shape (n, *item_shape) in native byte order, each in its
+            own buffer.
+    """
+    with open_idx(path) as f:
+        header = read_idx_header(f)
+        n_items = header.shape[0]
+        dtype = header.dtype.newbyteorder("=")
+        if n_items == 0:
+            yield np.empty(header.shape, dtype=dtype)
+            return
+        chunk_items = chunk_items or n_items
+        logger.info(
+            f"Reading {n_items} items of shape {header.item_shape} from {path} "
+            f"in chunks of {chunk_items}"
+        )
+        for start in range(0, n_items, chunk_items):
+            count = min(chunk_items, n_items - start)
+            buffer = bytearray(count * header.item_size)
+            if _read_exact(f, buffer) != len(buffer):
+                raise ValueError(
+                    f"Unexpected end of IDX file {path}: expected {n_items} items"
+                )
+            chunk = np.frombuffer(buffer, dtype=header.dtype)
+            if header.dtype != dtype:
+                # Swap bytes in place, the buffer is owned by the chunk
+                chunk = chunk.byteswap(inplace=True).view(dtype)
+            yield chunk.reshape(count, *header.item_shape)
+        if f.read(1):
+            raise ValueError(
+                f"IDX file {path} is longer than the {n_items} items in its header"
+            )
+
+
+def read_idx_shape(path: Path) -> Tuple[int, ...]:
+    """Read the shape of the data in an IDX file without reading the payload"""
+    with open_idx(path) as f:
+        return read_idx_header(f).shape
+
+
+def decompress_idx(path: Path, cache_dir: Path) -> Path:
+    """Decompress a gzipped IDX file into the cache folder, unless already done.
+
+    The decompressed file is named after the original file without the ".gz" suffix
+    and is reused while it is newer than the original file.
+    """
+    target = cache_dir / (path.name[:-3] if path.name.endswith(".gz") else path.name)
+    if target.exists() and target.stat().st_mtime >= path.stat().st_mtime:
+        return target
+
+    logger.info(f"Decompressing {path} to {target}")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(target.name + ".tmp")
+    with open_idx(path) as src, tmp_path.open("wb") as dst:
+        shutil.copyfileobj(src, dst, length=1024 * 1024)
+    tmp_path.replace(target)
+    return target
+
+
+def memmap_idx(path: Path) -> np.memmap:
+    """Memory-map the payload of an uncompressed IDX file as a read-only array.
+
+    The array keeps the big endian dtype of the file, so no data is copied.
+    """
+    if is_gzipped(path):
+        raise ValueError(f"Cannot memory-map gzipped IDX file {path}")
+    with path.open("rb") as f:
+        header = read_idx_header(f)
+    actual_size = path.stat().st_size - header.offset
+    if actual_size != header.payload_size:
+        raise ValueError(
+            f"IDX file {path} has {actual_size} bytes of data, "
+            f"expected {header.payload_size} for shape {header.shape}"
+        )
+    return np.memmap(
+        path, dtype=header.dtype, mode="r", offset=header.offset, shape=header.shape
+    )
+
+
+def write_idx(
+    path: Path, array: np.ndarray, compresslevel: int = 6, chunk_items: int = 10000
+) -> Path:
+    """Write an array as an IDX file, gzipped if the file name ends with ".gz".
+
+    The array is written in chunks of items, so that only a chunk is converted to big
+    endian at a time.
+    """
+    codes = {dtype.newbyteorder("="): code for code, dtype in IDX_DTYPES.items()}
+    code = codes.get(array.dtype.newbyteorder("="))
+    if code is None:
+        raise ValueError(f"Unsupported IDX dtype {array.dtype}")
+    header = bytes([0, 0, code, array.ndim])
+    header += b"".join(struct.pack(">I", dim) for dim in array.shape)
+    big_endian = array.dtype.newbyteorder(">")
+
+    if path.name.endswith(".gz"):
+        f: BinaryIO = gzip.open(path, "wb", compresslevel=compresslevel)
+    else:
+        f = path.open("wb")
+    with f:
+        f.write(header)
+        for start in range(0, len(array), chunk_items):
+            chunk = np.ascontiguousarray(array[start:start + chunk_items], big_endian)
+            f.write(chunk.data)
+    return path
+
+
+def read_idx(path: Path, cache_dir: Optional[Path] = None) -> np.ndarray:
+    """Read a complete IDX file as a single array.
+
+    If a cache folder is given, the file is decompressed into it once and returned
+    as a memory-mapped array instead of being read into memory.
+    """
+    if cache_dir is not None:
+        uncompressed = decompress_idx(path, cache_dir) if is_gzipped(path) else path
+        return memmap_idx(uncompressed)
+    (array,) = iter_idx_chunks(path)
+    return array
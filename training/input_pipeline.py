@@ -0,0 +1,263 @@
+"""tf.data input pipelines for model training.
+
+Feeding `model.fit` with NumPy arrays makes Keras slice and copy batches on the host
+thread, without any overlap with the computation. The pipelines built here batch the
+data in parallel and prefetch the next batches while the current one is trained on.
+The "streaming" mode feeds the pipeline from memory-mapped shards that are not loaded
+into memory, see `training.streaming`.
+"""
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from .logger import logger
+from .split import Split, make_split, take
+from .streaming import ShardedDataset, StreamingSource
+from .types import TrainingParameters
+
+INPUT_PIPELINE_MODES = ("numpy", "tf_data", "streaming")
+
+AUTOTUNE = -1
+"""Let tf.data tune the level of parallelism, same as tf.data.AUTOTUNE"""
+
+SampleTransform = Callable[[tf.Tensor, tf.Tensor], Tuple[tf.Tensor, tf.Tensor]]
+
+
+def get_input_pipeline_parameters(params: TrainingParameters) -> dict:
+    """Input pipeline parameters from the training parameters, with defaults"""
+    defaults = {
+        "mode": "numpy",
+        "shuffle_buffer_size": 0,
+        "cache": False,
+        "prefetch": True,
+        "num_parallel_calls": AUTOTUNE,
+        "block_size": 1024,
+        "prefetch_blocks": 8,
+        "num_threads": 2,
+    }
+    return {**defaults, **params.get("input_pipeline", {})}
+
+
+def make_dataset(
+    x: np.ndarray,
+    y: np.ndarray,
+    batch_size: int,
+    shuffle_buffer_size: int = 0,
+    cache: bool = False,
+    prefetch: bool = True,
+    num_parallel_calls: int = AUTOTUNE,
+    transform: Optional[SampleTransform] = None,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """Build a batched dataset from arrays of samples and labels.
+
+    Args:
+        x: Samples.
+        y: Labels.
+        batch_size: Number of samples per batch.
+        shuffle_buffer_size: Size of the shuffle buffer, no shuffling if 0.
+        cache: Cache the samples in memory after the first epoch.
+        prefetch: Prepare the next batches while the current batch is trained on.
+        num_parallel_calls: Parallelism of the transform and batching, AUTOTUNE to
+            let tf.data decide.
+        transform: Optional per-sample transformation, e.g. data augmentation.
+            Applied after caching so that it is evaluated again every epoch.
+        seed: Random seed of the shuffling.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((x, y))
+    if cache:
+        dataset = dataset.cache()
+    if shuffle_buffer_size:
+        dataset = dataset.shuffle(
+            shuffle_buffer_size, seed=seed, reshuffle_each_iteration=True
+        )
+    if transform is not None:
+        dataset = dataset.map(transform, num_parallel_calls=num_parallel_calls)
+    dataset = dataset.batch(batch_size, num_parallel_calls=num_parallel_calls)
+    if prefetch:
+        dataset = dataset.prefetch(AUTOTUNE)
+    return dataset
+
+
+def make_indexed_dataset(
+    x: np.ndarray,
+    y: np.ndarray,
+    indices: np.ndarray,
+    batch_size: int,
+    shuffle_buffer_size: int = 0,
+    prefetch: bool = True,
+    num_parallel_calls: int = AUTOTUNE,
+    transform: Optional[SampleTransform] = None,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """Build a batched dataset that gathers the batches from the arrays by index.
+
+    Only the indices are held and shuffled by tf.data, the samples of each batch are
+    gathered from the (possibly memory-mapped) arrays when the batch is needed. No
+    copy of the selected samples is made up front.
+
+    Args:
+        x: Samples.
+        y: Labels.
+        indices: Indices of the samples to include.
+        batch_size: Number of samples per batch.
+        shuffle_buffer_size: Size of the shuffle buffer of the indices, no shuffling
+            if 0.
+        prefetch: Prepare the next batches while the current batch is trained on.
+        num_parallel_calls: Number of batches gathered in parallel, AUTOTUNE to let
+            tf.data decide.
+        transform: Optional per-sample transformation, e.g. data augmentation.
+        seed: Random seed of the shuffling.
+    """
+
+    def gather(batch_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        batch_indices = np.sort(batch_indices)
+        return take(x, batch_indices), take(y, batch_indices)
+
+    def gather_batch(batch_indices: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        x_batch, y_batch = tf.numpy_function(
+            gather, [batch_indices], (tf.as_dtype(x.dtype), tf.as_dtype(y.dtype))
+        )
+        x_batch.set_shape((None, *x.shape[1:]))
+        y_batch.set_shape((None, *y.shape[1:]))
+        return x_batch, y_batch
+
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle_buffer_size:
+        dataset = dataset.shuffle(
+            shuffle_buffer_size, seed=seed, reshuffle_each_iteration=True
+        )
+    dataset = dataset.batch(batch_size)
+    dataset = dataset.map(gather_batch, num_parallel_calls=num_parallel_calls)
+    if transform is not None:
+        dataset = (
+            dataset.unbatch()
+            .map(transform, num_parallel_calls=num_parallel_calls)
+            .batch(batch_size)
+        )
+    if prefetch:
+        dataset = dataset.prefetch(AUTOTUNE)
+    return dataset
+
+
+def make_split_dataset(
+    x: np.ndarray,
+    y: np.ndarray,
+    indices: np.ndarray,
+    params: TrainingParameters,
+    training: bool,
+    transform: Optional[SampleTransform] = None,
+) -> tf.data.Dataset:
+    """Build the dataset of one side of the split from the training parameters.
+
+    With `cache` the selected samples are held in memory, otherwise the batches are
+    gathered from the arrays by index.
+    """
+    pipeline = get_input_pipeline_parameters(params)
+    shuffle_buffer_size = pipeline["shuffle_buffer_size"] if training else 0
+    transform = transform if training else None
+    if pipeline["cache"]:
+        return make_dataset(
+            take(x, indices),
+            take(y, indices),
+            batch_size=params["batch_size"],
+            shuffle_buffer_size=shuffle_buffer_size,
+            cache=True,
+            prefetch=pipeline["prefetch"],
+            num_parallel_calls=pipeline["num_parallel_calls"],
+            transform=transform,
+            seed=params.get("seed"),
+        )
+    return make_indexed_dataset(
+        x,
+        y,
+        indices,
+        batch_size=params["batch_size"],
+        shuffle_buffer_size=shuffle_buffer_size,
+        prefetch=pipeline["prefetch"],
+        num_parallel_calls=pipeline["num_parallel_calls"],
+        transform=transform,
+        seed=params.get("seed"),
+    )
+
+
+def make_train_validation_datasets(
+    x: np.ndarray,
+    y: np.ndarray,
+    params: TrainingParameters,
+    transform: Optional[SampleTransform] = None,
+    split: Optional[Split] = None,
+) -> Tuple[tf.data.Dataset, Optional[tf.data.Dataset]]:
+    """Build the training and validation datasets from the training parameters.
+
+    The samples are split by the given split, or by the `validation_split` and
+    `split` training parameters if None. Only the training dataset is shuffled and
+    transformed.
+    """
+    if split is None:
+        split = make_split(y, params)
+    logger.info(
+        f"Building tf.data pipeline with {len(split.train)} training and "
+        f"{len(split.validation)} validation samples: "
+        f"{get_input_pipeline_parameters(params)}"
+    )
+
+    train_dataset = make_split_dataset(
+        x, y, split.train, params, training=True, transform=transform
+    )
+    if len(split.validation) == 0:
+        return train_dataset, None
+
+    validation_dataset = make_split_dataset(
+        x, y, split.validation, params, training=False
+    )
+    return train_dataset, validation_dataset
+
+
+def make_streaming_dataset(source: StreamingSource, prefetch: bool = True):
+    """Wrap a streaming source of batches into a tf.data dataset"""
+    x, y = source.dataset.shards[0]["x"], source.dataset.shards[0]["y"]
+    dataset = tf.data.Dataset.from_generator(
+        lambda: iter(source),
+        output_signature=(
+            tf.TensorSpec((None, *x.shape[1:]), tf.as_dtype(x.dtype)),
+            tf.TensorSpec((None, *y.shape[1:]), tf.as_dtype(y.dtype)),
+        ),
+    )
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(len(source)))
+    if prefetch:
+        dataset = dataset.prefetch(AUTOTUNE)
+    return dataset
+
+
+def make_streaming_train_validation_datasets(
+    dataset: ShardedDataset, params: TrainingParameters, split: Split
+) -> Tuple[tf.data.Dataset, Optional[tf.data.Dataset]]:
+    """Build the training and validation datasets streaming from sharded data"""
+    pipeline = get_input_pipeline_parameters(params)
+    logger.info(
+        f"Streaming {len(split.train)} training and {len(split.validation)} "
+        f"validation samples from {len(dataset.shards)} shards: {pipeline}"
+    )
+    options = {
+        "batch_size": params["batch_size"],
+        "block_size": pipeline["block_size"],
+        "prefetch_blocks": pipeline["prefetch_blocks"],
+        "num_threads": pipeline["num_threads"],
+    }
+    train_source = StreamingSource(
+        dataset,
+        indices=split.train,
+        shuffle_buffer_size=pipeline["shuffle_buffer_size"],
+        seed=params.get("seed"),
+        **options,
+    )
+    train_dataset = make_streaming_dataset(train_source, pipeline["prefetch"])
+    if len(split.validation) == 0:
+        return train_dataset, None
+
+    validation_source = StreamingSource(dataset, indices=split.validation, **options)
+    return train_dataset, make_streaming_dataset(
+        validation_source, pipeline["prefetch"]
+    )
@@ -0,0 +1,130 @@
+"""Instrumentation of the training throughput.
+
+A Keras callback records the duration of every training step and the time between the
+steps, aggregates them into percentiles per epoch and logs them to MLflow through the
+batch logger of `training.tracker`, optionally also to a Prometheus textfile. It only
+takes two clock readings per step, the aggregation is done once per epoch.
+
+The step time includes fetching the batch from a tf.data pipeline, which happens
+inside the compiled train function. The data wait time is the time spent between two
+steps outside of it, e.g. by Python input generators and other callbacks. An input
+bound training shows up as step times that drop when the prefetching is increased.
+"""
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import keras
+import numpy as np
+
+from .logger import logger
+from .tracker import log_metrics_if_active
+from .types import TrainingParameters
+from .utils import peak_rss_bytes
+
+METRICS_PREFIX = "throughput_"
+PERCENTILES = (50, 90, 99)
+
+
+def get_instrumentation_parameters(params: TrainingParameters) -> dict:
+    """Instrumentation parameters from the training parameters, with defaults"""
+    defaults = {"enabled": True, "prometheus_textfile": None}
+    return {**defaults, **params.get("instrumentation", {})}
+
+
+def _percentiles(name: str, values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    results = np.percentile(values, PERCENTILES)
+    return {f"{name}_p{p}": float(value) for p, value in zip(PERCENTILES, results)}
+
+
+def write_prometheus_textfile(metrics: Dict[str, float], path: Path) -> None:
+    """Write gauges in the Prometheus text format, e.g. for the node exporter.
+
+    The file is replaced atomically so that a scrape never reads a partial file.
+    """
+    lines = []
+    for name, value in sorted(metrics.items()):
+        metric = f"training_{name}"
+        lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+class ThroughputCallback(keras.callbacks.Callback):
+    """Record step time, data wait time, samples per second and peak memory.
+
+    Args:
+        batch_size: Number of samples per batch.
+        steps_per_execution: Number of batches per call of the train function, the
+            batch callbacks are called once per call.
+        prometheus_textfile: Optional file to also write the metrics of the last
+            epoch to.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        steps_per_execution: int = 1,
+        prometheus_textfile: Optional[Path] = None,
+    ):
+        super().__init__()
+        # The logs are not read, do not convert them to NumPy after every batch
+        self._supports_tf_logs = True
+        self.samples_per_call = batch_size * steps_per_execution
+        self.prometheus_textfile = prometheus_textfile
+        self.epoch_metrics: List[Dict[str, float]] = []
+        self._step_seconds: List[float] = []
+        self._wait_seconds: List[float] = []
+        self._batch_begin = self._batch_end = self._epoch_begin = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._step_seconds, self._wait_seconds = [], []
+        self._epoch_begin = self._batch_end = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._batch_begin = time.perf_counter()
+        self._wait_seconds.append(self._batch_begin - self._batch_end)
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._batch_end = time.perf_counter()
+        self._step_seconds.append(self._batch_end - self._batch_begin)
+
+    def on_epoch_end(self, epoch, logs=None):
+        steps = len(self._step_seconds)
+        busy_seconds = sum(self._step_seconds) + sum(self._wait_seconds)
+        metrics = {
+            **_percentiles("step_seconds", self._step_seconds),
+            **_percentiles("data_wait_seconds", self._wait_seconds),
+            "samples_per_second": (
+                steps * self.samples_per_call / busy_seconds if busy_seconds else 0.0
+            ),
+            "epoch_seconds": time.perf_counter() - self._epoch_begin,
+            "peak_rss_bytes": float(peak_rss_bytes()),
+        }
+        self.epoch_metrics.append(metrics)
+        logger.info(f"Throughput of epoch {epoch}: {metrics}")
+        log_metrics_if_active(
+            {f"{METRICS_PREFIX}{name}": value for name, value in metrics.items()},
+            step=epoch,
+        )
+        if self.prometheus_textfile is not None:
+            write_prometheus_textfile(metrics, self.prometheus_textfile)
+
+
+def make_throughput_callback(
+    params: TrainingParameters,
+) -> Optional[ThroughputCallback]:
+    """Throughput callback configured by the training parameters, None if disabled"""
+    instrumentation = get_instrumentation_parameters(params)
+    if not instrumentation["enabled"]:
+        return None
+    textfile = instrumentation["prometheus_textfile"]
+    return ThroughputCallback(
+        batch_size=params["batch_size"],
+        steps_per_execution=params.get("steps_per_execution", 1),
+        prometheus_textfile=Path(textfile) if textfile else None,
+    )
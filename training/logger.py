@@ -1,8 +1,27 @@
+"""Structured JSON logging of the application.
+
+The logging is configured with environment variables:
+
+- LOG_LEVEL: Minimum level of the logged events.
+- LOG_MODE: "sync" renders and writes the events on the logging thread, "async" hands
+  them to a background thread through a queue, keeping the I/O off the hot path.
+- LOG_CALLSITE: "full" looks up the module, file and line of the caller on every call,
+  "cached" caches the lookup per call site and "off" skips it.
+- LOG_SAMPLE_RATES: Fraction of the events to keep per level, e.g.
+  "debug=0.01,info=0.5". Levels not listed are not sampled.
+"""
+import atexit
 import logging
 import os
+import queue
+import random
+import sys
 import threading
 from contextlib import contextmanager
 from logging import config
+from logging.handlers import QueueHandler, QueueListener
+from types import CodeType, FrameType
+from typing import Dict, Optional, TextIO, Tuple
 
 import structlog
 from structlog import contextvars
@@ -11,34 +30,78 @@ from structlog.types import EventDict
 APPLICATION_NAME = "cloud-agnostic-training"
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MODE = os.getenv("LOG_MODE", "sync")
+LOG_CALLSITE = os.getenv("LOG_CALLSITE", "cached")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+LOG_MODES = ("sync", "async")
+CALLSITE_MODES = ("full", "cached", "off")
 
+# The handlers are set up by configure_logging
 _LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "formatters": {
-        "json_formatter": {
-            "()": structlog.stdlib.ProcessorFormatter,
-            "processor": structlog.processors.JSONRenderer(),
-        },
-    },
-    "handlers": {
-        "console": {"class": "logging.StreamHandler", "formatter": "json_formatter"}
-    },
-    "loggers": {APPLICATION_NAME: {"handlers": ["console"], "level": LOG_LEVEL}},
+    "loggers": {APPLICATION_NAME: {"level": LOG_LEVEL}},
 }
 
 
+_settings = {"callsite": LOG_CALLSITE, "sample_rates": {}}
+
+_IGNORED_MODULES = ("structlog", __name__)
+_code_modules: Dict[CodeType, Optional[str]] = {}
+"""Module of the code of each seen frame, None for logging internals"""
+_callsites: Dict[Tuple[CodeType, int], dict] = {}
+
+
+def _find_app_frame() -> Tuple[FrameType, str]:
+    """Find the frame of the caller outside of structlog and this module.
+
+    Same as `structlog._frames._find_first_app_frame_and_name`, but whether the code
+    of a frame is logging internals is only determined once per code object.
+    """
+    frame = sys._getframe(1)
+    while True:
+        code = frame.f_code
+        if code not in _code_modules:
+            name = frame.f_globals.get("__name__") or "?"
+            _code_modules[code] = None if name.startswith(_IGNORED_MODULES) else name
+        name = _code_modules[code]
+        if name is not None:
+            return frame, name
+        if frame.f_back is None:
+            return frame, "?"
+        frame = frame.f_back
+
+
+def _callsite_context() -> dict:
+    callsite = _settings["callsite"]
+    if callsite == "full":
+        frame, module_str = structlog._frames._find_first_app_frame_and_name(  # type: ignore  # noqa: E501
+            additional_ignores=[__name__]
+        )
+        return {
+            "module": module_str,
+            "file": frame.f_code.co_filename,
+            "lineno": frame.f_lineno,
+        }
+    frame, module_str = _find_app_frame()
+    key = (frame.f_code, frame.f_lineno)
+    if key not in _callsites:
+        _callsites[key] = {
+            "module": module_str,
+            "file": frame.f_code.co_filename,
+            "lineno": frame.f_lineno,
+        }
+    return _callsites[key]
+
+
 def _add_context(
     logger: logging.Logger, method_name: str, event_dict: EventDict
 ) -> EventDict:
     """https://github.com/jrobichaud/django-structlog/issues/29#issuecomment-600991068"""  # noqa: E501
     try:
-        frame, module_str = structlog._frames._find_first_app_frame_and_name(  # type: ignore  # noqa: E501
-            additional_ignores=[__name__]
-        )
-        event_dict["module"] = module_str
-        event_dict["file"] = frame.f_code.co_filename
-        event_dict["lineno"] = frame.f_lineno
+        if _settings["callsite"] != "off":
+            event_dict.update(_callsite_context())
         event_dict["thread"] = threading.current_thread().name
         event_dict["application"] = APPLICATION_NAME
     except Exception:
@@ -47,12 +110,102 @@ def _add_context(
         return event_dict
 
 
+def _sample_by_level(
+    logger: logging.Logger, method_name: str, event_dict: EventDict
+) -> EventDict:
+    """Drop a random part of the events of the levels with a sample rate"""
+    rate = _settings["sample_rates"].get(method_name)
+    if rate is not None and random.random() >= rate:
+        raise structlog.DropEvent
+    return event_dict
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Parse sample rates per level in the form "debug=0.01,info=0.5" """
+    rates = {}
+    for item in filter(None, value.split(",")):
+        level, _, rate = item.partition("=")
+        try:
+            rates[level.strip().lower()] = float(rate)
+        except ValueError:
+            raise ValueError(f"Invalid log sample rate '{item}', expected LEVEL=RATE")
+    return rates
+
+
+class _EventQueueHandler(QueueHandler):
+    """Queue the records as they are, with the event dict of structlog unrendered.
+
+    The event dict is created for each call and not modified afterwards, so it can be
+    rendered by the listener thread. QueueHandler would render it on this thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(
+    mode: str = LOG_MODE,
+    callsite: str = LOG_CALLSITE,
+    sample_rates: str = LOG_SAMPLE_RATES,
+    stream: Optional[TextIO] = None,
+) -> None:
+    """(Re)configure the logging, see the module documentation for the options.
+
+    Args:
+        mode: "sync" or "async" writing of the events.
+        callsite: "full", "cached" or "off" lookup of the caller.
+        sample_rates: Fraction of the events to keep per level.
+        stream: Stream to write the events to, stderr if None.
+    """
+    global _listener
+    if mode not in LOG_MODES:
+        raise ValueError(f"Unsupported log mode '{mode}', expected one of {LOG_MODES}")
+    if callsite not in CALLSITE_MODES:
+        raise ValueError(
+            f"Unsupported call site mode '{callsite}', expected one of {CALLSITE_MODES}"
+        )
+    _settings["callsite"] = callsite
+    _settings["sample_rates"] = parse_sample_rates(sample_rates)
+
+    console = logging.StreamHandler(stream)
+    console.setFormatter(
+        structlog.stdlib.ProcessorFormatter(
+            processor=structlog.processors.JSONRenderer()
+        )
+    )
+    _stop_listener()
+    app_logger = logging.getLogger(APPLICATION_NAME)
+    for handler in list(app_logger.handlers):
+        app_logger.removeHandler(handler)
+        handler.close()
+    if mode == "async":
+        events: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = QueueListener(events, console, respect_handler_level=True)
+        _listener.start()
+        app_logger.addHandler(_EventQueueHandler(events))
+    else:
+        app_logger.addHandler(console)
+
+
 config.dictConfig(_LOGGING)
+configure_logging()
+atexit.register(_stop_listener)
 
 structlog.configure(
     processors=[
         contextvars.merge_contextvars,
         structlog.stdlib.filter_by_level,
+        _sample_by_level,
         structlog.processors.TimeStamper(fmt="iso"),
         structlog.stdlib.add_logger_name,
         structlog.stdlib.add_log_level,
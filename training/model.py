@@ -2,14 +2,24 @@
 
 The purpose is to partially decouple the model from the training script.
 """
+import inspect
 import json
 import os
 from pathlib import Path
-from typing import Callable, Mapping
+from typing import Callable, List, Mapping, Optional, Union
 
 import keras
 
+from .input_pipeline import (
+    get_input_pipeline_parameters,
+    make_streaming_train_validation_datasets,
+    make_train_validation_datasets,
+)
+from .instrumentation import make_throughput_callback
 from .logger import logger
+from .schedules import DEFAULT_LEARNING_RATE, make_schedule_callbacks
+from .split import Split, make_split, take
+from .streaming import ShardedDataset
 from .types import (
     EvaluationMetrics,
     Model,
@@ -21,9 +31,11 @@ from .types import (
 from .utils import PARAMETERS_FILENAME
 
 
-def build_model(model_parameters) -> Model:
+def build_model(model_parameters, training_parameters=None) -> Model:
     """Function to build a specific model"""
+    training_parameters = training_parameters or {}
     inputs = keras.Input(shape=(28, 28), name="image_floats")
+    # The model owns the input normalisation, the preprocessed data keeps raw pixels
     x = keras.layers.Rescaling(1.0 / 255)(inputs)
     x = keras.layers.Flatten()(x)
     for _ in range(model_parameters["num_layers"]):
@@ -31,9 +43,14 @@ def build_model(model_parameters) -> Model:
     outputs = keras.layers.Dense(10, activation="softmax")(x)
     model = keras.Model(inputs=inputs, outputs=outputs)
     model.compile(
-        optimizer="adam",
+        optimizer=keras.optimizers.Adam(
+            learning_rate=training_parameters.get(
+                "learning_rate", DEFAULT_LEARNING_RATE
+            )
+        ),
         loss="sparse_categorical_crossentropy",
         metrics=["acc"],
+        steps_per_execution=training_parameters.get("steps_per_execution", 1),
     )
     return model
 
@@ -42,11 +59,16 @@ MODELS_FACTORY: Mapping[str, Callable[..., Model]] = {
     "baseline": build_model,
 }
 """Map a model name with a build function. This is used to support declaring and
- training different type of model
+ training different type of model. The build functions take the model parameters and,
+ optionally, the training parameters, e.g. to configure the compilation of the model.
 """
 
 
-def get_model(model_name: str, model_parameters: ModelParameters) -> Model:
+def get_model(
+    model_name: str,
+    model_parameters: ModelParameters,
+    training_parameters: TrainingParameters = None,
+) -> Model:
     """Builds and returns the indicated model from the model factory.
 
     Args:
@@ -54,6 +76,8 @@ def get_model(model_name: str, model_parameters: ModelParameters) -> Model:
             MODELS_FACTORY.
         model_parameters (dict): Dictionary of parameters to pass to the model factory
             function.
+        training_parameters (dict): Training parameters that affect the compilation
+            of the model, e.g. `steps_per_execution`.
 
     Returns:
         Model: Model built with the indicated model_parameters and ready for training.
@@ -62,26 +86,104 @@ def get_model(model_name: str, model_parameters: ModelParameters) -> Model:
         raise ValueError(f"Unsupported model `{model_name}`")
 
     logger.info(f"Compiling model {model_name} with parameters {model_parameters}")
-    model = MODELS_FACTORY[model_name](model_parameters)
+    build = MODELS_FACTORY[model_name]
+    if _accepts_training_parameters(build):
+        model = build(model_parameters, training_parameters or {})
+    else:
+        model = build(model_parameters)
 
     return model
 
 
+def _accepts_training_parameters(build: Callable[..., Model]) -> bool:
+    """Whether a build function takes the training parameters after the model
+    parameters, build functions of a single argument compile the model themselves.
+    """
+    parameters = list(inspect.signature(build).parameters.values())
+    positional = [
+        p
+        for p in parameters
+        if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+    ]
+    return len(positional) > 1 or any(p.kind == p.VAR_POSITIONAL for p in parameters)
+
+
+def make_callbacks(params: TrainingParameters) -> List[keras.callbacks.Callback]:
+    """Callbacks of the training configured by the training parameters"""
+    callbacks = []
+    throughput_callback = make_throughput_callback(params)
+    if throughput_callback is not None:
+        callbacks.append(throughput_callback)
+    callbacks += make_schedule_callbacks(params)
+    return callbacks
+
+
 def train_model(
     model: Model,
-    train_data: TrainData,
+    train_data: Union[TrainData, ShardedDataset],
     params: TrainingParameters,
+    split: Optional[Split] = None,
+    callbacks: Optional[List[keras.callbacks.Callback]] = None,
+    initial_epoch: int = 0,
 ):  # type: ignore
     """Train the model with the given data and parameter
+
+    The data is split into training and validation samples by the given split, or by
+    the `validation_split` and `split` training parameters if None. It is fed from
+    NumPy arrays, through a tf.data pipeline or streamed from sharded data depending
+    on the `input_pipeline.mode` training parameter. The given callbacks are used in
+    addition to the ones configured by the training parameters. A training resumed
+    from a checkpoint starts at `initial_epoch`.
     """
     logger.info(f"Training the model with training parameters {params}")
+    callbacks = make_callbacks(params) + list(callbacks or [])
+    mode = get_input_pipeline_parameters(params)["mode"]
+    if mode == "streaming":
+        if not isinstance(train_data, ShardedDataset):
+            train_data = ShardedDataset.from_arrays(train_data)
+        if split is None:
+            split = make_split(train_data.labels, params)
+        train_dataset, validation_dataset = make_streaming_train_validation_datasets(
+            train_data, params=params, split=split
+        )
+        return model.fit(
+            train_dataset,
+            epochs=params["epochs"],
+            initial_epoch=initial_epoch,
+            validation_data=validation_dataset,
+            callbacks=callbacks,
+        )
+
     x_train, y_train = train_data["x"], train_data["y"]
+    if split is None:
+        split = make_split(y_train, params)
+
+    if mode == "tf_data":
+        train_dataset, validation_dataset = make_train_validation_datasets(
+            x_train, y_train, params=params, split=split
+        )
+        return model.fit(
+            train_dataset,
+            epochs=params["epochs"],
+            initial_epoch=initial_epoch,
+            validation_data=validation_dataset,
+            callbacks=callbacks,
+        )
+
+    validation_data = None
+    if len(split.validation):
+        validation_data = (
+            take(x_train, split.validation),
+            take(y_train, split.validation),
+        )
     return model.fit(
-        x_train,
-        y_train,
+        take(x_train, split.train),
+        take(y_train, split.train),
         batch_size=params["batch_size"],
         epochs=params["epochs"],
-        validation_split=params["validation_split"],
+        initial_epoch=initial_epoch,
+        validation_data=validation_data,
+        callbacks=callbacks,
     )
 
 
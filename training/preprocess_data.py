@@ -1,26 +1,139 @@
+import json
 from pathlib import Path
+from typing import Dict, Iterator, Optional
 
 import click
+import numpy as np
 
+from .idx import iter_idx_chunks, read_idx_shape
 from .logger import logger
+from .profiling import profile_options, profiled
 from .types import PreprocessedData, RawData
-from .utils import load_raw_data, save_processed_data
+from .utils import (
+    PROCESSED_DATA_FORMATS,
+    ShardedNpyWriter,
+    directory_size,
+    load_raw_data,
+    mnist_paths,
+    peak_rss_bytes,
+    save_processed_data,
+    write_processed_data_manifest,
+)
+
+IMAGE_DTYPES = ("uint8", "float32")
+"""Supported dtypes of the preprocessed images. The pixel values are kept in the
+range [0, 255] in both cases: normalisation is owned by the `Rescaling` layer of the
+model, so that the served model takes raw pixel values as input.
+"""
+PREPROCESS_STATS_FILE = "preprocess_stats.json"
+DEFAULT_SHARD_SIZE = 60000
+
 
+def preprocess_images(images: np.ndarray, image_dtype: str = "uint8") -> np.ndarray:
+    """Preprocess a batch of images, used for the whole dataset as well as chunks"""
+    if image_dtype not in IMAGE_DTYPES:
+        raise ValueError(f"Unsupported image dtype `{image_dtype}`")
+    # astype does not copy when the images already have the requested dtype
+    return images.astype(image_dtype, copy=False)
 
-def preprocess_data(data: RawData) -> PreprocessedData:
-    logger.info("Preprocessing data")
+
+def preprocess_data(data: RawData, image_dtype: str = "uint8") -> PreprocessedData:
+    logger.info(f"Preprocessing data with image dtype {image_dtype}")
     train_images, train_labels, test_images, test_labels = data
-    train_images = train_images / 255
-    test_images = test_images / 255
+    train_images = preprocess_images(train_images, image_dtype=image_dtype)
+    test_images = preprocess_images(test_images, image_dtype=image_dtype)
     return train_images, train_labels, test_images, test_labels
 
 
-def run_preprocess(input_data: Path, output_dir: Path) -> None:
-    loaded_data = load_raw_data(input_data)
+def iter_preprocessed_chunks(
+    images_path: Path, labels_path: Path, chunk_size: int, image_dtype: str = "uint8"
+) -> Iterator[Dict[str, np.ndarray]]:
+    """Read, decompress and preprocess images and labels chunk by chunk"""
+    images = iter_idx_chunks(images_path, chunk_items=chunk_size)
+    labels = iter_idx_chunks(labels_path, chunk_items=chunk_size)
+    for image_chunk, label_chunk in zip(images, labels):
+        yield {
+            "x": preprocess_images(image_chunk, image_dtype=image_dtype),
+            "y": label_chunk.reshape(-1, 1),
+        }
+
 
-    preprocessed_data = preprocess_data(data=loaded_data)
+def count_items(images_path: Path, labels_path: Path) -> int:
+    """Number of items of an IDX images and labels pair, read from their headers.
 
-    save_processed_data(data=preprocessed_data, output_dir=output_dir)
+    Raises:
+        ValueError: If the files do not have the same number of items, the chunks of
+            images and labels would not match.
+    """
+    n_images, n_labels = read_idx_shape(images_path)[0], read_idx_shape(labels_path)[0]
+    if n_images != n_labels:
+        raise ValueError(
+            f"{images_path} has {n_images} images but {labels_path} has "
+            f"{n_labels} labels"
+        )
+    return n_images
+
+
+def run_streaming_preprocess(
+    input_data: Path,
+    output_dir: Path,
+    chunk_size: int,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    image_dtype: str = "uint8",
+) -> None:
+    """Preprocess the data chunk by chunk and write it to .npy shards.
+
+    Only one chunk of the dataset is held in memory at a time, so the peak memory
+    usage depends on the chunk size rather than the size of the dataset.
+    """
+    logger.info(
+        f"Preprocessing data from {input_data} in chunks of {chunk_size} items "
+        f"into shards of {shard_size} items"
+    )
+    splits = {}
+    for split in ("train", "test"):
+        images_path, labels_path = mnist_paths(input_data, kind=split)
+        n_items = count_items(images_path, labels_path)
+        writer = ShardedNpyWriter(output_dir, split, n_items, shard_size)
+        for chunk in iter_preprocessed_chunks(
+            images_path, labels_path, chunk_size=chunk_size, image_dtype=image_dtype
+        ):
+            writer.write(chunk)
+        splits[split] = writer.close()
+
+    write_processed_data_manifest(splits, output_dir=output_dir)
+    _report_stats(output_dir, image_dtype=image_dtype, data_format="npy")
+
+
+def _report_stats(output_dir: Path, image_dtype: str, data_format: str) -> None:
+    stats = {
+        "image_dtype": image_dtype,
+        "data_format": data_format,
+        "artifact_size_bytes": directory_size(output_dir),
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+    logger.info(f"Preprocessing stats: {stats}")
+    (output_dir / PREPROCESS_STATS_FILE).write_text(json.dumps(stats))
+
+
+def run_preprocess(
+    input_data: Path,
+    output_dir: Path,
+    data_format: str = "npz",
+    image_dtype: str = "uint8",
+    idx_cache_dir: Optional[Path] = None,
+    load_workers: int = 1,
+) -> None:
+    loaded_data = load_raw_data(
+        input_data, cache_dir=idx_cache_dir, max_workers=load_workers
+    )
+
+    preprocessed_data = preprocess_data(data=loaded_data, image_dtype=image_dtype)
+
+    save_processed_data(
+        data=preprocessed_data, output_dir=output_dir, data_format=data_format
+    )
+    _report_stats(output_dir, image_dtype=image_dtype, data_format=data_format)
 
 
 @click.command()
@@ -36,19 +149,106 @@ def run_preprocess(input_data: Path, output_dir: Path) -> None:
     default="data",
     help="Path to the folder containing the preprocessed data",
 )
+@click.option(
+    "--data-format",
+    type=click.Choice(PROCESSED_DATA_FORMATS),
+    default="npz",
+    help="""Format of the preprocessed data. 'npz' writes compressed archives,
+    'npy' writes uncompressed arrays that are memory-mapped when loaded""",
+)
+@click.option(
+    "--image-dtype",
+    type=click.Choice(IMAGE_DTYPES),
+    default="uint8",
+    help="""Dtype of the preprocessed images. Pixel values are not normalised,
+    this is done by the model""",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="""Preprocess the data in chunks of this many items to bound the memory
+    usage. Requires the 'npy' data format""",
+)
+@click.option(
+    "--shard-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_SHARD_SIZE,
+    help="Maximum number of items per output file when preprocessing in chunks",
+)
+@click.option(
+    "--idx-cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="""Folder to decompress the input files to. The decompressed files are
+    memory-mapped instead of being read into memory""",
+)
+@click.option(
+    "--load-workers",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Number of input files to read and decompress concurrently",
+)
+@profile_options
 def cli(
     input_data: str,
     output_dir: str,
+    data_format: str,
+    image_dtype: str,
+    chunk_size: Optional[int],
+    shard_size: int,
+    idx_cache_dir: Optional[str],
+    load_workers: int,
+    profile: Optional[str],
+    profile_memory: bool,
 ):
     """This script preprocesses the data"""
     output_dir = Path(output_dir).resolve()
     output_dir.mkdir(parents=True, exist_ok=True)
+    if chunk_size is not None and data_format != "npy":
+        raise click.UsageError("--chunk-size requires --data-format npy")
+
+    with profiled("preprocess_data", output_dir, profile, memory=profile_memory):
+        _preprocess(
+            input_data=Path(input_data).resolve(),
+            output_dir=output_dir,
+            data_format=data_format,
+            image_dtype=image_dtype,
+            chunk_size=chunk_size,
+            shard_size=shard_size,
+            idx_cache_dir=Path(idx_cache_dir).resolve() if idx_cache_dir else None,
+            load_workers=load_workers,
+        )
+
+
+def _preprocess(
+    input_data: Path,
+    output_dir: Path,
+    data_format: str,
+    image_dtype: str,
+    chunk_size: Optional[int],
+    shard_size: int,
+    idx_cache_dir: Optional[Path],
+    load_workers: int,
+) -> None:
+    if chunk_size is not None:
+        run_streaming_preprocess(
+            input_data=input_data,
+            output_dir=output_dir,
+            chunk_size=chunk_size,
+            shard_size=shard_size,
+            image_dtype=image_dtype,
+        )
+        return
 
     run_preprocess(
-        input_data=Path(input_data).resolve(),
-        output_dir=output_dir
+        input_data=input_data,
+        output_dir=output_dir,
+        data_format=data_format,
+        image_dtype=image_dtype,
+        idx_cache_dir=idx_cache_dir,
+        load_workers=load_workers,
     )
-    return
 
 
 if __name__ == "__main__":
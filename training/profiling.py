@@ -0,0 +1,138 @@
+"""Profiling of the pipeline steps, switched on with the `--profile` CLI options.
+
+The step runs under cProfile or the TensorFlow profiler, optionally with tracemalloc
+tracing the memory allocations. The profiles are written to the `profile` folder of
+the output folder of the step and logged as artifacts of the MLflow run: the active
+run, or else the run whose id was saved by the training step.
+
+cProfile only profiles the main thread. The TensorFlow profile is viewed with the
+profile plugin of TensorBoard, `tensorboard --logdir <output dir>/profile/tensorflow`.
+"""
+import cProfile
+import io
+import pstats
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import click
+
+from .logger import logger
+from .utils import RUN_ID_FILE_NAME, load_model_training_run_id
+
+PROFILERS = ("cprofile", "tensorflow")
+PROFILE_FOLDER = "profile"
+TOP_ENTRIES = 50
+
+
+def profile_options(function: Callable) -> Callable:
+    """Add the `--profile` and `--profile-memory` options to a click command"""
+    function = click.option(
+        "--profile-memory",
+        is_flag=True,
+        default=False,
+        help="Trace the memory allocations of the step with tracemalloc",
+    )(function)
+    return click.option(
+        "--profile",
+        type=click.Choice(PROFILERS),
+        default=None,
+        help="""Profile the step with cProfile or the TensorFlow profiler. The
+        profile is written to the output folder and logged to the MLflow run""",
+    )(function)
+
+
+def _write_cprofile(profiler: cProfile.Profile, profile_dir: Path, name: str) -> None:
+    profiler.dump_stats(profile_dir / f"{name}.prof")
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_ENTRIES)
+    (profile_dir / f"{name}-cprofile.txt").write_text(report.getvalue())
+
+
+def _write_memory_report(profile_dir: Path, name: str) -> None:
+    current, peak = tracemalloc.get_traced_memory()
+    top_stats = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ENTRIES]
+    lines = [f"Current traced memory: {current} bytes, peak: {peak} bytes", ""]
+    lines += [str(stat) for stat in top_stats]
+    (profile_dir / f"{name}-memory.txt").write_text("\n".join(lines) + "\n")
+
+
+def log_profile(
+    profile_dir: Path,
+    name: str,
+    run_id_dir: Optional[Path] = None,
+    tracking_uri: Optional[str] = None,
+) -> None:
+    """Log the profile to the active MLflow run or to the run saved in a folder"""
+    artifact_path = f"{PROFILE_FOLDER}/{name}"
+    mlflow = sys.modules.get("mlflow")
+    if mlflow is not None and mlflow.active_run() is not None:
+        mlflow.log_artifacts(str(profile_dir), artifact_path)
+    elif run_id_dir is not None and (run_id_dir / RUN_ID_FILE_NAME).is_file():
+        from mlflow.tracking import MlflowClient
+
+        run_id = load_model_training_run_id(training_output_dir=run_id_dir)
+        client = MlflowClient(tracking_uri=tracking_uri)
+        client.log_artifacts(run_id, str(profile_dir), artifact_path)
+    else:
+        logger.info("No MLflow run to log the profile to")
+        return
+    logger.info(f"Logged profile to MLflow artifacts {artifact_path}")
+
+
+@contextmanager
+def profiled(
+    name: str,
+    output_dir: Path,
+    profiler: Optional[str] = None,
+    memory: bool = False,
+    run_id_dir: Optional[Path] = None,
+    tracking_uri: Optional[str] = None,
+) -> Iterator[None]:
+    """Profile the code in the context, nothing is done if no profiling is requested.
+
+    Args:
+        name: Name of the step, used as name of the profile files.
+        output_dir: Output folder of the step, the profiles are written to its
+            `profile` folder.
+        profiler: "cprofile", "tensorflow" or None.
+        memory: Trace the memory allocations.
+        run_id_dir: Folder with the saved id of the run to log the profile to if
+            there is no active run, e.g. the output folder of the training.
+        tracking_uri: MLflow tracking URI of that run.
+    """
+    if profiler is None and not memory:
+        yield
+        return
+
+    profile_dir = output_dir / PROFILE_FOLDER
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    logger.info(f"Profiling {name} with {profiler}, memory: {memory}")
+    if memory:
+        tracemalloc.start()
+    if profiler == "tensorflow":
+        import tensorflow as tf
+
+        tf.profiler.experimental.start(str(profile_dir / "tensorflow"))
+    elif profiler == "cprofile":
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    try:
+        yield
+    finally:
+        if profiler == "tensorflow":
+            tf.profiler.experimental.stop()
+        elif profiler == "cprofile":
+            cprofile.disable()
+            _write_cprofile(cprofile, profile_dir, name)
+        if memory:
+            _write_memory_report(profile_dir, name)
+            tracemalloc.stop()
+        logger.info(f"Wrote profile of {name} to {profile_dir}")
+        try:
+            log_profile(profile_dir, name, run_id_dir, tracking_uri)
+        except Exception:
+            logger.exception("Failed to log the profile to MLflow")
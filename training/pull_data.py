@@ -1,22 +1,107 @@
 from pathlib import Path
+from typing import List, Optional
 
 import click
-import wget
 
+from .cache import LINK_MODES, DatasetCache
+from .download import (
+    DEFAULT_BACKOFF_SECONDS,
+    DEFAULT_RETRIES,
+    DEFAULT_TIMEOUT_SECONDS,
+    DownloadResult,
+    ManifestEntry,
+    download_all,
+    fetch_etag,
+    load_manifest,
+)
 from .logger import logger
+from .profiling import profile_options, profiled
+
+DEFAULT_MANIFEST_FILE = "conf/data_manifest.json"
+
+
+def _pull_with_cache(
+    data_files: List[ManifestEntry],
+    output_path: Path,
+    cache: DatasetCache,
+    timeout: float,
+    **kwargs,
+) -> List[DownloadResult]:
+    """Serve files from the cache and download only the missing ones"""
+    misses, etags, used = [], {}, []
+    for entry in data_files:
+        # The manifest checksum addresses the content directly, without the network
+        etag = None if entry.sha256 else fetch_etag(entry.url, timeout=timeout)
+        cached_path = cache.lookup(entry, etag=etag)
+        if cached_path:
+            logger.info(f"Cache hit for {entry.filename}")
+            cache.link(cached_path, output_path / entry.filename)
+            used.append(cached_path)
+        else:
+            logger.info(f"Cache miss for {entry.filename}")
+            misses.append(entry)
+            etags[entry.url] = etag
+    logger.info(
+        f"Dataset cache: {len(data_files) - len(misses)} hits, {len(misses)} misses"
+    )
+
+    results = download_all(misses, output_dir=output_path, timeout=timeout, **kwargs)
+    for entry, result in zip(misses, results):
+        object_path = cache.add(entry, result.path, etag=etags[entry.url])
+        cache.link(object_path, result.path)
+        used.append(object_path)
+
+    # The objects of this pull may be symlinked into the output, they are kept
+    cache.evict(protected=used)
+    return results
 
 
-def pull_data(output_path: Path):
-    data_files = [
-        "http://fashion-mnist.s3-website.eu-central-1.amazonaws.com/train-images-idx3-ubyte.gz",  # noqa: E501
-        "http://fashion-mnist.s3-website.eu-central-1.amazonaws.com/train-labels-idx1-ubyte.gz",  # noqa: E501
-        "http://fashion-mnist.s3-website.eu-central-1.amazonaws.com/t10k-images-idx3-ubyte.gz",   # noqa: E501
-        "http://fashion-mnist.s3-website.eu-central-1.amazonaws.com/t10k-labels-idx1-ubyte.gz",   # noqa: E501
-    ]
+def pull_data(
+    output_path: Path,
+    manifest_path: Path = Path(DEFAULT_MANIFEST_FILE),
+    max_workers: int = None,
+    retries: int = DEFAULT_RETRIES,
+    backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+    timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    cache_dir: Optional[Path] = None,
+    cache_max_size_bytes: Optional[int] = None,
+    cache_link_mode: str = "hardlink",
+):
+    """Download all files listed in the manifest to the output path in parallel.
 
-    for file_url in data_files:
-        logger.info(f"Downloading file: {file_url}")
-        wget.download(file_url, out=str(output_path))
+    Args:
+        output_path: Folder to write the downloaded files to.
+        manifest_path: JSON manifest of the file URLs and their SHA-256 checksums.
+        max_workers: Number of parallel downloads, defaults to one per file.
+        retries: Number of retries per file after the first failed attempt.
+        backoff_seconds: Initial wait between retries, doubled after each failure.
+        timeout: Socket timeout in seconds.
+        cache_dir: Folder of a dataset cache shared between runs. Files found in the
+            cache are not downloaded.
+        cache_max_size_bytes: Size limit of the cache, least recently used files are
+            evicted when exceeded.
+        cache_link_mode: How cached files are placed in the output path, one of
+            "hardlink", "symlink" or "copy".
+    """
+    logger.info(f"Reading data manifest from {manifest_path}")
+    data_files = load_manifest(manifest_path)
+    download_args = dict(
+        max_workers=max_workers,
+        retries=retries,
+        backoff_seconds=backoff_seconds,
+        timeout=timeout,
+    )
+
+    if cache_dir is None:
+        return download_all(data_files, output_dir=output_path, **download_args)
+
+    logger.info(f"Using dataset cache at {cache_dir}")
+    cache = DatasetCache(
+        cache_dir=cache_dir,
+        max_size_bytes=cache_max_size_bytes,
+        link_mode=cache_link_mode,
+    )
+    return _pull_with_cache(data_files, output_path, cache, **download_args)
 
 
 @click.command()
@@ -26,15 +111,83 @@ def pull_data(output_path: Path):
     default="./data/fashion-mnist",
     help="Path to the folder containing the downloaded data",
 )
-def cli(output_dir: str):
-    """This script preprocesses the data"""
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False),
+    default=DEFAULT_MANIFEST_FILE,
+    help="Path to the JSON manifest listing the file URLs and SHA-256 checksums",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    default=None,
+    help="Number of parallel downloads, defaults to one per file",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=DEFAULT_RETRIES,
+    help="Number of retries per file after a failed download",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=DEFAULT_TIMEOUT_SECONDS,
+    help="Socket timeout in seconds",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Path to a dataset cache folder shared between runs",
+)
+@click.option(
+    "--cache-max-size-mb",
+    type=int,
+    default=None,
+    help="Maximum size of the dataset cache in megabytes",
+)
+@click.option(
+    "--cache-link-mode",
+    type=click.Choice(LINK_MODES),
+    default="hardlink",
+    help="How cached files are placed in the output folder",
+)
+@profile_options
+def cli(
+    output_dir: str,
+    manifest: str,
+    max_workers: int,
+    retries: int,
+    timeout: float,
+    cache_dir: str,
+    cache_max_size_mb: int,
+    cache_link_mode: str,
+    profile: Optional[str],
+    profile_memory: bool,
+):
+    """This script downloads the data"""
 
     logger.info(f"Download data to {output_dir}")
 
     output_path: Path = Path(output_dir).resolve()
     output_path.mkdir(exist_ok=True, parents=True)
 
-    pull_data(output_path=output_path)
+    with profiled("pull_data", output_path, profile, memory=profile_memory):
+        pull_data(
+            output_path=output_path,
+            manifest_path=Path(manifest).resolve(),
+            max_workers=max_workers,
+            retries=retries,
+            timeout=timeout,
+            cache_dir=Path(cache_dir).resolve() if cache_dir else None,
+            cache_max_size_bytes=(
+                cache_max_size_mb * 1024 * 1024
+                if cache_max_size_mb is not None
+                else None
+            ),
+            cache_link_mode=cache_link_mode,
+        )
 
 
 if __name__ == "__main__":
@@ -1,15 +1,22 @@
 from pathlib import Path
+from typing import Optional
 
 import click
 
 from .evaluate import DEFAULT_EVALUATION_OUTPUT_FOLDER
+from .profiling import profile_options, profiled
 from .tracker import (
     MLFLOW_TRACKING_URI_DESCRIPTION,
     mlflow_default_tracking_uri,
     register_model,
 )
-from .train import DEFAULT_OUTPUT_FOLDER as DEFAULT_TRAINING_OUTPUT_FOLDER
-from .utils import load_evaluation_result, load_model_training_run_id
+from .utils import (
+    DEFAULT_TRAINING_OUTPUT_FOLDER,
+    load_evaluation_result,
+    load_model_training_run_id,
+)
+
+DEFAULT_REGISTRATION_OUTPUT_FOLDER = Path("output") / "registration"
 
 
 def run_register(
@@ -56,20 +63,38 @@ def run_register(
     default=mlflow_default_tracking_uri(),
     help=MLFLOW_TRACKING_URI_DESCRIPTION,
 )
+@click.option(
+    "--output-dir",
+    "-o",
+    default=DEFAULT_REGISTRATION_OUTPUT_FOLDER,
+    help="Path to the folder to write the profile of the step to",
+)
+@profile_options
 def cli(
     model_registry_name: str,
     training_output_dir: str,
     evaluation_output_dir: str,
     mlflow_tracking_uri: str,
+    output_dir: str,
+    profile: Optional[str],
+    profile_memory: bool,
 ):
     """This script register a trained model if it passes the evaluation criteria.
     """
-    run_register(
-        mlflow_tracking_uri=mlflow_tracking_uri,
-        model_registry_name=model_registry_name,
-        training_output_dir=Path(training_output_dir),
-        evaluation_output_dir=Path(evaluation_output_dir),
-    )
+    with profiled(
+        "register",
+        Path(output_dir),
+        profile,
+        memory=profile_memory,
+        run_id_dir=Path(training_output_dir),
+        tracking_uri=mlflow_tracking_uri,
+    ):
+        run_register(
+            mlflow_tracking_uri=mlflow_tracking_uri,
+            model_registry_name=model_registry_name,
+            training_output_dir=Path(training_output_dir),
+            evaluation_output_dir=Path(evaluation_output_dir),
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+"""Early stopping and learning rate schedules of the training.
+
+Both are configured by the training parameters. The learning rate is either constant,
+reduced when the monitored metric plateaus, or decayed along a cosine over the epochs.
+Early stopping ends the training when the monitored metric stopped improving and
+restores the weights of the best epoch.
+
+The number of epochs saved by early stopping and the time and epochs it took to reach
+the target value of the monitored metric, if one is set, are logged to the MLflow run
+at the end of the training.
+"""
+import math
+import time
+from typing import Dict, List, Optional
+
+import keras
+
+from .logger import logger
+from .tracker import log_metrics_if_active
+from .types import TrainingParameters
+
+LR_SCHEDULES = ("constant", "plateau", "cosine")
+DEFAULT_LEARNING_RATE = 0.001
+
+
+def get_lr_schedule_parameters(params: TrainingParameters) -> dict:
+    """Learning rate schedule parameters from the training parameters, with defaults"""
+    defaults = {
+        "name": "constant",
+        "monitor": "val_loss",
+        "factor": 0.5,
+        "patience": 2,
+        "min_learning_rate": 0.0,
+    }
+    schedule = {**defaults, **params.get("lr_schedule", {})}
+    if schedule["name"] not in LR_SCHEDULES:
+        raise ValueError(
+            f"Unsupported learning rate schedule '{schedule['name']}', "
+            f"expected one of {LR_SCHEDULES}"
+        )
+    return schedule
+
+
+def get_early_stopping_parameters(params: TrainingParameters) -> dict:
+    """Early stopping parameters from the training parameters, with defaults"""
+    defaults = {
+        "enabled": False,
+        "monitor": "val_acc",
+        "patience": 3,
+        "min_delta": 0.0,
+        "restore_best_weights": True,
+        "target": None,
+    }
+    return {**defaults, **params.get("early_stopping", {})}
+
+
+def cosine_learning_rate(
+    epoch: int, epochs: int, initial: float, minimum: float = 0.0
+) -> float:
+    """Learning rate of an epoch decayed from initial to minimum along a cosine"""
+    progress = epoch / max(1, epochs)
+    return minimum + 0.5 * (initial - minimum) * (1 + math.cos(math.pi * progress))
+
+
+def _improved(monitor: str, value: float, reference: float) -> bool:
+    # Like the 'auto' mode of the Keras callbacks, accuracies increase
+    if "acc" in monitor:
+        return value >= reference
+    return value <= reference
+
+
+class EarlyStoppingReport(keras.callbacks.Callback):
+    """Record when the target of the monitored metric is reached and the epochs run.
+
+    Args:
+        epochs: Number of epochs the training is configured to run.
+        monitor: Metric compared against the target.
+        target: Value of the metric to record the time to, None to not record it.
+    """
+
+    def __init__(self, epochs: int, monitor: str, target: Optional[float] = None):
+        super().__init__()
+        self.epochs = epochs
+        self.monitor = monitor
+        self.target = target
+        self.metrics: Dict[str, float] = {}
+        self._start = 0.0
+        self._first_epoch: Optional[int] = None
+        self._last_epoch: Optional[int] = None
+
+    def on_train_begin(self, logs=None):
+        self._start = time.perf_counter()
+        self.metrics = {}
+        self._first_epoch = self._last_epoch = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        if self._first_epoch is None:
+            self._first_epoch = epoch
+
+    def on_epoch_end(self, epoch, logs=None):
+        self._last_epoch = epoch
+        value = (logs or {}).get(self.monitor)
+        if (
+            self.target is not None
+            and value is not None
+            and "time_to_target_seconds" not in self.metrics
+            and _improved(self.monitor, value, self.target)
+        ):
+            assert self._first_epoch is not None
+            self.metrics["time_to_target_seconds"] = time.perf_counter() - self._start
+            self.metrics["epochs_to_target"] = float(epoch - self._first_epoch + 1)
+            logger.info(f"Reached {self.monitor}={value} at epoch {epoch}")
+
+    def on_train_end(self, logs=None):
+        if self._last_epoch is None or self._first_epoch is None:
+            return
+        self.metrics.update(
+            {
+                "epochs_run": float(self._last_epoch - self._first_epoch + 1),
+                "epochs_saved": float(self.epochs - self._last_epoch - 1),
+                "training_seconds": time.perf_counter() - self._start,
+            }
+        )
+        logger.info(f"Early stopping report: {self.metrics}")
+        log_metrics_if_active(
+            {f"early_stopping_{name}": value for name, value in self.metrics.items()}
+        )
+
+
+def make_schedule_callbacks(
+    params: TrainingParameters,
+) -> List[keras.callbacks.Callback]:
+    """Learning rate schedule and early stopping callbacks of the training parameters"""
+    callbacks: List[keras.callbacks.Callback] = []
+    schedule = get_lr_schedule_parameters(params)
+    if schedule["name"] == "plateau":
+        callbacks.append(
+            keras.callbacks.ReduceLROnPlateau(
+                monitor=schedule["monitor"],
+                factor=schedule["factor"],
+                patience=schedule["patience"],
+                min_lr=schedule["min_learning_rate"],
+            )
+        )
+    elif schedule["name"] == "cosine":
+        initial = params.get("learning_rate", DEFAULT_LEARNING_RATE)
+        callbacks.append(
+            keras.callbacks.LearningRateScheduler(
+                lambda epoch: cosine_learning_rate(
+                    epoch, params["epochs"], initial, schedule["min_learning_rate"]
+                )
+            )
+        )
+
+    early_stopping = get_early_stopping_parameters(params)
+    if early_stopping["enabled"]:
+        callbacks.append(
+            keras.callbacks.EarlyStopping(
+                monitor=early_stopping["monitor"],
+                patience=early_stopping["patience"],
+                min_delta=early_stopping["min_delta"],
+                restore_best_weights=early_stopping["restore_best_weights"],
+            )
+        )
+    if early_stopping["enabled"] or early_stopping["target"] is not None:
+        callbacks.append(
+            EarlyStoppingReport(
+                epochs=params["epochs"],
+                monitor=early_stopping["monitor"],
+                target=early_stopping["target"],
+            )
+        )
+    return callbacks
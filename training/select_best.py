@@ -0,0 +1,164 @@
+"""Select the best of the candidate training runs of a pipeline run.
+
+The candidates of a sweep are trained in parallel and log the id of their pipeline run
+as the `pipeline_run` experiment parameter. This step finds their MLflow runs, picks
+the one with the highest value of the evaluation metric, by default the first metric
+of the threshold metrics file of the evaluation, and saves its run id like a training
+step does. The evaluation and registration steps then only see the best run.
+"""
+import json
+from pathlib import Path
+from typing import List, Optional
+
+import click
+
+from .logger import logger
+from .profiling import profile_options, profiled
+from .tracker import (
+    MLFLOW_TRACKING_URI_DESCRIPTION,
+    mlflow_default_tracking_uri,
+    tag_run,
+)
+from .utils import read_json_from_file, save_run_id
+
+PIPELINE_RUN_PARAMETER = "pipeline_run"
+CANDIDATES_FILE = "candidates.json"
+DEFAULT_SELECTION_OUTPUT_FOLDER = Path("output") / "selection"
+
+
+def default_metric(threshold_metrics_file_path: Path) -> str:
+    """First metric of the threshold metrics file"""
+    threshold_metrics = read_json_from_file(threshold_metrics_file_path)
+    if not threshold_metrics:
+        raise ValueError(f"No metrics in {threshold_metrics_file_path}")
+    return next(iter(threshold_metrics))
+
+
+def select_best_run(
+    mlflow_tracking_uri: str,
+    experiment_name: str,
+    pipeline_run_id: str,
+    metric: str,
+    output_dir: Path,
+    expected_candidates: Optional[int] = None,
+) -> str:
+    """Save the run id of the best candidate run, returns the run id.
+
+    Args:
+        pipeline_run_id: Value of the `pipeline_run` parameter of the candidates.
+        metric: Metric to compare the candidates by, higher is better.
+        expected_candidates: Fail if a different number of candidates is found.
+    """
+    from mlflow.tracking import MlflowClient
+
+    client = MlflowClient(tracking_uri=mlflow_tracking_uri)
+    experiment = client.get_experiment_by_name(experiment_name)
+    if experiment is None:
+        raise ValueError(f"Experiment {experiment_name} not found")
+    runs = client.search_runs(
+        [experiment.experiment_id],
+        # Runs of failed attempts of retried candidates are ignored
+        filter_string=f"params.{PIPELINE_RUN_PARAMETER} = '{pipeline_run_id}' "
+        "and attributes.status = 'FINISHED'",
+    )
+    logger.info(f"Found {len(runs)} candidate runs of pipeline run {pipeline_run_id}")
+    if expected_candidates is not None and len(runs) != expected_candidates:
+        raise ValueError(
+            f"Expected {expected_candidates} candidate runs, found {len(runs)}"
+        )
+    candidates: List[dict] = [
+        {
+            "run_id": run.info.run_id,
+            "config_overrides": run.data.params.get("config_overrides", ""),
+            metric: run.data.metrics.get(metric),
+        }
+        for run in runs
+    ]
+    scored = [c for c in candidates if c[metric] is not None]
+    if not scored:
+        raise ValueError(f"No candidate run has the metric {metric}")
+    best = max(scored, key=lambda c: c[metric])
+    logger.info(f"Best candidate run {best['run_id']} with {metric}={best[metric]}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / CANDIDATES_FILE).write_text(
+        json.dumps({"metric": metric, "best": best, "candidates": candidates}, indent=2)
+    )
+    save_run_id(run_id=best["run_id"], output_dir=output_dir)
+    tag_run({"best_candidate": True}, best["run_id"], client)
+    return best["run_id"]
+
+
+@click.command()
+@click.argument("experiment", type=str)
+@click.option(
+    "--pipeline-run-id",
+    required=True,
+    help="Id of the pipeline run that trained the candidates",
+)
+@click.option(
+    "--mlflow-tracking-uri",
+    type=str,
+    default=mlflow_default_tracking_uri(),
+    help=MLFLOW_TRACKING_URI_DESCRIPTION,
+)
+@click.option(
+    "--threshold-metrics-file",
+    default="conf/threshold_metrics_for_evaluation.json",
+    type=str,
+    help="File of the evaluation thresholds, its first metric is compared",
+)
+@click.option(
+    "--metric",
+    default=None,
+    help="Metric to compare instead of the first one of the threshold metrics",
+)
+@click.option(
+    "--expected-candidates",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Fail if a different number of candidate runs is found",
+)
+@click.option(
+    "--output-dir",
+    "-o",
+    default=DEFAULT_SELECTION_OUTPUT_FOLDER,
+    help="Path to the folder containing the run id of the best candidate",
+)
+@profile_options
+def cli(
+    experiment: str,
+    pipeline_run_id: str,
+    mlflow_tracking_uri: str,
+    threshold_metrics_file: str,
+    metric: Optional[str],
+    expected_candidates: Optional[int],
+    output_dir: str,
+    profile: Optional[str],
+    profile_memory: bool,
+):
+    """Select the best candidate training run of a pipeline run"""
+    output_path = Path(output_dir).resolve()
+    if metric is None:
+        metric = default_metric(Path(threshold_metrics_file).resolve())
+
+    with profiled(
+        "select_best",
+        output_path,
+        profile,
+        memory=profile_memory,
+        run_id_dir=output_path,
+        tracking_uri=mlflow_tracking_uri,
+    ):
+        select_best_run(
+            mlflow_tracking_uri=mlflow_tracking_uri,
+            experiment_name=experiment,
+            pipeline_run_id=pipeline_run_id,
+            metric=metric,
+            output_dir=output_path,
+            expected_candidates=expected_candidates,
+        )
+
+
+if __name__ == "__main__":
+    cli()
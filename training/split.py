@@ -0,0 +1,130 @@
+"""Train/validation split of the training data by indices.
+
+The split is represented by index arrays into the training data instead of copies of
+the data. A contiguous split, e.g. the last 20% of the samples, is taken as views of
+the (possibly memory-mapped) arrays. The indices are saved next to the training run
+id so that other steps can reuse the same split.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .logger import logger
+from .types import TrainingParameters
+
+SPLIT_INDICES_FILE = "split_indices.npz"
+
+
+@dataclass(frozen=True)
+class Split:
+    train: np.ndarray
+    validation: np.ndarray
+
+
+def get_split_parameters(params: TrainingParameters) -> dict:
+    """Split parameters from the training parameters, with defaults"""
+    defaults = {"shuffle": False, "stratify": False}
+    return {**defaults, **params.get("split", {})}
+
+
+def _stratified_validation(
+    labels: np.ndarray, validation_split: float, rng: np.random.Generator
+) -> np.ndarray:
+    validation = []
+    for label in np.unique(labels):
+        indices = np.flatnonzero(labels == label)
+        n_validation = int(round(len(indices) * validation_split))
+        validation.append(rng.permutation(indices)[:n_validation])
+    return np.concatenate(validation)
+
+
+def split_indices(
+    n_samples: int,
+    validation_split: float,
+    shuffle: bool = False,
+    labels: Optional[np.ndarray] = None,
+    seed: Optional[int] = None,
+) -> Split:
+    """Split the indices of the samples into training and validation indices.
+
+    Args:
+        n_samples: Number of samples.
+        validation_split: Fraction of the samples to use for validation.
+        shuffle: Pick the validation samples randomly instead of taking the last
+            samples, like `validation_split` of `model.fit` does.
+        labels: Labels of the samples to stratify the random split by.
+        seed: Random seed of the shuffling.
+
+    Returns:
+        Split: Sorted training and validation indices.
+    """
+    n_train = int(n_samples * (1 - validation_split))
+    if not shuffle and labels is None:
+        return Split(
+            train=np.arange(n_train), validation=np.arange(n_train, n_samples)
+        )
+
+    rng = np.random.default_rng(seed)
+    if labels is not None:
+        validation = _stratified_validation(
+            np.asarray(labels).reshape(-1), validation_split, rng
+        )
+    else:
+        validation = rng.permutation(n_samples)[n_train:]
+
+    validation = np.sort(validation)
+    train = np.setdiff1d(np.arange(n_samples), validation, assume_unique=True)
+    return Split(train=train, validation=validation)
+
+
+def make_split(labels: np.ndarray, params: TrainingParameters) -> Split:
+    """Split the training data, given by its labels, by the training parameters"""
+    split_params = get_split_parameters(params)
+    split = split_indices(
+        n_samples=len(labels),
+        validation_split=params.get("validation_split", 0.0),
+        shuffle=split_params["shuffle"],
+        labels=labels if split_params["stratify"] else None,
+        seed=params.get("seed"),
+    )
+    logger.info(
+        f"Split {len(labels)} samples into {len(split.train)} training and "
+        f"{len(split.validation)} validation samples with {split_params}"
+    )
+    return split
+
+
+def is_contiguous(indices: np.ndarray) -> bool:
+    """Whether the indices are a range of consecutive integers"""
+    return len(indices) == 0 or (
+        indices[-1] - indices[0] + 1 == len(indices)
+        and bool(np.all(np.diff(indices) == 1))
+    )
+
+
+def take(array: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Select samples by index, as a view if the indices are contiguous.
+
+    Sorted indices read the memory-mapped data sequentially.
+    """
+    if is_contiguous(indices):
+        start = int(indices[0]) if len(indices) else 0
+        return array[start:start + len(indices)]
+    return array[indices]
+
+
+def save_split(split: Split, output_dir: Path) -> Path:
+    """Save the split indices to the given folder"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / SPLIT_INDICES_FILE
+    logger.info(f"Saving split indices to {path}")
+    np.savez(path, train=split.train, validation=split.validation)
+    return path
+
+
+def load_split(output_dir: Path) -> Split:
+    """Load the split indices saved by the training step"""
+    with np.load(output_dir / SPLIT_INDICES_FILE) as indices:
+        return Split(train=indices["train"], validation=indices["validation"])
@@ -0,0 +1,261 @@
+"""Out-of-core training data source streaming batches from memory-mapped shards.
+
+The training data is not loaded into memory: background threads read blocks of
+consecutive samples from the memory-mapped "npy" shards of the processed data and
+queue them for the training loop. Randomness comes from shuffling the order of the
+blocks every epoch and from a bounded shuffle buffer of samples, so the memory usage is
+bounded by the buffer and queue sizes instead of the size of the dataset.
+"""
+import queue
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .logger import logger
+from .split import take
+from .utils import load_npy_shards
+
+Block = Tuple[int, int, int]
+"""A block of samples as shard index, start and stop within the shard"""
+
+_END = object()
+
+
+@dataclass(frozen=True)
+class ShardedDataset:
+    """Samples and labels split across shards of (memory-mapped) arrays"""
+
+    shards: List[Dict[str, np.ndarray]]
+
+    @classmethod
+    def from_arrays(cls, data: Dict[str, np.ndarray]) -> "ShardedDataset":
+        return cls(shards=[data])
+
+    def __len__(self) -> int:
+        return sum(len(shard["x"]) for shard in self.shards)
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """Index of the first sample of each shard in the whole dataset"""
+        return np.cumsum([0] + [len(shard["x"]) for shard in self.shards])[:-1]
+
+    @property
+    def labels(self) -> np.ndarray:
+        """All labels, read into memory"""
+        return np.concatenate([shard["y"] for shard in self.shards])
+
+    def take(self, indices: np.ndarray) -> Dict[str, np.ndarray]:
+        """Read the samples at the given sorted indices into memory.
+
+        Only the selected samples are read from the shards, e.g. the validation
+        samples of a split.
+        """
+        offsets = self.offsets
+        shard_of_index = np.searchsorted(offsets, indices, side="right") - 1
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in self.shards[0]}
+        for i, shard in enumerate(self.shards):
+            shard_indices = indices[shard_of_index == i] - offsets[i]
+            for name, arrays in parts.items():
+                arrays.append(take(shard[name], shard_indices))
+        return {name: np.concatenate(arrays) for name, arrays in parts.items()}
+
+
+def load_sharded_dataset(data_dir: Path, split: str = "train") -> ShardedDataset:
+    """Memory-map the shards of a split of processed data in "npy" format"""
+    shards = load_npy_shards(data_dir, split, mmap_mode="r")
+    logger.info(f"Memory-mapped {len(shards)} {split} shards from {data_dir}")
+    return ShardedDataset(shards=shards)
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class StreamingSource:
+    """Iterable over the batches of the selected samples of a sharded dataset.
+
+    Every iteration is an epoch. Blocks are read by `num_threads` background threads,
+    at most `prefetch_blocks` read blocks are queued ahead of the training loop.
+
+    Args:
+        dataset: The samples and labels.
+        indices: Indices of the samples to include, all samples if None.
+        batch_size: Number of samples per batch.
+        shuffle_buffer_size: Number of samples to shuffle the batches from, no
+            shuffling if 0. The block order is shuffled as well.
+        block_size: Number of consecutive samples read at once.
+        prefetch_blocks: Maximum number of read blocks waiting to be batched.
+        num_threads: Number of threads reading the blocks.
+        seed: Random seed of the shuffling.
+    """
+
+    def __init__(
+        self,
+        dataset: ShardedDataset,
+        batch_size: int,
+        indices: Optional[np.ndarray] = None,
+        shuffle_buffer_size: int = 0,
+        block_size: int = 1024,
+        prefetch_blocks: int = 8,
+        num_threads: int = 2,
+        seed: Optional[int] = None,
+    ):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.prefetch_blocks = prefetch_blocks
+        self.num_threads = num_threads
+        self._rng = np.random.default_rng(seed)
+
+        self._selected = np.zeros(len(dataset), dtype=bool)
+        self._selected[slice(None) if indices is None else indices] = True
+        self.n_samples = int(self._selected.sum())
+        self._blocks = self._find_blocks(block_size)
+
+    def _find_blocks(self, block_size: int) -> List[Block]:
+        blocks = []
+        for index, offset in enumerate(self.dataset.offsets):
+            length = len(self.dataset.shards[index]["x"])
+            for start in range(0, length, block_size):
+                stop = min(start + block_size, length)
+                if self._selected[offset + start:offset + stop].any():
+                    blocks.append((index, start, stop))
+        return blocks
+
+    @property
+    def sample_shape(self) -> Tuple[int, ...]:
+        return self.dataset.shards[0]["x"].shape[1:]
+
+    def __len__(self) -> int:
+        """Number of batches per epoch"""
+        return -(-self.n_samples // self.batch_size)
+
+    def _read_block(self, block: Block) -> Tuple[np.ndarray, np.ndarray]:
+        index, start, stop = block
+        shard, offset = self.dataset.shards[index], self.dataset.offsets[index]
+        selected = self._selected[offset + start:offset + stop]
+        if selected.all():
+            # Copy out of the memory map, reading the pages in this thread
+            return np.array(shard["x"][start:stop]), np.array(shard["y"][start:stop])
+        return shard["x"][start:stop][selected], shard["y"][start:stop][selected]
+
+    def _reader(
+        self, blocks: queue.Queue, out: queue.Queue, stop: threading.Event
+    ) -> None:
+        try:
+            while not stop.is_set():
+                try:
+                    block = blocks.get_nowait()
+                except queue.Empty:
+                    break
+                if not _put(out, self._read_block(block), stop):
+                    return
+        except Exception as e:
+            _put(out, e, stop)
+        _put(out, _END, stop)
+
+    def _iter_blocks(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        order = np.arange(len(self._blocks))
+        if self.shuffle_buffer_size:
+            order = self._rng.permutation(order)
+        blocks: queue.Queue = queue.Queue()
+        for i in order:
+            blocks.put(self._blocks[i])
+
+        out: queue.Queue = queue.Queue(maxsize=self.prefetch_blocks)
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=self._reader, args=(blocks, out, stop), daemon=True)
+            for _ in range(self.num_threads)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            running = len(threads)
+            while running:
+                item = out.get()
+                if item is _END:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _draw(self, size: int, count: int) -> np.ndarray:
+        """Indices of `count` distinct samples of a buffer of `size` samples, drawn at
+        random when shuffling, the first samples otherwise.
+        """
+        if not self.shuffle_buffer_size:
+            return np.arange(count)
+        if 2 * count > size:
+            return self._rng.permutation(size)[:count]
+        indices = np.empty(0, dtype=np.int64)
+        while len(indices) < count:
+            draws = np.concatenate([indices, self._rng.integers(0, size, count)])
+            # Keep the first draw of every index, in the order they were drawn
+            _, first = np.unique(draws, return_index=True)
+            indices = draws[np.sort(first)][:count]
+        return indices
+
+    def _take_batch(
+        self, buffers: Tuple[np.ndarray, np.ndarray], size: int, count: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Remove a batch of `count` samples from the `size` samples of the buffers.
+
+        The samples at the end of the buffers fill the slots of the batch samples, so
+        that the cost is proportional to the batch size and not to the buffer size.
+        Without shuffling, the remaining samples are moved to the start instead to keep
+        their order, the buffer then holds at most a batch and a block.
+        """
+        indices = self._draw(size, count)
+        batch = tuple(buffer[indices] for buffer in buffers)
+        remaining = size - count
+        if not self.shuffle_buffer_size:
+            for buffer in buffers:
+                buffer[:remaining] = buffer[count:size]
+            return batch
+        taken = np.zeros(count, dtype=bool)
+        tail = indices[indices >= remaining]
+        taken[tail - remaining] = True
+        free = indices[indices < remaining]
+        for buffer in buffers:
+            buffer[free] = buffer[remaining:size][~taken]
+        return batch
+
+    def __iter__(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        x, y = self.dataset.shards[0]["x"], self.dataset.shards[0]["y"]
+        max_block = max((stop - start for _, start, stop in self._blocks), default=0)
+        # The buffer holds the shuffle buffer, less than a batch and a read block
+        capacity = self.shuffle_buffer_size + self.batch_size + max_block
+        buffers = (
+            np.empty((capacity, *x.shape[1:]), x.dtype),
+            np.empty((capacity, *y.shape[1:]), y.dtype),
+        )
+        size = 0
+        for block in self._iter_blocks():
+            n = len(block[0])
+            for buffer, values in zip(buffers, block):
+                buffer[size:size + n] = values
+            size += n
+            # Keep the shuffle buffer filled, emit only the full batches beyond it
+            while size - self.shuffle_buffer_size >= self.batch_size:
+                yield self._take_batch(buffers, size, self.batch_size)
+                size -= self.batch_size
+
+        while size:
+            count = min(size, self.batch_size)
+            yield self._take_batch(buffers, size, count)
+            size -= count
@@ -0,0 +1,449 @@
+"""Hyperparameter sweep over the model and training configuration on a process pool.
+
+The search space is given as overrides of the training configuration with comma
+separated values, e.g. `model_config.num_layers=3,5 training_config.batch_size=32,64`.
+A grid search runs every combination, a random search a sample of them.
+
+The dataset is loaded once and copied into shared memory, the workers attach to it
+without copying. The CPUs are partitioned between the workers by limiting the intra-
+and inter-op threads of TensorFlow in every worker, so that concurrent trials do not
+oversubscribe the machine. Every trial is logged as a run nested in the run of the
+sweep, and a summary of the wall time of the trials and of the utilisation of the
+workers is saved and logged to the sweep run:
+
+    python -m training.sweep sweep model_config.num_layers=3,5 \\
+        training_config.batch_size=32,64 --workers 2
+"""
+import copy
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+import yaml
+
+from .config import get_config
+from .logger import logger
+from .tracker import MLFLOW_TRACKING_URI_DESCRIPTION, mlflow_default_tracking_uri
+from .types import ModelParameters, TrainingParameters
+from .utils import load_train_test_dataset
+
+SEARCH_STRATEGIES = ("grid", "random")
+SWEPT_SECTIONS = ("model_config", "training_config")
+SUMMARY_FILE = "sweep_summary.json"
+DEFAULT_SWEEP_OUTPUT_FOLDER = Path("output") / "sweep"
+
+
+def parse_search_space(overrides: Sequence[str]) -> Dict[str, list]:
+    """Values of the swept parameters from overrides like `section.key=v1,v2`"""
+    space = {}
+    for override in overrides:
+        key, sep, values = override.partition("=")
+        if not sep or key.split(".")[0] not in SWEPT_SECTIONS or "." not in key:
+            raise ValueError(
+                f"Invalid override '{override}', expected e.g. "
+                "model_config.num_layers=3,5"
+            )
+        space[key] = [yaml.safe_load(value) for value in values.split(",")]
+    return space
+
+
+def make_trials(
+    space: Mapping[str, list],
+    strategy: str = "grid",
+    num_trials: Optional[int] = None,
+    seed: int = 0,
+) -> List[Dict[str, object]]:
+    """Parameters of the trials, all combinations or a random sample of them"""
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unsupported strategy '{strategy}'")
+    keys = list(space)
+    trials = [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+    if strategy == "random" and num_trials is not None and num_trials < len(trials):
+        trials = random.Random(seed).sample(trials, num_trials)
+    elif strategy == "grid" and num_trials is not None:
+        trials = trials[:num_trials]
+    return trials
+
+
+def apply_trial(
+    config: Mapping[str, dict], trial: Mapping[str, object]
+) -> Dict[str, dict]:
+    """Copy of the configuration with the parameters of a trial set"""
+    config = copy.deepcopy(dict(config))
+    for key, value in trial.items():
+        *parents, name = key.split(".")
+        section = config
+        for parent in parents:
+            section = section.setdefault(parent, {})
+        section[name] = value
+    return config
+
+
+def partition_threads(workers: int, cpus: Optional[int] = None) -> Tuple[int, int]:
+    """Intra- and inter-op threads per worker, sharing the CPUs between the workers"""
+    cpus = cpus or os.cpu_count() or 1
+    intra_op = max(1, cpus // workers)
+    inter_op = 2 if intra_op >= 4 else 1
+    return intra_op, inter_op
+
+
+@dataclass
+class SharedArraySpec:
+    """Picklable description of an array in shared memory"""
+
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class SharedArrays:
+    """Arrays copied once into shared memory and attached by other processes.
+
+    The creating process owns the memory and unlinks it on `close`.
+    """
+
+    def __init__(self, arrays: Mapping[str, Mapping[str, np.ndarray]]):
+        self._memories: List[SharedMemory] = []
+        self.specs: Dict[str, Dict[str, SharedArraySpec]] = {}
+        for split, split_arrays in arrays.items():
+            self.specs[split] = {}
+            for name, array in split_arrays.items():
+                memory = SharedMemory(create=True, size=max(1, array.nbytes))
+                self._memories.append(memory)
+                shared = np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)
+                shared[...] = array
+                self.specs[split][name] = SharedArraySpec(
+                    memory.name, tuple(array.shape), array.dtype.str
+                )
+
+    def close(self) -> None:
+        for memory in self._memories:
+            memory.close()
+            memory.unlink()
+        self._memories = []
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def attach_arrays(
+    specs: Mapping[str, Mapping[str, SharedArraySpec]]
+) -> Tuple[Dict[str, Dict[str, np.ndarray]], List[SharedMemory]]:
+    """Read-only views of shared arrays, and their memories to keep them alive"""
+    memories = []
+    arrays: Dict[str, Dict[str, np.ndarray]] = {}
+    for split, split_specs in specs.items():
+        arrays[split] = {}
+        for name, spec in split_specs.items():
+            memory = SharedMemory(name=spec.name)
+            memories.append(memory)
+            array = np.ndarray(spec.shape, np.dtype(spec.dtype), buffer=memory.buf)
+            array.flags.writeable = False
+            arrays[split][name] = array
+    return arrays, memories
+
+
+@dataclass
+class TrialResult:
+    index: int
+    parameters: Dict[str, object]
+    run_id: str
+    metrics: Dict[str, float]
+    seconds: float
+    started: float
+    """Seconds since the start of the sweep"""
+    pid: int
+
+
+_worker_state: dict = {}
+
+
+def _init_worker(
+    specs: Mapping[str, Mapping[str, SharedArraySpec]],
+    intra_op_threads: int,
+    inter_op_threads: int,
+) -> None:
+    """Attach the shared dataset and limit the threads of TensorFlow in a worker"""
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    arrays, memories = attach_arrays(specs)
+    _worker_state.update(arrays=arrays, memories=memories)
+
+
+def run_trial(
+    index: int,
+    trial: Mapping[str, object],
+    model: str,
+    model_parameters: ModelParameters,
+    training_parameters: TrainingParameters,
+    tracking_uri: str,
+    experiment_id: str,
+    parent_run_id: str,
+    sweep_start: float,
+) -> TrialResult:
+    """Train and evaluate one trial as a run nested in the run of the sweep"""
+    import mlflow
+    from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+
+    from .model import evaluate_model, get_model, train_model
+    from .tracker import ending_run, get_batch_logger
+
+    start = time.time()
+    arrays = _worker_state["arrays"]
+    mlflow.set_tracking_uri(tracking_uri)
+    run = mlflow.start_run(
+        experiment_id=experiment_id,
+        run_name=f"trial-{index}",
+        tags={MLFLOW_PARENT_RUN_ID: parent_run_id},
+    )
+    with ending_run():
+        batch_logger = get_batch_logger()
+        batch_logger.log_params({**model_parameters, **training_parameters})
+        built_model = get_model(model, model_parameters, training_parameters)
+        history = train_model(
+            model=built_model, train_data=arrays["train"], params=training_parameters
+        )
+        metrics = {
+            f"eval_{name}": float(value)
+            for name, value in evaluate_model(built_model, arrays["test"]).items()
+        }
+        metrics.update({name: values[-1] for name, values in history.history.items()})
+        batch_logger.log_metrics(metrics)
+    return TrialResult(
+        index=index,
+        parameters=dict(trial),
+        run_id=run.info.run_id,
+        metrics=metrics,
+        seconds=time.time() - start,
+        started=start - sweep_start,
+        pid=os.getpid(),
+    )
+
+
+def summarize(trials: List[TrialResult], seconds: float, workers: int) -> dict:
+    """Wall time of the sweep and of its trials, and the utilisation of the workers.
+
+    The utilisation is the time the workers spent in trials over the time they were
+    available, the rest is spent starting the workers and waiting for the last trials.
+    """
+    busy = sum(trial.seconds for trial in trials)
+    return {
+        "trials": [asdict(trial) for trial in sorted(trials, key=lambda t: t.index)],
+        "seconds": seconds,
+        "trial_seconds": busy,
+        "workers": workers,
+        "utilisation": busy / (seconds * workers) if seconds else 0.0,
+    }
+
+
+def run_sweep(
+    model: str,
+    experiment_name: str,
+    tracking_uri: str,
+    input_data: Path,
+    output_dir: Path,
+    trials: List[Dict[str, object]],
+    model_parameters: ModelParameters,
+    training_parameters: TrainingParameters,
+    workers: int = 2,
+    metric: str = "eval_acc",
+    mlflow_s3_endpoint_url: str = None,
+) -> dict:
+    """Run the trials on a process pool, returns the summary of the sweep.
+
+    Args:
+        trials: Overrides of the configuration per trial, see `make_trials`.
+        workers: Number of trials trained concurrently.
+        metric: Metric of the trials to pick the best one by, higher is better.
+
+    See `training.train.train_with_tracking` for the other arguments.
+    """
+    import mlflow
+
+    from .tracker import ending_run, get_batch_logger
+
+    if mlflow_s3_endpoint_url:
+        os.environ["MLFLOW_S3_ENDPOINT_URL"] = mlflow_s3_endpoint_url
+    mlflow.set_tracking_uri(tracking_uri)
+    experiment = mlflow.set_experiment(experiment_name)
+    sweep_run = mlflow.start_run(run_name="sweep")
+    # A failed trial fails the sweep run, after flushing what it logged
+    with ending_run():
+        train_data, test_data = load_train_test_dataset(input_data, mmap_mode=None)
+        intra_op, inter_op = partition_threads(workers)
+        logger.info(
+            f"Running {len(trials)} trials on {workers} workers with {intra_op} "
+            f"intra-op and {inter_op} inter-op threads each"
+        )
+        config = {
+            "model_config": model_parameters,
+            "training_config": training_parameters,
+        }
+        results = []
+        sweep_start = time.time()
+        with SharedArrays({"train": train_data, "test": test_data}) as shared:
+            del train_data, test_data
+            # Spawned, forking would copy the state of TensorFlow and MLflow
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(shared.specs, intra_op, inter_op),
+            ) as executor:
+                futures = []
+                for index, trial in enumerate(trials):
+                    trial_config = apply_trial(config, trial)
+                    futures.append(
+                        executor.submit(
+                            run_trial,
+                            index,
+                            trial,
+                            model,
+                            trial_config["model_config"],
+                            trial_config["training_config"],
+                            tracking_uri,
+                            experiment.experiment_id,
+                            sweep_run.info.run_id,
+                            sweep_start,
+                        )
+                    )
+                for future in as_completed(futures):
+                    result = future.result()
+                    logger.info(
+                        f"Trial {result.index} {result.parameters} finished in "
+                        f"{result.seconds:.1f}s with {result.metrics.get(metric)}"
+                    )
+                    results.append(result)
+
+        summary = summarize(results, time.time() - sweep_start, workers)
+        best = max(results, key=lambda r: r.metrics.get(metric, float("-inf")))
+        summary["best"] = {"metric": metric, **asdict(best)}
+        summary["run_id"] = sweep_run.info.run_id
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        summary_path = output_dir / SUMMARY_FILE
+        summary_path.write_text(json.dumps(summary, indent=2))
+        batch_logger = get_batch_logger()
+        batch_logger.log_params({"trials": len(trials), "workers": workers})
+        batch_logger.log_metrics(
+            {
+                "sweep_seconds": summary["seconds"],
+                "sweep_utilisation": summary["utilisation"],
+                f"best_{metric}": best.metrics.get(metric, float("nan")),
+            }
+        )
+        mlflow.log_artifact(str(summary_path))
+    return summary
+
+
+@click.command(context_settings=dict(ignore_unknown_options=True))
+@click.argument("experiment", type=str)
+@click.argument("overrides", nargs=-1, type=click.UNPROCESSED)
+@click.option(
+    "--mlflow-tracking-uri",
+    type=str,
+    default=mlflow_default_tracking_uri(),
+    help=MLFLOW_TRACKING_URI_DESCRIPTION,
+)
+@click.option(
+    "--mlflow-s3-endpoint-url",
+    type=str,
+    default=None,
+    help="MLflow S3 endpoint to use as artifact store",
+)
+@click.option(
+    "--input-data",
+    type=click.Path(exists=True, file_okay=False),
+    default="data",
+    help="Location of the preprocessed data",
+)
+@click.option(
+    "--output-dir",
+    "-o",
+    default=str(DEFAULT_SWEEP_OUTPUT_FOLDER),
+    help="Path to the folder of the sweep summary",
+)
+@click.option(
+    "--strategy",
+    type=click.Choice(SEARCH_STRATEGIES),
+    default="grid",
+    help="Run all combinations of the values, or a random sample of them",
+)
+@click.option(
+    "--num-trials",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum number of trials",
+)
+@click.option("--seed", type=int, default=0, help="Seed of the random search")
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=2,
+    help="Number of trials trained concurrently",
+)
+@click.option(
+    "--metric",
+    default="eval_acc",
+    help="Metric to pick the best trial by, higher is better",
+)
+def cli(
+    experiment: str,
+    overrides: Sequence[str],
+    mlflow_tracking_uri: str,
+    mlflow_s3_endpoint_url: Optional[str],
+    input_data: str,
+    output_dir: str,
+    strategy: str,
+    num_trials: Optional[int],
+    seed: int,
+    workers: int,
+    metric: str,
+):
+    """Sweep the training configuration over the values of the OVERRIDES"""
+    try:
+        space = parse_search_space(overrides)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    trials = make_trials(space, strategy=strategy, num_trials=num_trials, seed=seed)
+
+    config = get_config()
+    model_parameters = dict(config["model_config"])
+    model_name = model_parameters.pop("name")
+    summary = run_sweep(
+        model=model_name,
+        experiment_name=experiment,
+        tracking_uri=mlflow_tracking_uri,
+        mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+        input_data=Path(input_data).resolve(),
+        output_dir=Path(output_dir).resolve(),
+        trials=trials,
+        model_parameters=model_parameters,
+        training_parameters=config["training_config"],
+        workers=workers,
+        metric=metric,
+    )
+    best = summary["best"]
+    click.echo(
+        f"Best trial {best['index']} {best['parameters']}: {metric}="
+        f"{best['metrics'].get(metric)}, utilisation {summary['utilisation']:.0%}"
+    )
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,16 +1,32 @@
 """This module contains MLFlow utilities for tracking
+
+MLflow is imported by the functions using it, so that importing this module, e.g. for
+the CLI defaults, does not pay the import time of MLflow.
 """
 import os
-from typing import Mapping
-
-import mlflow
-from mlflow.tracking import MlflowClient
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Mapping, Optional
 
 from .logger import logger
-from .types import EvaluationMetrics
+from .types import EvaluationMetrics, Model
+
+if TYPE_CHECKING:
+    import mlflow
+    from mlflow.entities import Metric, Param, RunTag
+    from mlflow.tracking import MlflowClient
 
 _MLFLOW_DEFAULT_TRACKING_URI = "sqlite:///mlflow.db"
 
+# Limits of a single MLflow log_batch request
+MAX_METRICS_PER_BATCH = 1000
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+MAX_ENTITIES_PER_BATCH = 1000
+
 
 def mlflow_default_tracking_uri() -> str:
     return os.getenv("MLFLOW_TRACKING_URI", _MLFLOW_DEFAULT_TRACKING_URI)
@@ -27,14 +43,21 @@ def setup_tracking(
     tracking_uri: str,
     experiment_name: str,
     mlflow_s3_endpoint_url: str,
-) -> mlflow.ActiveRun:
+    run_id: Optional[str] = None,
+    autolog: bool = True,
+) -> "mlflow.ActiveRun":
     """Connect to MLFLow, use an existing or create a new experiment, and start a run
 
     :param tracking_uri: the MLFlow tracking server URI
     :param experiment_name: the name of the MLFlow experiment to be activated. If the
      experiment with this name does not exist, a new experiment is created.
+    :param run_id: id of an existing run to continue, a new run is started if None
+    :param autolog: enable MLflow autologging, except for the model which the training
+     logs itself with `save_mlflow_model`
     :return: An MLFlow run object that can be used as a context manager
     """
+    import mlflow
+
     logger.info(f"Set MLFlow tracking uri to '{tracking_uri}'")
     mlflow.set_tracking_uri(tracking_uri)
 
@@ -45,17 +68,204 @@ def setup_tracking(
     logger.info(f"Setting MLFlow experiment to '{tracking_uri}'")
     mlflow.set_experiment(experiment_name)
 
-    logger.info("Configuring auto logging with default setup")
-    mlflow.autolog()
-    logger.info("Starting a new MLFlow run")
-    return mlflow.start_run()
+    if autolog:
+        logger.info("Configuring auto logging with default setup")
+        mlflow.autolog(log_models=False)
+    else:
+        mlflow.autolog(disable=True)
+    if run_id is not None:
+        logger.info(f"Continuing the MLFlow run {run_id}")
+    else:
+        logger.info("Starting a new MLFlow run")
+    return mlflow.start_run(run_id=run_id)
+
+
+class BatchLogger:
+    """Buffer params, metrics and tags of a run and log them with `log_batch`.
+
+    Every `log_batch` request is a single round trip to the tracking server. The
+    buffer is flushed when it holds `max_pending` entities or when `flush_interval`
+    seconds have passed since the last flush, both checked whenever something is
+    logged, and when `flush` is called or the logger is used as a context manager
+    and exits. There is no timer: entities logged last stay buffered until the next
+    flush, e.g. by `end_run`. A flush splits the buffer into requests within the
+    MLflow limits, and entities of a failed request stay buffered for the next flush.
+
+    Args:
+        client: MLflow client of the tracking server.
+        run_id: Id of the run to log to.
+        max_pending: Number of buffered entities that triggers a flush.
+        flush_interval: Seconds after which buffered entities are flushed.
+    """
+
+    def __init__(
+        self,
+        client: "MlflowClient",
+        run_id: str,
+        max_pending: int = MAX_ENTITIES_PER_BATCH,
+        flush_interval: float = 10.0,
+    ):
+        self.client = client
+        self.run_id = run_id
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._metrics: List["Metric"] = []
+        # Params and tags are keyed, logging a key again replaces the pending value
+        self._params: Dict[str, "Param"] = {}
+        self._tags: Dict[str, "RunTag"] = {}
+        self._lock = threading.RLock()
+        self._last_flush = time.monotonic()
+
+    def __enter__(self) -> "BatchLogger":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered entities"""
+        return len(self._metrics) + len(self._params) + len(self._tags)
+
+    def log_params(self, params: Mapping[str, Any]) -> None:
+        from mlflow.entities import Param
+
+        with self._lock:
+            for key, value in params.items():
+                self._params[key] = Param(key, str(value))
+            self._maybe_flush()
+
+    def log_metrics(
+        self,
+        metrics: Mapping[str, float],
+        step: int = 0,
+        timestamp: Optional[int] = None,
+    ) -> None:
+        from mlflow.entities import Metric
+
+        timestamp = timestamp or int(time.time() * 1000)
+        with self._lock:
+            self._metrics.extend(
+                Metric(key, float(value), timestamp, step)
+                for key, value in metrics.items()
+            )
+            self._maybe_flush()
+
+    def set_tags(self, tags: Mapping[str, Any]) -> None:
+        from mlflow.entities import RunTag
+
+        with self._lock:
+            for key, value in tags.items():
+                self._tags[key] = RunTag(key, str(value))
+            self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        overdue = time.monotonic() - self._last_flush >= self.flush_interval
+        if self.pending >= self.max_pending or (self.pending and overdue):
+            self.flush()
+
+    def flush(self) -> int:
+        """Log all buffered entities, returns the number of requests made.
+
+        Raises:
+            Exception: The error of a failed request. The entities of the request and
+                of the following ones are kept in the buffer.
+        """
+        with self._lock:
+            self._last_flush = time.monotonic()
+            requests = 0
+            while self.pending:
+                batch_params = list(self._params.values())[:MAX_PARAMS_PER_BATCH]
+                batch_tags = list(self._tags.values())[:MAX_TAGS_PER_BATCH]
+                n_metrics = min(
+                    MAX_METRICS_PER_BATCH,
+                    MAX_ENTITIES_PER_BATCH - len(batch_params) - len(batch_tags),
+                )
+                self.client.log_batch(
+                    self.run_id,
+                    metrics=self._metrics[:n_metrics],
+                    params=batch_params,
+                    tags=batch_tags,
+                )
+                # Only the logged entities are dropped, a failed request keeps them
+                del self._metrics[:n_metrics]
+                for param in batch_params:
+                    del self._params[param.key]
+                for tag in batch_tags:
+                    del self._tags[tag.key]
+                requests += 1
+            if requests:
+                logger.info(
+                    f"Flushed MLflow logs of run {self.run_id} in {requests} request(s)"
+                )
+            return requests
+
+
+_batch_loggers: Dict[str, BatchLogger] = {}
+
+
+def get_batch_logger(run_id: Optional[str] = None) -> BatchLogger:
+    """Batch logger of the given run, or of the active MLflow run if None.
+
+    The logger is shared by all callers logging to the same run, until `end_run`.
+    """
+    import mlflow
+    from mlflow.tracking import MlflowClient
+
+    if run_id is None:
+        active_run = mlflow.active_run()
+        if active_run is None:
+            raise RuntimeError("No active MLflow run to log to")
+        run_id = active_run.info.run_id
+    if run_id not in _batch_loggers:
+        _batch_loggers[run_id] = BatchLogger(MlflowClient(), run_id)
+    return _batch_loggers[run_id]
+
+
+def log_metrics_if_active(
+    metrics: Dict[str, float], step: Optional[int] = None
+) -> None:
+    """Log metrics to the active MLflow run, if any, e.g. from a training callback"""
+    # There is no active run if MLflow was not even imported, do not import it
+    mlflow = sys.modules.get("mlflow")
+    if mlflow is None or mlflow.active_run() is None:
+        return
+    get_batch_logger().log_metrics(metrics, step=step)
+
+
+def end_run(status: str = "FINISHED") -> None:
+    """Flush the buffered logs of the active MLflow run and end the run
+
+    :param status: status of the ended run, e.g. "FAILED" if the training raised
+    """
+    import mlflow
+
+    active_run = mlflow.active_run()
+    if active_run is not None:
+        run_id = active_run.info.run_id
+        batch_logger = _batch_loggers.get(run_id)
+        if batch_logger is not None:
+            # If the flush fails, the logger and the run stay to retry ending it
+            batch_logger.flush()
+        _batch_loggers.pop(run_id, None)
+    mlflow.end_run(status=status)
+
+
+@contextmanager
+def ending_run() -> Iterator[None]:
+    """End the active MLflow run when leaving the context, as failed on an error"""
+    try:
+        yield
+    except BaseException:
+        end_run(status="FAILED")
+        raise
+    end_run()
 
 
 def save_parameters(params: Mapping[str, str]) -> None:
     """Save parameters to the current MLFlow run"""
     logger.info(f"Saving parameters {params} to MLFlow")
-    for param_name, value in params.items():
-        mlflow.log_param(param_name, value)
+    get_batch_logger().log_params(params)
 
 
 def save_metrics(metrics: EvaluationMetrics, prefix: str = "") -> None:
@@ -66,30 +276,44 @@ def save_metrics(metrics: EvaluationMetrics, prefix: str = "") -> None:
     :return:
     """
     logger.info(f"Saving the evaluation metrics {metrics} to MLFlow")
-    # Metrics can be saved as key value to mlflow with mlflow.log_metric
-    for metric_name, value in metrics.items():
-        metric = f"{prefix}{metric_name}"
-        mlflow.log_metric(metric, value)
+    get_batch_logger().log_metrics(
+        {f"{prefix}{metric_name}": value for metric_name, value in metrics.items()}
+    )
+
 
+def save_mlflow_model(model: Model, save_dir: Path, input_example: Any) -> None:
+    """Save a Keras model in the MLflow model format, like `mlflow.autolog()` logs it.
 
-def get_metrics_from_run_id(run_id: str, client: MlflowClient) -> dict:
+    The folder is uploaded as the `model` artifact of the run, registered by
+    `register_model`. The signature is inferred from the input example.
+    """
+    import mlflow.tensorflow
+    from mlflow.models import infer_signature
+
+    signature = infer_signature(input_example, model.predict(input_example, verbose=0))
+    logger.info(f"Saving the MLflow model to {save_dir}")
+    mlflow.tensorflow.save_model(model, path=str(save_dir), signature=signature)
+
+
+def get_metrics_from_run_id(run_id: str, client: "MlflowClient") -> dict:
     info = client.get_run(run_id)
     return info.data.metrics
 
 
-def tag_run(tag_dictionary: dict, run_id: str, client: MlflowClient) -> None:
-    logger.info(f"Setting tag(s) for run id: {run_id}")
-    for key, value in tag_dictionary.items():
-        logger.info(f"Setting tag: '{key}=={value}'")
-        client.set_tag(run_id, key, value)
+def tag_run(tag_dictionary: dict, run_id: str, client: "MlflowClient") -> None:
+    logger.info(f"Setting tag(s) {tag_dictionary} for run id: {run_id}")
+    with BatchLogger(client, run_id) as batch_logger:
+        batch_logger.set_tags(tag_dictionary)
 
 
 def register_model(
     tracking_uri: str,
     model_registry_name: str,
     run_id: str
-) -> mlflow.entities.model_registry.ModelVersion:  # type: ignore
+) -> "mlflow.entities.model_registry.ModelVersion":  # type: ignore
     """Register a model to MLFlow that was trained by the run with the given run_id"""
+    import mlflow
+
     logger.info(f"Connecting to MLFLow at {tracking_uri}")
     mlflow.set_tracking_uri(uri=tracking_uri)
     try:
@@ -1,26 +1,41 @@
+import os
+import shlex
+import shutil
+import tempfile
 from pathlib import Path
-from typing import Mapping
+from typing import Mapping, Optional, Union
 
 import click
-import mlflow
 
 from .config import get_training_config
 from .logger import logger
-from .model import evaluate_model, get_model, save_model, train_model
+from .profiling import profile_options, profiled
+from .split import make_split, save_split
+from .streaming import ShardedDataset, load_sharded_dataset
 from .tracker import (
     MLFLOW_TRACKING_URI_DESCRIPTION,
+    ending_run,
+    get_batch_logger,
     mlflow_default_tracking_uri,
     save_metrics,
+    save_mlflow_model,
     save_parameters,
     setup_tracking,
 )
-from .types import ModelParameters, TrainingParameters
-from .utils import CustomParamType, load_train_test_dataset, save_run_id
+from .types import ModelParameters, TestData, TrainData, TrainingParameters
+from .utils import (
+    DEFAULT_TRAINING_OUTPUT_FOLDER,
+    MODEL_VERSION_FOLDER,
+    CustomParamType,
+    load_dataset_split,
+    load_train_test_dataset,
+    save_run_id,
+)
 
 RUN_ID_FILE = "run_id.json"
 PREFIX_EVAL_METRICS = "eval_"
 
-DEFAULT_OUTPUT_FOLDER = Path("output") / "training"
+DEFAULT_OUTPUT_FOLDER = DEFAULT_TRAINING_OUTPUT_FOLDER
 DEFAULT_INPUT_FOLDER = "data"
 
 
@@ -34,6 +49,8 @@ def train_with_tracking(
     training_parameters: TrainingParameters,
     model_parameters: ModelParameters,
     mlflow_s3_endpoint_url: str = None,
+    checkpoint_dir: Optional[Path] = None,
+    resume_key: Optional[str] = None,
 ) -> None:
     """Train the model.
 
@@ -47,45 +64,179 @@ def train_with_tracking(
         experiment_parameters: extra parameters to be recorded into the tracking service
         training_parameters: Parameters for training run
         model_parameters: Model hyperparameters
+        checkpoint_dir: Folder of the checkpoints, if enabled by the training
+         parameters, `output/checkpoints` if None
+        resume_key: Key to find the unfinished run of a previous attempt by, to resume
+         from its uploaded checkpoint, e.g. the id of the pipeline run
     """
+    from .input_pipeline import get_input_pipeline_parameters
 
-    train_data, test_data = load_train_test_dataset(data_dir=input_data)
+    train_data: Union[TrainData, ShardedDataset]
+    if get_input_pipeline_parameters(training_parameters)["mode"] == "streaming":
+        # Only memory-map the training data, it is streamed during training
+        train_data = load_sharded_dataset(input_data, split="train")
+        test_data = load_dataset_split(input_data, split="test")
+    else:
+        train_data, test_data = load_train_test_dataset(data_dir=input_data)
 
-    active_run = setup_tracking(
+    train_on_data(
+        model=model,
+        experiment_name=experiment_name,
         tracking_uri=tracking_uri,
+        train_data=train_data,
+        test_data=test_data,
+        output_dir=output_dir,
+        experiment_parameters=experiment_parameters,
+        training_parameters=training_parameters,
+        model_parameters=model_parameters,
         mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
-        experiment_name=experiment_name,
+        checkpoint_dir=checkpoint_dir,
+        resume_key=resume_key,
     )
 
-    if experiment_parameters:
-        save_parameters(params=experiment_parameters)
 
-    built_model = get_model(model_name=model, model_parameters=model_parameters)
+def train_on_data(
+    model: str,
+    experiment_name: str,
+    tracking_uri: str,
+    train_data: Union[TrainData, ShardedDataset],
+    test_data: TestData,
+    output_dir: Path,
+    experiment_parameters: Mapping[str, str],
+    training_parameters: TrainingParameters,
+    model_parameters: ModelParameters,
+    mlflow_s3_endpoint_url: str = None,
+    checkpoint_dir: Optional[Path] = None,
+    resume_key: Optional[str] = None,
+) -> None:
+    """Train the model on loaded data, see `train_with_tracking`.
 
-    train_model(
-        model=built_model, train_data=train_data, params=training_parameters
+    The data can be arrays in memory, e.g. preprocessed in the same process by the
+    fused data and training step, or memory-mapped from the processed data.
+    """
+    # TensorFlow and MLflow are imported here, not when importing the module
+    from .checkpoint import (
+        DEFAULT_CHECKPOINT_FOLDER,
+        RESUME_KEY_TAG,
+        CheckpointCallback,
+        config_hash,
+        EpochMetricsCallback,
+        delete_uploaded_checkpoints,
+        find_checkpoint,
+        get_checkpoint_parameters,
+        restore_checkpoint,
     )
+    from .model import evaluate_model, get_model, save_model, train_model
+    from .uploader import ArtifactUploader
 
-    evaluation_result = evaluate_model(model=built_model, test_data=test_data)
-    save_metrics(metrics=evaluation_result, prefix=PREFIX_EVAL_METRICS)
+    if isinstance(train_data, ShardedDataset):
+        labels = train_data.labels
+    else:
+        labels = train_data["y"]
 
-    save_run_id(run_id=active_run.info.run_id, output_dir=output_dir)
+    checkpointing = get_checkpoint_parameters(training_parameters)["enabled"]
+    checkpoint_dir = checkpoint_dir or DEFAULT_CHECKPOINT_FOLDER.resolve()
+    state = None
+    training_hash = config_hash(model, model_parameters, training_parameters)
+    if checkpointing:
+        if mlflow_s3_endpoint_url:
+            os.environ["MLFLOW_S3_ENDPOINT_URL"] = mlflow_s3_endpoint_url
+        state = find_checkpoint(
+            checkpoint_dir,
+            tracking_uri,
+            experiment_name,
+            resume_key=resume_key,
+            config_hash=training_hash,
+        )
 
-    # Please change the model savedir according to the ML Framework convention
-    # For instance, the save dir for Tensorflow should be: output_dir/0001
-    model_save_dir = output_dir / "0001"
-    save_model(
-        model=built_model,
-        save_dir=model_save_dir,
-        training_params=training_parameters,
-        model_params=model_parameters,
+    # Autolog cannot continue a run, the training logs itself when checkpointing
+    active_run = setup_tracking(
+        tracking_uri=tracking_uri,
+        mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+        experiment_name=experiment_name,
+        run_id=state.run_id if state else None,
+        autolog=not checkpointing,
     )
 
-    mlflow.log_artifact(
-        local_path=str(model_save_dir), artifact_path="model/data/model/"
-    )
+    # A failed training still logs what it buffered, and its run is marked failed
+    with ending_run():
+        if experiment_parameters:
+            save_parameters(params=experiment_parameters)
+
+        built_model = get_model(
+            model_name=model,
+            model_parameters=model_parameters,
+            training_parameters=training_parameters,
+        )
 
-    mlflow.end_run()
+        callbacks = []
+        client = None
+        if checkpointing:
+            from mlflow.tracking import MlflowClient
+
+            client = MlflowClient()
+            batch_logger = get_batch_logger()
+            batch_logger.log_params({**model_parameters, **training_parameters})
+            if resume_key:
+                batch_logger.set_tags({RESUME_KEY_TAG: resume_key})
+            # Logged right away, a retry of a preempted training finds the run by tag
+            batch_logger.flush()
+            if state is not None:
+                restore_checkpoint(built_model, checkpoint_dir)
+            callbacks = [
+                CheckpointCallback(
+                    checkpoint_dir,
+                    run_id=active_run.info.run_id,
+                    params=training_parameters,
+                    state=state,
+                    client=client,
+                    resume_key=resume_key,
+                    config_hash=training_hash,
+                ),
+                EpochMetricsCallback(),
+            ]
+
+        # The split is saved next to the run id so that it can be reused
+        split = make_split(labels, training_parameters)
+        save_split(split, output_dir=output_dir)
+
+        train_model(
+            model=built_model,
+            train_data=train_data,
+            params=training_parameters,
+            split=split,
+            callbacks=callbacks,
+            initial_epoch=state.epoch if state else 0,
+        )
+        # Please change the model savedir according to the ML Framework convention
+        # For instance, the save dir for Tensorflow should be: output_dir/0001
+        model_save_dir = output_dir / MODEL_VERSION_FOLDER
+        save_model(
+            model=built_model,
+            save_dir=model_save_dir,
+            training_params=training_parameters,
+            model_params=model_parameters,
+        )
+
+        # The model is uploaded in the background while it is evaluated, once in the
+        # MLflow model format to be registered and once as the versioned SavedModel to
+        # be served from `model/data/model`
+        with tempfile.TemporaryDirectory() as tmp_dir, ArtifactUploader(
+            run_id=active_run.info.run_id
+        ) as uploader:
+            mlflow_model_dir = Path(tmp_dir) / "model"
+            save_mlflow_model(built_model, mlflow_model_dir, test_data["x"][:1])
+            uploader.upload_dir(mlflow_model_dir, artifact_path="")
+            uploader.upload_dir(model_save_dir, artifact_path="model/data/model/")
+
+            evaluation_result = evaluate_model(model=built_model, test_data=test_data)
+            save_metrics(metrics=evaluation_result, prefix=PREFIX_EVAL_METRICS)
+
+            save_run_id(run_id=active_run.info.run_id, output_dir=output_dir)
+    if checkpointing:
+        # The training finished, a later training must not resume from its checkpoint
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        delete_uploaded_checkpoints(client, active_run.info.run_id)
 
 
 @click.command()
@@ -124,6 +275,27 @@ def train_with_tracking(
     In the form of comma-separated KEY=VALUE.
     E.g. --experiment-parameters one=two,otherKey=otherVal""",
 )
+@click.option(
+    "--config-overrides",
+    type=str,
+    default=None,
+    help="""Space-separated Hydra overrides of the training configuration.
+    E.g. --config-overrides 'model_config.num_layers=3 training_config.epochs=2'""",
+)
+@click.option(
+    "--checkpoint-dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Folder of the checkpoints if enabled, output/checkpoints if unset",
+)
+@click.option(
+    "--resume-key",
+    type=str,
+    default=None,
+    help="""Key of the training, e.g. the id of the pipeline run. A restarted training
+    with the same key resumes from the checkpoint uploaded to the unfinished run""",
+)
+@profile_options
 def cli(
     experiment,
     mlflow_tracking_uri,
@@ -131,25 +303,48 @@ def cli(
     input_data,
     output_dir,
     experiment_parameters,
+    config_overrides: Optional[str],
+    checkpoint_dir: Optional[str],
+    resume_key: Optional[str],
+    profile: Optional[str],
+    profile_memory: bool,
 ):
     input_dir = Path(input_data).resolve()
 
     output_dir = Path(output_dir).resolve()
     logger.info(f"Writing all output to {output_dir}")
 
-    model_name, model_parameters, training_parameters = get_training_config()
+    overrides = shlex.split(config_overrides or "")
+    model_name, model_parameters, training_parameters = get_training_config(overrides)
+    if overrides:
+        # Candidates of a sweep are told apart by their overrides
+        experiment_parameters = {
+            **(experiment_parameters or {}),
+            "config_overrides": " ".join(overrides),
+        }
 
-    train_with_tracking(
-        model=model_name,
-        experiment_name=experiment,
+    # The run has ended when the profiling stops, the profile is logged to it by id
+    with profiled(
+        "train",
+        output_dir,
+        profile,
+        memory=profile_memory,
+        run_id_dir=output_dir,
         tracking_uri=mlflow_tracking_uri,
-        mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
-        input_data=input_dir,
-        output_dir=output_dir,
-        experiment_parameters=experiment_parameters,
-        training_parameters=training_parameters,
-        model_parameters=model_parameters,
-    )
+    ):
+        train_with_tracking(
+            model=model_name,
+            experiment_name=experiment,
+            tracking_uri=mlflow_tracking_uri,
+            mlflow_s3_endpoint_url=mlflow_s3_endpoint_url,
+            input_data=input_dir,
+            output_dir=output_dir,
+            experiment_parameters=experiment_parameters,
+            training_parameters=training_parameters,
+            model_parameters=model_parameters,
+            checkpoint_dir=Path(checkpoint_dir).resolve() if checkpoint_dir else None,
+            resume_key=resume_key,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+"""Background upload of artifacts to the MLflow artifact store.
+
+The files of an artifact directory, e.g. a SavedModel, are uploaded concurrently by a
+bounded thread pool while the training step carries on, instead of one after another
+at the end of the step. Files that are already logged to the run with the same size,
+e.g. by an earlier attempt of a resumed training, are not uploaded again. The model is
+only logged by the training, `mlflow.autolog()` does not log it, so that it is uploaded
+once. Large files are uploaded first and in parts by the artifact repository: the S3
+repository uses boto3 `upload_file`, which switches to multipart uploads for large
+files.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from mlflow.tracking import MlflowClient
+
+from .logger import logger
+from .tracker import get_batch_logger
+
+UPLOAD_METRICS_PREFIX = "artifact_upload_"
+
+
+@dataclass
+class UploadStats:
+    files: int = 0
+    skipped_files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+class ArtifactUploader:
+    """Upload artifacts of a run in a thread pool.
+
+    Use it as a context manager, leaving the context waits for all uploads to
+    finish and logs the upload statistics as metrics of the run. If the context is
+    left on an error, the upload errors are only logged and the error propagates.
+
+    Args:
+        run_id: Id of the run to log the artifacts to.
+        client: MLflow client, a client of the current tracking URI if None.
+        max_workers: Maximum number of concurrent uploads.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        client: Optional[MlflowClient] = None,
+        max_workers: int = 4,
+    ):
+        self.run_id = run_id
+        self.client = client or MlflowClient()
+        self.stats = UploadStats()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="artifact-upload"
+        )
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def __enter__(self) -> "ArtifactUploader":
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.join()
+            return
+        for error in self._wait():
+            logger.error(f"Artifact upload failed: {error!r}")
+
+    def _logged_sizes(self, artifact_path: str) -> Dict[str, Optional[int]]:
+        """Sizes of the files already logged under the artifact path, by path"""
+        sizes: Dict[str, Optional[int]] = {}
+        pending = [artifact_path]
+        while pending:
+            for info in self.client.list_artifacts(self.run_id, pending.pop()):
+                if info.is_dir:
+                    pending.append(info.path)
+                else:
+                    sizes[info.path] = info.file_size
+        return sizes
+
+    def upload_dir(self, local_dir: Path, artifact_path: str) -> int:
+        """Start uploading the files of a directory, like `mlflow.log_artifact`.
+
+        The directory is logged as `<artifact_path>/<directory name>`, at the root of
+        the artifacts if the artifact path is empty.
+
+        Returns:
+            int: Number of files scheduled for upload.
+        """
+        root = "/".join(filter(None, [artifact_path.strip("/"), local_dir.name]))
+        logged = self._logged_sizes(root)
+        files = sorted(
+            (path for path in local_dir.rglob("*") if path.is_file()),
+            key=lambda path: path.stat().st_size,
+            reverse=True,
+        )
+        scheduled = 0
+        for path in files:
+            size = path.stat().st_size
+            parent = path.parent.relative_to(local_dir).as_posix()
+            destination = root if parent == "." else f"{root}/{parent}"
+            if logged.get(f"{destination}/{path.name}") == size:
+                self.stats.skipped_files += 1
+                continue
+            self._futures.append(
+                self._executor.submit(self._upload, path, destination, size)
+            )
+            scheduled += 1
+        logger.info(
+            f"Uploading {scheduled} files of {local_dir} to {root}, "
+            f"{self.stats.skipped_files} already logged"
+        )
+        return scheduled
+
+    def _upload(self, path: Path, artifact_path: str, size: int) -> None:
+        self.client.log_artifact(self.run_id, os.fspath(path), artifact_path)
+        with self._lock:
+            self.stats.files += 1
+            self.stats.bytes += size
+
+    def _wait(self) -> List[BaseException]:
+        """Wait for all uploads to finish and return the errors of the failed ones"""
+        self._executor.shutdown(wait=True)
+        self.stats.seconds = time.perf_counter() - self._start
+        errors = [f.exception() for f in self._futures if f.exception() is not None]
+        logger.info(
+            f"Uploaded {self.stats.files} files, {self.stats.bytes} bytes in "
+            f"{self.stats.seconds:.2f}s, {len(errors)} failed"
+        )
+        return errors
+
+    def join(self) -> UploadStats:
+        """Wait for all uploads to finish and log their statistics as metrics.
+
+        Raises:
+            Exception: The first error of the failed uploads, after all uploads have
+                finished.
+        """
+        errors = self._wait()
+        if errors:
+            raise errors[0]
+        get_batch_logger(self.run_id).log_metrics(
+            {
+                f"{UPLOAD_METRICS_PREFIX}{name}": value
+                for name, value in vars(self.stats).items()
+            }
+        )
+        return self.stats
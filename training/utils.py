@@ -1,80 +1,415 @@
-import gzip
+import hashlib
+import io
 import json
+import resource
+import sys
+import time
 import typing
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Tuple
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import click
 import numpy as np
 
+from .idx import read_idx
 from .logger import logger
 from .types import EvaluationResult, RawData, TestData, TrainData
 
 PARAMETERS_FILENAME = "parameters.json"
 RUN_ID_FILE_NAME = "run_id.json"
 
+DEFAULT_TRAINING_OUTPUT_FOLDER = Path("output") / "training"
+"""Default output folder of the training step, read by the later steps"""
 
-def _read_mnist_images(path: Path) -> np.ndarray:
-    logger.info(f"Reading MNIST images from {path}...")
+MODEL_VERSION_FOLDER = "0001"
+"""Folder of the saved model in the training output, versioned for serving"""
+
+PROCESSED_DATA_FORMATS = ("npz", "npy")
+"""Supported formats of the processed data. "npz" writes compressed archives, "npy"
+writes uncompressed arrays with a JSON manifest that can be memory-mapped on load.
+"""
+PROCESSED_DATA_MANIFEST = "manifest.json"
+PROCESSED_DATA_VERSION = 1
+
+
+def sha256sum(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Compute the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
     with path.open("rb") as f:
-        with gzip.open(f, "rb") as img_io:
-            b = img_io.read()
-            _, n_images, n_rows, n_columns = np.frombuffer(
-                b, count=4, dtype=">u4", offset=0
-            )
-            return np.frombuffer(b, dtype=np.uint8, offset=16).reshape(-1, 28, 28)
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of the current process in bytes"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def directory_size(path: Path) -> int:
+    """Total size of the files in a directory tree in bytes"""
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
 
 
-def _read_mnist_labels(path: Path) -> np.ndarray:
+def _read_mnist_images(path: Path, cache_dir: Optional[Path] = None) -> np.ndarray:
+    logger.info(f"Reading MNIST images from {path}...")
+    return read_idx(path, cache_dir=cache_dir)
+
+
+def _read_mnist_labels(path: Path, cache_dir: Optional[Path] = None) -> np.ndarray:
     logger.info(f"Reading MNIST labels from {path}...")
-    with gzip.open(path, "rb") as lb_io:
-        b = lb_io.read()
-        _, n_labels = np.frombuffer(b, count=2, dtype=">u4", offset=0)
-        return np.frombuffer(b, dtype=np.uint8, offset=8).reshape(-1, 1)
+    return read_idx(path, cache_dir=cache_dir).reshape(-1, 1)
 
 
-def read_mnist(
+def mnist_paths(
     dir: Path, kind=typing.Union[typing.Literal["train"], typing.Literal["test"]]
-):
-    """Read MNIST images and labels as numpy arrays from given directory."""
+) -> Tuple[Path, Path]:
+    """Paths of the MNIST images and labels files in the given directory."""
     prefix = "train" if kind == "train" else "t10k"
-
     images_path = dir.joinpath(f"{prefix}-images-idx3-ubyte.gz")
-    images = _read_mnist_images(path=images_path)
-
     labels_path = dir.joinpath(f"{prefix}-labels-idx1-ubyte.gz")
-    labels = _read_mnist_labels(path=labels_path)
+    return images_path, labels_path
+
+
+def read_mnist(
+    dir: Path,
+    kind=typing.Union[typing.Literal["train"], typing.Literal["test"]],
+    cache_dir: Optional[Path] = None,
+):
+    """Read MNIST images and labels as numpy arrays from given directory.
+
+    If a cache folder is given, the files are decompressed into it and the arrays
+    are memory-mapped.
+    """
+    images_path, labels_path = mnist_paths(dir, kind=kind)
+    images = _read_mnist_images(path=images_path, cache_dir=cache_dir)
+    labels = _read_mnist_labels(path=labels_path, cache_dir=cache_dir)
 
     return images, labels
 
 
-def load_raw_data(data_dir: Path) -> RawData:
-    """Load the original data from a folder to be processed"""
-    logger.info(f"Loading raw data from {data_dir}")
-    train_images, train_labels = read_mnist(dir=data_dir, kind="train")
-    test_images, test_labels = read_mnist(dir=data_dir, kind="test")
+def _timed_read(
+    reader: Callable[..., np.ndarray], path: Path, cache_dir: Optional[Path]
+) -> np.ndarray:
+    start = time.perf_counter()
+    array = reader(path=path, cache_dir=cache_dir)
+    logger.info(f"Read {path.name} in {time.perf_counter() - start:.3f}s")
+    return array
+
+
+def load_raw_data(
+    data_dir: Path, cache_dir: Optional[Path] = None, max_workers: int = 1
+) -> RawData:
+    """Load the original data from a folder to be processed
+
+    Args:
+        data_dir: Folder containing the gzipped IDX files.
+        cache_dir: Optional folder to decompress the files to, the data is then
+            memory-mapped from there instead of being read into memory.
+        max_workers: Number of files to read concurrently. Decompression releases
+            the GIL, so threads speed up loading on multi-core machines.
+    """
+    logger.info(f"Loading raw data from {data_dir} with {max_workers} workers")
+    train_images_path, train_labels_path = mnist_paths(data_dir, kind="train")
+    test_images_path, test_labels_path = mnist_paths(data_dir, kind="test")
+    reads = [
+        (_read_mnist_images, train_images_path),
+        (_read_mnist_labels, train_labels_path),
+        (_read_mnist_images, test_images_path),
+        (_read_mnist_labels, test_labels_path),
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_timed_read, reader, path, cache_dir) for reader, path in reads
+        ]
+        train_images, train_labels, test_images, test_labels = [
+            future.result() for future in futures
+        ]
+    logger.info(f"Loaded raw data in {time.perf_counter() - start:.3f}s")
     return train_images, train_labels, test_images, test_labels
 
 
-def save_processed_data(data, output_dir: Path) -> None:
-    """Save the processed data to be used in model training"""
-    logger.info(f"Saving processed data to {output_dir}")
+def _save_array(array: np.ndarray, path: Path) -> dict:
+    np.save(path, array)
+    return {
+        "file": path.name,
+        "shape": list(array.shape),
+        "dtype": array.dtype.str,
+        "sha256": sha256sum(path),
+    }
+
+
+def _shard_path(output_dir: Path, split: str, index: int, name: str) -> Path:
+    return output_dir / f"{split}-{index:05d}-{name}.npy"
+
+
+class NpyWriter:
+    """Write an array of known shape to a .npy file chunk by chunk.
+
+    Only the chunk being written is held in memory, and the checksum of the file is
+    computed on the fly.
+    """
+
+    def __init__(self, path: Path, shape: Sequence[int], dtype: Any):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._digest = hashlib.sha256()
+        self._file = path.open("wb")
+
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(
+            header,
+            {
+                "descr": np.lib.format.dtype_to_descr(self.dtype),
+                "fortran_order": False,
+                "shape": self.shape,
+            },
+        )
+        self._write(header.getvalue())
+
+    def _write(self, data: Any) -> None:
+        self._file.write(data)
+        self._digest.update(data)
+
+    def write(self, chunk: np.ndarray) -> None:
+        if chunk.shape[1:] != self.shape[1:] or self.rows + len(chunk) > self.shape[0]:
+            raise ValueError(
+                f"Chunk of shape {chunk.shape} does not fit into {self.path} "
+                f"of shape {self.shape} with {self.rows} rows written"
+            )
+        self._write(memoryview(np.ascontiguousarray(chunk, dtype=self.dtype)))
+        self.rows += len(chunk)
+
+    def close(self) -> dict:
+        """Close the file and return its description for the manifest"""
+        self._file.close()
+        if self.rows != self.shape[0]:
+            raise ValueError(
+                f"Expected {self.shape[0]} rows in {self.path}, got {self.rows}"
+            )
+        return {
+            "file": self.path.name,
+            "shape": list(self.shape),
+            "dtype": self.dtype.str,
+            "sha256": self._digest.hexdigest(),
+        }
+
+
+class ShardedNpyWriter:
+    """Write chunks of named arrays, e.g. images and labels, to .npy shards.
+
+    Args:
+        output_dir: Folder to write the shards to.
+        split: Name of the split, used as prefix of the shard files.
+        n_items: Total number of items that will be written.
+        shard_size: Maximum number of items per shard.
+    """
+
+    def __init__(self, output_dir: Path, split: str, n_items: int, shard_size: int):
+        self.output_dir = output_dir
+        self.split = split
+        self.remaining = n_items
+        self.shard_size = shard_size
+        self.shards: List[dict] = []
+        self._writers: Dict[str, NpyWriter] = {}
+
+    def _open_shard(self, chunk: Dict[str, np.ndarray]) -> None:
+        rows = min(self.shard_size, self.remaining)
+        index = len(self.shards)
+        self._writers = {
+            name: NpyWriter(
+                _shard_path(self.output_dir, self.split, index, name),
+                shape=(rows, *array.shape[1:]),
+                dtype=array.dtype,
+            )
+            for name, array in chunk.items()
+        }
+
+    def _close_shard(self) -> None:
+        self.shards.append({name: w.close() for name, w in self._writers.items()})
+        self._writers = {}
+
+    def write(self, chunk: Dict[str, np.ndarray]) -> None:
+        """Write a chunk of equally long arrays, splitting it across shards"""
+        length = len(next(iter(chunk.values())))
+        offset = 0
+        while offset < length:
+            if not self._writers:
+                self._open_shard(chunk)
+            writer = next(iter(self._writers.values()))
+            count = min(writer.shape[0] - writer.rows, length - offset)
+            for name, array in chunk.items():
+                self._writers[name].write(array[offset:offset + count])
+            offset += count
+            self.remaining -= count
+            if writer.rows == writer.shape[0]:
+                self._close_shard()
+
+    def close(self) -> List[dict]:
+        """Return the descriptions of the written shards"""
+        if self._writers or self.remaining:
+            raise ValueError(f"{self.remaining} items of {self.split} not written")
+        return self.shards
+
+
+def write_processed_data_manifest(
+    splits: Dict[str, List[dict]], output_dir: Path
+) -> None:
+    """Write the manifest describing the shards of each split in "npy" format"""
+    manifest = {
+        "format": "npy",
+        "version": PROCESSED_DATA_VERSION,
+        "splits": {split: {"shards": shards} for split, shards in splits.items()},
+    }
+    manifest_path = output_dir / PROCESSED_DATA_MANIFEST
+    manifest_path.write_text(json.dumps(manifest, indent=2))
+
+
+def _save_npy_dataset(splits: Dict[str, Dict[str, np.ndarray]], output_dir: Path):
+    """Save arrays as .npy files and describe them in a JSON manifest"""
+    shards = {
+        split: [
+            {
+                name: _save_array(array, _shard_path(output_dir, split, 0, name))
+                for name, array in arrays.items()
+            }
+        ]
+        for split, arrays in splits.items()
+    }
+    write_processed_data_manifest(shards, output_dir=output_dir)
+
+
+def save_processed_data(data, output_dir: Path, data_format: str = "npz") -> None:
+    """Save the processed data to be used in model training
+
+    Args:
+        data: Tuple of train images, train labels, test images and test labels.
+        output_dir: Folder to write the processed data to.
+        data_format: One of PROCESSED_DATA_FORMATS.
+    """
+    if data_format not in PROCESSED_DATA_FORMATS:
+        raise ValueError(f"Unsupported processed data format `{data_format}`")
+
+    logger.info(f"Saving processed data to {output_dir} as {data_format}")
     train_images, train_labels, test_images, test_labels = data
-    np.savez_compressed(output_dir / "train.npz", x=train_images, y=train_labels)
-    np.savez_compressed(output_dir / "test.npz", x=test_images, y=test_labels)
+    if data_format == "npy":
+        _save_npy_dataset(
+            {
+                "train": {"x": train_images, "y": train_labels},
+                "test": {"x": test_images, "y": test_labels},
+            },
+            output_dir=output_dir,
+        )
+    else:
+        np.savez_compressed(output_dir / "train.npz", x=train_images, y=train_labels)
+        np.savez_compressed(output_dir / "test.npz", x=test_images, y=test_labels)
 
 
-def load_train_test_dataset(data_dir: Path) -> Tuple[TrainData, TestData]:
-    """Load the train and test set for model training"""
-    logger.info(f"Loading train and test dataset from {data_dir}")
-    """Load the train and test set for model training"""
-    logger.info(f"Loading train and test dataset from {data_dir}")
-    train_data_fp = data_dir / "train.npz"
-    logger.info(f"Loading train data from {train_data_fp}")
-    train_data = np.load(train_data_fp)
-    test_data_fp = data_dir / "test.npz"
-    test_data = np.load(test_data_fp)
+def read_processed_data_manifest(data_dir: Path) -> Optional[dict]:
+    """Read the manifest of processed data in "npy" format, None for other formats"""
+    manifest_path = data_dir / PROCESSED_DATA_MANIFEST
+    if not manifest_path.is_file():
+        return None
+    return read_json_from_file(manifest_path)
+
+
+def _load_array(data_dir: Path, spec: dict, mmap_mode: Optional[str]) -> np.ndarray:
+    array = np.load(data_dir / spec["file"], mmap_mode=mmap_mode)
+    if list(array.shape) != spec["shape"] or array.dtype.str != spec["dtype"]:
+        raise ValueError(
+            f"Array {spec['file']} does not match the manifest: expected "
+            f"{spec['dtype']}{spec['shape']}, got {array.dtype.str}{list(array.shape)}"
+        )
+    return array
+
+
+def load_npy_shards(
+    data_dir: Path, split: str, mmap_mode: Optional[str] = "r"
+) -> List[Dict[str, np.ndarray]]:
+    """Load the shards of a split of processed data in "npy" format.
 
+    Returns:
+        List[Dict[str, np.ndarray]]: The named arrays of each shard, memory-mapped with
+            the given mode.
+    """
+    manifest = read_processed_data_manifest(data_dir)
+    if manifest is None:
+        raise ValueError(f"No processed data in npy format found in {data_dir}")
+    shards = manifest["splits"][split]["shards"]
+    return [
+        {name: _load_array(data_dir, spec, mmap_mode) for name, spec in shard.items()}
+        for shard in shards
+    ]
+
+
+def _load_npy_split(
+    data_dir: Path, split: str, mmap_mode: Optional[str]
+) -> Dict[str, np.ndarray]:
+    shards = load_npy_shards(data_dir, split, mmap_mode)
+    if len(shards) == 1:
+        return shards[0]
+    # The arrays of the shards are copied into memory, keep large splits memory-mapped
+    # with `training.streaming.load_sharded_dataset` instead
+    logger.info(f"Concatenating {len(shards)} {split} shards into memory")
+    return {name: np.concatenate([s[name] for s in shards]) for name in shards[0]}
+
+
+def _load_npz(path: Path) -> Dict[str, np.ndarray]:
+    # Decompress each array once, NpzFile decompresses again on every item access
+    with np.load(path) as npz:
+        return {name: npz[name] for name in npz.files}
+
+
+def verify_processed_data(data_dir: Path) -> None:
+    """Verify the files of processed data in "npy" format against their checksums"""
+    manifest = read_processed_data_manifest(data_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No processed data manifest found in {data_dir}")
+    for split in manifest["splits"].values():
+        for shard in split["shards"]:
+            for spec in shard.values():
+                if sha256sum(data_dir / spec["file"]) != spec["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {spec['file']}")
+
+
+def load_dataset_split(
+    data_dir: Path, split: str, mmap_mode: Optional[str] = "r"
+) -> Dict[str, np.ndarray]:
+    """Load a single split, e.g. "test", of the processed data.
+
+    The format of the processed data is detected automatically. Data in "npy" format
+    is memory-mapped with the given mode, use None to read it fully into memory. A
+    split written in several shards is concatenated into memory: the streaming input
+    pipeline memory-maps the shards of the training data with
+    `training.streaming.load_sharded_dataset` instead.
+    """
+    if read_processed_data_manifest(data_dir) is not None:
+        logger.info(f"Loading {split} data from {data_dir} with mmap mode {mmap_mode}")
+        return _load_npy_split(data_dir, split, mmap_mode)
+
+    data_fp = data_dir / f"{split}.npz"
+    logger.info(f"Loading {split} data from {data_fp}")
+    return _load_npz(data_fp)
+
+
+def load_train_test_dataset(
+    data_dir: Path, mmap_mode: Optional[str] = "r"
+) -> Tuple[TrainData, TestData]:
+    """Load the train and test set for model training
+
+    The format of the processed data is detected automatically. Data in "npy" format
+    is memory-mapped with the given mode, use None to read it fully into memory.
+    """
+    logger.info(f"Loading train and test dataset from {data_dir}")
+    train_data = load_dataset_split(data_dir, "train", mmap_mode)
+    test_data = load_dataset_split(data_dir, "test", mmap_mode)
     return train_data, test_data
 
 